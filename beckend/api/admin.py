@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Document, DocumentChunk
+from .models import Document, DocumentChunk, IngestionJob
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
@@ -21,4 +21,10 @@ class DocumentChunkAdmin(admin.ModelAdmin):
 
     def chunk_text_preview(self, obj):
         return obj.chunk_text[:100] + "..." if len(obj.chunk_text) > 100 else obj.chunk_text
-    chunk_text_preview.short_description = 'Chunk Text'
\ No newline at end of file
+    chunk_text_preview.short_description = 'Chunk Text'
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'document', 'status', 'chunks_done', 'chunks_total', 'attempts', 'created_at']
+    list_filter = ['status']
+    list_select_related = ['document']
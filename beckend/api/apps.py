@@ -1,6 +1,39 @@
+import logging
+import time
 from django.apps import AppConfig
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Getters of the objects that are built on first use (see utils.clients.lazy)
+# and that a serving worker should build before taking traffic
+WARM_UP = getattr(settings, 'WARM_UP', (
+    'api.utils.rag.get_openai_client',
+    'api.utils.rag.get_qa_chain',
+    'api.utils.rag.get_agent_chain',
+    'api.utils.embeddings.get_session',
+))
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Connect the signal handlers that keep in-process caches current
+        from .utils import agent_router, answer_cache, embedding_migration  # noqa: F401
+
+    def warm_up(self):
+        """
+        Build everything listed in ``WARM_UP`` now instead of on the first
+        request. Called by the WSGI/ASGI entry points when
+        ``settings.WARM_UP_ON_START`` is set. Returns ``{getter: seconds}``.
+        """
+        timings = {}
+        for path in WARM_UP:
+            started = time.perf_counter()
+            import_string(path)()
+            timings[path] = time.perf_counter() - started
+        logger.info(f"Warm-up finished in {sum(timings.values()):.2f}s")
+        return timings
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from ..models import EMBEDDING_DIMENSIONS
+
+
+def fake_embedding(text, dimensions=EMBEDDING_DIMENSIONS):
+    """Deterministic unit vector for ``text``: the same text always maps to the same vector."""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dimensions)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send(self, status, body, content_type='application/json'):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        service = self.server.service
+        payload = self._read_json()
+        service.requests += 1
+        time.sleep(service.latency)
+        if self.path.endswith('/api/embed'):
+            texts = payload.get('input') or []
+            texts = [texts] if isinstance(texts, str) else texts
+            self._send(200, {'model': payload.get('model'), 'embeddings': [fake_embedding(t) for t in texts]})
+        elif self.path.endswith('/chat/completions'):
+            if payload.get('stream'):
+                self._stream_completion(service)
+            else:
+                self._send(200, {
+                    'choices': [{'message': {'role': 'assistant', 'content': service.answer}}],
+                    'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+                })
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def _stream_completion(self, service):
+        events = [
+            {'choices': [{'delta': {'content': word + ' '}}]} for word in service.answer.split()
+        ] + [{'choices': [], 'usage': {'total_tokens': len(service.answer.split())}}]
+        body = ''.join(f"data: {json.dumps(event)}\n\n" for event in events) + 'data: [DONE]\n\n'
+        self._send(200, body.encode(), content_type='text/event-stream')
+
+
+class FakeService:
+    """
+    Local stand-in for Ollama's ``/api/embed`` and xAI's
+    ``/v1/chat/completions`` (plain and streamed), served from a background
+    thread. Every request sleeps ``latency`` seconds to model the network
+    and model time of the real service.
+    """
+
+    def __init__(self, latency=0.0, answer='This is a benchmark answer.'):
+        self.latency = latency
+        self.answer = answer
+        self.requests = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.service = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,146 @@
+import contextlib
+import resource
+import sys
+import time
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+from ..models import Document, DocumentChunk
+from ..utils import embeddings, llm, rag
+from ..utils.ingestion import content_hash
+from .fake_services import fake_embedding
+
+PARAGRAPH = (
+    "Benchmark paragraph {n} about retrieval systems, vector indexes and latency budgets. "
+    "It repeats enough ordinary prose to look like a real document section. "
+) * 6
+
+
+@contextlib.contextmanager
+def use_services(embed_base_url, xai_base_url):
+    """Point the Ollama and xAI clients of this process at other base URLs."""
+    client = rag.get_openai_client()
+    saved = (embeddings.OLLAMA_EMBED_URL, llm.XAI_API_URL, rag.XAI_BASE_URL, client.base_url)
+    embeddings.OLLAMA_EMBED_URL = f"{embed_base_url}/api/embed"
+    llm.XAI_API_URL = f"{xai_base_url}/chat/completions"
+    rag.XAI_BASE_URL = client.base_url = xai_base_url
+    try:
+        yield
+    finally:
+        embeddings.OLLAMA_EMBED_URL, llm.XAI_API_URL, rag.XAI_BASE_URL, client.base_url = saved
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def max_rss_mb():
+    """Peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _latencies(prefix, latencies):
+    return {
+        f"{prefix}.p50_ms": percentile(latencies, 50),
+        f"{prefix}.p95_ms": percentile(latencies, 95),
+        f"{prefix}.p99_ms": percentile(latencies, 99),
+    }
+
+
+def _post(client, url, body):
+    start = time.perf_counter()
+    response = client.post(url, body, content_type='application/json')
+    elapsed = (time.perf_counter() - start) * 1000
+    if response.status_code >= 400:
+        raise RuntimeError(f"POST {url} returned {response.status_code}: {response.content[:200]!r}")
+    return elapsed
+
+
+def bench_upload(client, documents, paragraphs):
+    """Upload synthetic markdown through DocumentUploadView (synchronous path)."""
+    url = reverse('upload')
+    chunks_before = DocumentChunk.objects.count()
+    latencies = []
+    started = time.perf_counter()
+    for index in range(documents):
+        markdown = '\n\n'.join(
+            f"## Section {n}\n\n" + PARAGRAPH.format(n=f"{index}-{n}") for n in range(paragraphs)
+        )
+        latencies.append(_post(client, url, {'markdown': markdown}))
+    elapsed = time.perf_counter() - started
+    chunks = DocumentChunk.objects.count() - chunks_before
+    return {
+        'upload.documents_per_s': documents / elapsed,
+        'upload.chunks_per_s': chunks / elapsed,
+        **_latencies('upload', latencies),
+    }
+
+
+def grow_corpus(size, batch_size=1000):
+    """Insert synthetic chunks directly until the corpus holds ``size`` chunks."""
+    missing = size - DocumentChunk.objects.count()
+    while missing > 0:
+        count = min(batch_size, missing)
+        with transaction.atomic():
+            document = Document.objects.create(markdown='')
+            texts = [PARAGRAPH.format(n=f"corpus-{document.id}-{n}") for n in range(count)]
+            DocumentChunk.objects.bulk_create([
+                DocumentChunk(
+                    document=document, chunk_text=text, embedding=fake_embedding(text),
+                    chunk_index=n, start_offset=0, end_offset=len(text), content_hash=content_hash(text),
+                )
+                for n, text in enumerate(texts)
+            ], batch_size=500)
+        missing -= count
+
+
+def bench_search(client, corpus_size, queries):
+    """SearchAPIView latency (embedding, search and synthesis) at ``corpus_size`` chunks."""
+    grow_corpus(corpus_size)
+    url = reverse('search')
+    # Distinct queries so the embedding cache does not hide the embedding call
+    latencies = [
+        _post(client, url, {'query': f"latency budget question {corpus_size}-{n}"}) for n in range(queries)
+    ]
+    return _latencies(f"search.{corpus_size}", latencies)
+
+
+def bench_rag(client, queries):
+    """rag_search end-to-end latency (retrieval plus the LangChain "stuff" step)."""
+    url = reverse('rag-search')
+    latencies = [_post(client, url, {'query': f"retrieval system question {n}"}) for n in range(queries)]
+    return _latencies('rag', latencies)
+
+
+def run(documents=20, paragraphs=8, corpus_sizes=(1000, 10000), queries=50):
+    """Run every scenario against the current database and return flat metrics."""
+    client = Client()
+    metrics = bench_upload(client, documents, paragraphs)
+    for size in sorted(corpus_sizes):
+        metrics.update(bench_search(client, size, queries))
+    metrics.update(bench_rag(client, queries))
+    metrics['memory.max_rss_mb'] = max_rss_mb()
+    return metrics
+
+
+def compare(metrics, baseline, tolerance):
+    """
+    Return a description of every metric that regressed by more than
+    ``tolerance`` (a fraction) against ``baseline``. ``*_per_s`` metrics are
+    throughputs (higher is better); everything else is lower-is-better.
+    """
+    regressions = []
+    for name, expected in sorted(baseline.items()):
+        actual = metrics.get(name)
+        if actual is None or not expected:
+            continue
+        if name.endswith('_per_s'):
+            regressed = actual < expected * (1 - tolerance)
+        else:
+            regressed = actual > expected * (1 + tolerance)
+        if regressed:
+            regressions.append(f"{name}: {actual:.2f} (baseline {expected:.2f})")
+    return regressions
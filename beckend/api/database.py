@@ -1,26 +1,180 @@
-from sqlalchemy import create_engine, MetaData
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-import os
-from dotenv import load_dotenv
+import asyncio
+import weakref
+import asyncpg
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from pgvector.asyncpg import register_vector
+from .models import ChunkEmbedding, Document, DocumentChunk
 
-load_dotenv()
+# Connections kept open per event loop for the async search and ingest path.
+# The sync ORM path reuses its connections through CONN_MAX_AGE instead.
+# A pool only pays off on a long-lived loop (ASGI): under WSGI asgiref runs
+# each async view on a new event loop and closes it afterwards, which would
+# leave a pool of open connections behind per request. With the pool
+# disabled, callers go through the ORM (see ``search.aretrieve`` and
+# ``ingestion.aingest_document``).
+DB_POOL_ENABLED = getattr(settings, 'DB_POOL_ENABLED', False)
+DB_POOL_MIN_SIZE = getattr(settings, 'DB_POOL_MIN_SIZE', 2)
+DB_POOL_MAX_SIZE = getattr(settings, 'DB_POOL_MAX_SIZE', 10)
+# Seconds an idle pooled connection is kept before it is closed
+DB_POOL_MAX_INACTIVE_LIFETIME = getattr(settings, 'DB_POOL_MAX_INACTIVE_LIFETIME', 300)
+# Seconds a single statement may run before it is cancelled
+DB_COMMAND_TIMEOUT = getattr(settings, 'DB_COMMAND_TIMEOUT', 30)
 
-DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+CHUNK_FIELDS = ('id', 'document_id', 'chunk_text', 'chunk_index', 'start_offset', 'end_offset')
+# Columns written by store_chunks; the generated columns are filled by Postgres
+INSERT_COLUMNS = ('document_id', 'chunk_text', 'embedding', 'chunk_index', 'start_offset', 'end_offset', 'content_hash')
 
-# atualiza o DATABASE_URL para usar o asyncpg
-database_url = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
-engine = create_async_engine(database_url)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# The statement text never changes, so asyncpg prepares it once per pooled
+# connection and later calls only send the bound parameters. $1 is sent in
+# pgvector's binary format (see _init_connection), not as a text literal.
+SEARCH_SQL = (
+    f"SELECT {', '.join(CHUNK_FIELDS)}, embedding <=> $1::vector AS distance "
+    f"FROM {DocumentChunk._meta.db_table} ORDER BY embedding <=> $1::vector LIMIT $2"
+)
+UPDATE_TOKEN_COUNT_SQL = f"UPDATE {Document._meta.db_table} SET token_count = $2 WHERE id = $1"
+CHUNK_IDS_SQL = f"SELECT chunk_index, id FROM {DocumentChunk._meta.db_table} WHERE document_id = $1"
+MODEL_EMBEDDING_COLUMNS = ('chunk_id', 'model', 'embedding')
 
-Base = declarative_base()
-metadata = MetaData()
+# A pooled connection can be dropped by the server (restart, idle timeout,
+# failover) without the pool noticing until it is used; reads that fail this
+# way are retried once on a fresh connection.
+CONNECTION_ERRORS = (asyncpg.PostgresConnectionError, asyncpg.InterfaceError, ConnectionError)
 
-# atualiza funçao get_db para usar sessao assincrona (AsyncSession)
-async def get_db():
-    async with AsyncSession(bind=engine) as session:
+_pools = weakref.WeakKeyDictionary()  # event loop -> task creating its pool
+
+
+def connect_kwargs(alias=DEFAULT_DB_ALIAS):
+    """
+    asyncpg connection arguments for a Django database. Read at pool creation
+    so the pool follows the test database name the test runner switches to.
+    """
+    db = connections[alias].settings_dict
+    kwargs = {
+        'host': db.get('HOST') or None,
+        'port': int(db['PORT']) if db.get('PORT') else None,
+        'user': db.get('USER') or None,
+        'password': db.get('PASSWORD') or None,
+        'database': db.get('NAME') or None,
+    }
+    return {name: value for name, value in kwargs.items() if value is not None}
+
+
+async def _init_connection(conn):
+    # Binary codecs for vector/halfvec, so embeddings travel as packed floats
+    await register_vector(conn)
+
+
+async def _create_pool():
+    return await asyncpg.create_pool(
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+        command_timeout=DB_COMMAND_TIMEOUT,
+        init=_init_connection,
+        **connect_kwargs(),
+    )
+
+
+async def get_pool():
+    """
+    The asyncpg pool of the running event loop, created on first use.
+
+    Pools cannot be shared between event loops (see ``utils.clients``); under
+    ASGI there is one loop per worker, so every request shares one pool.
+    Raises ``RuntimeError`` unless ``DB_POOL_ENABLED``.
+    """
+    if not DB_POOL_ENABLED:
+        raise RuntimeError("The asyncpg pool is disabled (DB_POOL_ENABLED): use the ORM")
+    loop = asyncio.get_running_loop()
+    task = _pools.get(loop)
+    failed = task is not None and task.done() and (task.cancelled() or task.exception() is not None)
+    if task is None or failed or (task.done() and task.result().is_closing()):
+        task = _pools[loop] = loop.create_task(_create_pool())
+    return await asyncio.shield(task)
+
+
+async def close_pool():
+    """Close the running event loop's pool, if it has one."""
+    task = _pools.pop(asyncio.get_running_loop(), None)
+    if task is not None and task.done() and not task.cancelled() and task.exception() is None:
+        await task.result().close()
+
+
+async def _run(operation, retry=True):
+    """
+    Run ``operation(conn)`` on a pooled connection. With ``retry`` it is run
+    again on a new connection if the first one turns out to be dead; writes
+    pass ``retry=False``, since a lost COMMIT may still have been applied.
+    """
+    pool = await get_pool()
+    for attempt in range(2):
         try:
-            yield session
-        finally:
-            await session.close()
\ No newline at end of file
+            async with pool.acquire() as conn:
+                return await operation(conn)
+        except CONNECTION_ERRORS:
+            if attempt or not retry:
+                raise
+            pool.expire_connections()
+
+
+async def _apply_index_settings(conn, ef_search=None, probes=None, exact=False):
+    # Same transaction-local settings as search._apply_index_settings
+    if ef_search is not None:
+        await conn.execute("SELECT set_config('hnsw.ef_search', $1, true)", str(ef_search))
+    if probes is not None:
+        await conn.execute("SELECT set_config('ivfflat.probes', $1, true)", str(probes))
+    if exact:
+        await conn.execute("SELECT set_config('enable_indexscan', 'off', true)")
+
+
+def rows_to_chunks(rows, min_similarity):
+    """
+    Turn search rows into ``DocumentChunk`` instances (the embedding left
+    deferred) carrying ``similarity``, dropping those at or below ``min_similarity``.
+    """
+    chunks = []
+    for row in rows:
+        similarity = 1 - row['distance']
+        if similarity > min_similarity:
+            chunk = DocumentChunk.from_db(DEFAULT_DB_ALIAS, CHUNK_FIELDS, [row[name] for name in CHUNK_FIELDS])
+            chunk.similarity = similarity
+            chunks.append(chunk)
+    return chunks
+
+
+async def search_chunks(query_embedding, limit, min_similarity, ef_search=None, probes=None, exact=False):
+    """Async ``search.search_chunks`` over the pool; same query shape and results."""
+    async def operation(conn):
+        if ef_search is None and probes is None and not exact:
+            return await conn.fetch(SEARCH_SQL, query_embedding, limit)
+        async with conn.transaction():
+            await _apply_index_settings(conn, ef_search, probes, exact)
+            return await conn.fetch(SEARCH_SQL, query_embedding, limit)
+
+    return rows_to_chunks(await _run(operation), min_similarity)
+
+
+async def store_chunks(document_id, rows, token_count, model_rows=()):
+    """
+    Write chunk ``rows`` (tuples in ``INSERT_COLUMNS`` order) with a binary
+    COPY and set the document's token count, in a single transaction.
+    ``model_rows`` are ``(chunk_index, model, embedding)`` vectors of the
+    non-column embedding models, copied into ``ChunkEmbedding`` once the
+    chunk ids are known.
+    """
+    async def operation(conn):
+        async with conn.transaction():
+            await conn.copy_records_to_table(
+                DocumentChunk._meta.db_table, records=rows, columns=INSERT_COLUMNS,
+            )
+            if model_rows:
+                ids = dict(await conn.fetch(CHUNK_IDS_SQL, document_id))
+                await conn.copy_records_to_table(
+                    ChunkEmbedding._meta.db_table,
+                    records=[(ids[index], model, embedding) for index, model, embedding in model_rows],
+                    columns=MODEL_EMBEDDING_COLUMNS,
+                )
+            await conn.execute(UPDATE_TOKEN_COUNT_SQL, document_id, token_count)
+
+    await _run(operation, retry=False)
@@ -0,0 +1,134 @@
+import json
+import math
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from pgvector import Vector
+from api.models import DocumentChunk
+from api.utils.search import _apply_index_settings, search_chunks
+
+# The chunk table only has an HNSW index, so the probes rows are measured on a
+# temporary copy of the vectors with an IVFFlat index built over them
+IVFFLAT_TABLE = 'ann_recall_ivfflat'
+
+
+def ivfflat_lists(rows):
+    """pgvector's suggested number of IVFFlat lists: rows / 1000, or sqrt(rows) above 1M rows."""
+    if rows > 1_000_000:
+        return int(math.sqrt(rows))
+    return max(1, rows // 1000)
+
+
+def _build_ivfflat_copy(lists=None):
+    """Copy the chunk vectors into a temporary table and index it with IVFFlat; returns the list count."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {IVFFLAT_TABLE}")
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {IVFFLAT_TABLE} AS "
+            f"SELECT id, embedding FROM {DocumentChunk._meta.db_table} WHERE embedding IS NOT NULL"
+        )
+        cursor.execute(f"SELECT count(*) FROM {IVFFLAT_TABLE}")
+        # Lists are clustered from the rows present, so build only now
+        lists = lists or ivfflat_lists(cursor.fetchone()[0])
+        cursor.execute(
+            f"CREATE INDEX ON {IVFFLAT_TABLE} USING ivfflat (embedding vector_cosine_ops) WITH (lists = {int(lists)})"
+        )
+        cursor.execute(f"ANALYZE {IVFFLAT_TABLE}")
+    return lists
+
+
+def _drop_ivfflat_copy():
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {IVFFLAT_TABLE}")
+
+
+def _timed_search(query, k, **params):
+    start = time.perf_counter()
+    chunks = search_chunks(query, limit=k, min_similarity=-1.0, **params)
+    return [chunk.id for chunk in chunks], (time.perf_counter() - start) * 1000
+
+
+def _timed_ivfflat_search(query, k, probes):
+    start = time.perf_counter()
+    with transaction.atomic(), connection.cursor() as cursor:
+        _apply_index_settings(cursor, probes=probes)
+        cursor.execute(
+            f"SELECT id FROM {IVFFLAT_TABLE} ORDER BY embedding <=> %s::vector LIMIT %s",
+            [Vector(query).to_text(), k],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    return ids, (time.perf_counter() - start) * 1000
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ANN index search results against an exact scan and report "
+        "recall@k and latency for each ef_search setting of the HNSW index. "
+        "probes settings are measured on an IVFFlat index built over a "
+        "temporary copy of the vectors (dropped afterwards), since the chunk "
+        "table has no IVFFlat index of its own."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=50, help="Number of sampled query vectors.")
+        parser.add_argument('--k', type=int, default=10, help="Neighbours compared per query.")
+        parser.add_argument('--ef-search', type=int, nargs='*', default=[20, 40, 100, 200])
+        parser.add_argument('--probes', type=int, nargs='*', default=[1, 5, 10, 20])
+        parser.add_argument('--lists', type=int,
+                            help="IVFFlat lists for the probes rows (default: rows / 1000, as pgvector suggests).")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        k = options['k']
+        # Stored chunk vectors are representative queries for this corpus
+        queries = list(
+            DocumentChunk.objects.order_by('?').values_list('embedding', flat=True)[:options['queries']]
+        )
+        if not queries:
+            raise CommandError("No chunks to sample queries from.")
+        queries = [[float(x) for x in query] for query in queries]
+
+        exact = [_timed_search(query, k, exact=True) for query in queries]
+        rows = [self._row('exact', exact, exact, k)]
+        for ef in options['ef_search']:
+            approx = [_timed_search(query, k, ef_search=ef) for query in queries]
+            rows.append(self._row(f"hnsw ef_search={ef}", approx, exact, k))
+
+        if options['probes']:
+            lists = _build_ivfflat_copy(options['lists'])
+            try:
+                for probes in options['probes']:
+                    approx = [_timed_ivfflat_search(query, k, probes) for query in queries]
+                    rows.append(self._row(f"ivfflat lists={lists} probes={probes}", approx, exact, k))
+            finally:
+                _drop_ivfflat_copy()
+
+        if options['json']:
+            self.stdout.write(json.dumps({'k': k, 'queries': len(queries), 'results': rows}, indent=2))
+            return
+
+        self.stdout.write(f"{len(queries)} queries, recall@{k}")
+        self.stdout.write(f"{'setting':<32}{'recall':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['setting']:<32}{row['recall']:>10.3f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+            )
+
+    def _row(self, label, results, exact, k):
+        recalls = []
+        for (ids, _), (exact_ids, _) in zip(results, exact):
+            if exact_ids:
+                recalls.append(len(set(ids) & set(exact_ids)) / len(exact_ids))
+        latencies = [latency for _, latency in results]
+        return {
+            'setting': label,
+            'recall': statistics.mean(recalls) if recalls else 0.0,
+            'p50_ms': _percentile(latencies, 50),
+            'p95_ms': _percentile(latencies, 95),
+        }
@@ -0,0 +1,57 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from api.utils import embedding_migration
+
+
+class Command(BaseCommand):
+    help = (
+        "Embed every existing chunk with another embedding model, alongside "
+        "the one searches currently use. New chunks get vectors for the model "
+        "as soon as this starts; existing ones are embedded in throttled "
+        "batches. Progress is stored in the database, so an interrupted "
+        "backfill is resumed by running the command again. Once complete the "
+        "model's index is built and it can be switched to with "
+        "switch_embedding_model."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help="Embedding model to backfill, e.g. mxbai-embed-large.")
+        parser.add_argument('--batch-size', type=int, default=embedding_migration.BACKFILL_BATCH_SIZE,
+                            help="Chunks embedded and written per transaction.")
+        parser.add_argument('--rate', type=float, default=embedding_migration.BACKFILL_RATE,
+                            help="Most chunks embedded per second, leaving Ollama capacity for live traffic "
+                                 "(EMBEDDING_BACKFILL_RATE; 0 for no limit).")
+        parser.add_argument('--max-in-flight', type=int, help="Concurrent Ollama requests.")
+
+    def handle(self, *args, **options):
+        try:
+            state = embedding_migration.start_backfill(options['model'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Backfilling {state.model} from chunk id {state.backfilled_through}")
+
+        started, total = time.perf_counter(), 0
+        while True:
+            batch_started = time.perf_counter()
+            try:
+                scanned, embedded = embedding_migration.backfill_batch(
+                    state, batch_size=options['batch_size'], max_in_flight=options['max_in_flight'],
+                )
+            except IntegrityError:
+                # A chunk of the batch was deleted meanwhile; the retry no longer sees it
+                state.refresh_from_db()
+                continue
+            if not scanned:
+                break
+            total += embedded
+            self.stdout.write(
+                f"Through chunk {state.backfilled_through}: {total} embedded "
+                f"({total / (time.perf_counter() - started):.0f} chunks/s)"
+            )
+            if options['rate'] and embedded:
+                time.sleep(max(0.0, embedded / options['rate'] - (time.perf_counter() - batch_started)))
+
+        self.stdout.write(f"Building the {state.model} index...")
+        embedding_migration.finish_backfill(state)
+        self.stdout.write(self.style.SUCCESS(f"{state.model} is ready: {total} chunks embedded"))
@@ -0,0 +1,60 @@
+import logging
+import multiprocessing
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from api.utils.ingestion import claim_next_job, run_job
+
+logger = logging.getLogger(__name__)
+
+
+def worker_loop(poll_interval, stale_after, once=False):
+    while True:
+        close_old_connections()
+        job = claim_next_job(stale_after=stale_after)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+
+
+class Command(BaseCommand):
+    help = "Run background workers that chunk and embed queued document uploads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help="Number of worker processes.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument(
+            '--stale-after', type=int, default=600,
+            help="Re-claim running jobs that have not reported progress for this many seconds.",
+        )
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit instead of polling forever.")
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        worker_args = (options['poll_interval'], stale_after, options['once'])
+
+        if options['processes'] <= 1:
+            worker_loop(*worker_args)
+            return
+
+        # Forked children must not share the parent's database connection
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=worker_loop, args=worker_args, name=f"ingest-worker-{i}")
+            for i in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"Started {len(workers)} ingestion workers")
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
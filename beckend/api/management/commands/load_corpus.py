@@ -0,0 +1,68 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api.utils import corpus_loader
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk load a directory or zip/tar archive of markdown files: files are "
+        "chunked in a process pool, embedded in batches and written with "
+        "binary COPY, with the chunk indexes rebuilt once at the end. Loaded "
+        "files are recorded in the database with their documents, so an "
+        "interrupted load can be re-run with the same path to resume."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Directory or .zip/.tar(.gz) archive of .md/.markdown files.")
+        parser.add_argument('--checkpoint', help="File recording the dropped indexes (defaults to <path>.checkpoint).")
+        parser.add_argument('--workers', type=int, help="Chunking processes (defaults to the CPU count).")
+        parser.add_argument('--batch-chunks', type=int, default=corpus_loader.LOAD_BATCH_CHUNKS,
+                            help="Chunks embedded and written per transaction.")
+        parser.add_argument('--embedding-batch-size', type=int, help="Texts per Ollama request.")
+        parser.add_argument('--max-in-flight', type=int, help="Concurrent Ollama requests.")
+        parser.add_argument('--use-embedding-cache', action='store_true',
+                            help="Read and fill the embedding cache, e.g. when re-loading texts embedded before. "
+                                 "Off by default: filling it inserts every vector row by row.")
+        parser.add_argument('--keep-indexes', action='store_true',
+                            help="Load with the chunk indexes in place, e.g. into a table that is being searched.")
+        parser.add_argument('--maintenance-work-mem', default='1GB',
+                            help="maintenance_work_mem used while rebuilding the indexes.")
+
+    def handle(self, *args, **options):
+        path = options['path'].rstrip('/')
+        try:
+            corpus_loader.corpus_kind(path)
+        except ValueError as e:
+            raise CommandError(str(e))
+        checkpoint = corpus_loader.Checkpoint(options['checkpoint'] or f"{path}.checkpoint")
+        resumed = len(corpus_loader.loaded_keys(corpus_loader.corpus_id(path)))
+        if resumed:
+            self.stdout.write(f"Resuming: {resumed} files already loaded")
+        if not options['keep_indexes']:
+            corpus_loader.drop_chunk_indexes(checkpoint)
+
+        started = time.perf_counter()
+
+        def progress(documents, chunks):
+            rate = chunks / (time.perf_counter() - started)
+            self.stdout.write(f"{documents} documents, {chunks} chunks ({rate:.0f} chunks/s)")
+
+        documents, chunks = corpus_loader.load_corpus(
+            path,
+            workers=options['workers'],
+            batch_chunks=options['batch_chunks'],
+            embedding_batch_size=options['embedding_batch_size'],
+            max_in_flight=options['max_in_flight'],
+            use_embedding_cache=options['use_embedding_cache'],
+            progress=progress,
+        )
+        loaded = time.perf_counter()
+
+        # Also finishes a rebuild left over by an interrupted run
+        if checkpoint.dropped_indexes is not None:
+            self.stdout.write("Rebuilding chunk indexes...")
+            corpus_loader.restore_chunk_indexes(checkpoint, options['maintenance_work_mem'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {documents} documents, {chunks} chunks in {loaded - started:.1f}s "
+            f"(indexes {time.perf_counter() - loaded:.1f}s)"
+        ))
@@ -0,0 +1,77 @@
+import json
+import platform
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from api.benchmarks import harness
+from api.benchmarks.fake_services import FakeService
+from api.utils.vector_backends import VECTOR_BACKEND
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark document upload, search and RAG end to end against local "
+        "Ollama and xAI stand-ins, in a throwaway test database. Writes the "
+        "metrics as JSON and fails if they regress against a baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=20, help="Documents uploaded in the upload scenario.")
+        parser.add_argument('--paragraphs', type=int, default=8, help="Sections per uploaded document.")
+        parser.add_argument('--corpus-sizes', type=int, nargs='+', default=[1000, 10000],
+                            help="Chunk counts at which search latency is measured.")
+        parser.add_argument('--queries', type=int, default=50, help="Requests per search/RAG scenario.")
+        parser.add_argument('--embed-latency-ms', type=float, default=5.0,
+                            help="Delay added to every fake Ollama request.")
+        parser.add_argument('--llm-latency-ms', type=float, default=50.0,
+                            help="Delay added to every fake xAI request.")
+        parser.add_argument('--output', help="Write the results JSON to this file.")
+        parser.add_argument('--baseline', help="Compare against a results JSON recorded earlier.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed regression against the baseline, as a fraction.")
+        parser.add_argument('--keepdb', action='store_true', help="Reuse the benchmark database between runs.")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)['metrics']
+
+        setup_test_environment()
+        database = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            with FakeService(latency=options['embed_latency_ms'] / 1000) as ollama, \
+                    FakeService(latency=options['llm_latency_ms'] / 1000) as xai, \
+                    harness.use_services(ollama.url, f"{xai.url}/v1"):
+                metrics = harness.run(
+                    documents=options['documents'],
+                    paragraphs=options['paragraphs'],
+                    corpus_sizes=options['corpus_sizes'],
+                    queries=options['queries'],
+                )
+        finally:
+            connection.creation.destroy_test_db(database, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        results = {
+            'meta': {
+                'python': platform.python_version(),
+                'vector_backend': VECTOR_BACKEND,
+                **{name: options[name] for name in (
+                    'documents', 'paragraphs', 'corpus_sizes', 'queries', 'embed_latency_ms', 'llm_latency_ms',
+                )},
+            },
+            'metrics': metrics,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+        for name, value in sorted(metrics.items()):
+            self.stdout.write(f"{name:<32}{value:>12.2f}")
+
+        if baseline is not None:
+            regressions = harness.compare(metrics, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError("Performance regressions:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
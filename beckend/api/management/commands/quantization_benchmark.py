@@ -0,0 +1,97 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from api.models import DocumentChunk
+from api.utils.quantization import FLOAT_INDEX, QUANTIZED_INDEXES, index_exists
+from api.utils.search import quantized_search, search_chunks
+from .ann_recall_report import _percentile
+
+INDEXES = (
+    ('float32', FLOAT_INDEX),
+    *((name, index) for name, (index, _, _) in QUANTIZED_INDEXES.items()),
+)
+
+
+def _index_bytes(name):
+    """Size of index ``name``, or ``None`` if it is not built."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_relation_size(to_regclass(%s))", [name])
+        return cursor.fetchone()[0]
+
+
+def _timed(search, *args, **kwargs):
+    start = time.perf_counter()
+    chunks = search(*args, min_similarity=-1.0, **kwargs)
+    return [chunk.id for chunk in chunks], (time.perf_counter() - start) * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the full-precision HNSW index with the halfvec and binary "
+        "quantized indexes: index size, recall@k against an exact scan after "
+        "the full-precision re-rank, and latency. Only the quantized indexes "
+        "built with quantize_embeddings enable are measured."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=50, help="Number of sampled query vectors.")
+        parser.add_argument('--k', type=int, default=10, help="Neighbours compared per query.")
+        parser.add_argument('--rerank-factor', type=int, nargs='*', default=[2, 5, 10, 20])
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        k = options['k']
+        queries = list(
+            DocumentChunk.objects.order_by('?').values_list('embedding', flat=True)[:options['queries']]
+        )
+        if not queries:
+            raise CommandError("No chunks to sample queries from.")
+        queries = [[float(x) for x in query] for query in queries]
+
+        exact = [_timed(search_chunks, query, limit=k, exact=True) for query in queries]
+        rows = [self._row('float32', None, [_timed(search_chunks, q, limit=k) for q in queries], exact)]
+        built = [name for name, (index, _, _) in QUANTIZED_INDEXES.items() if index_exists(index)]
+        if not built:
+            raise CommandError("No quantized index is built: run quantize_embeddings enable first.")
+        for quantization in built:
+            for factor in options['rerank_factor']:
+                results = [
+                    _timed(quantized_search, query, quantization=quantization, limit=k, rerank_factor=factor)
+                    for query in queries
+                ]
+                rows.append(self._row(quantization, factor, results, exact))
+
+        sizes = {label: _index_bytes(name) for label, name in INDEXES}
+        if options['json']:
+            self.stdout.write(json.dumps(
+                {'k': k, 'queries': len(queries), 'index_bytes': sizes, 'results': rows}, indent=2
+            ))
+            return
+
+        for label, size in sizes.items():
+            if size is None:
+                self.stdout.write(f"{label:<10}index {'not built':>13}")
+            else:
+                self.stdout.write(f"{label:<10}index {size / 1024 / 1024:>10.1f} MB")
+        self.stdout.write(f"{len(queries)} queries, recall@{k}")
+        self.stdout.write(f"{'storage':<10}{'rerank':>8}{'recall':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for row in rows:
+            factor = '-' if row['rerank_factor'] is None else row['rerank_factor']
+            self.stdout.write(
+                f"{row['storage']:<10}{factor:>8}{row['recall']:>10.3f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+            )
+
+    def _row(self, storage, factor, results, exact):
+        recalls = [
+            len(set(ids) & set(exact_ids)) / len(exact_ids)
+            for (ids, _), (exact_ids, _) in zip(results, exact) if exact_ids
+        ]
+        latencies = [latency for _, latency in results]
+        return {
+            'storage': storage,
+            'rerank_factor': factor,
+            'recall': sum(recalls) / len(recalls) if recalls else 0.0,
+            'p50_ms': _percentile(latencies, 50),
+            'p95_ms': _percentile(latencies, 95),
+        }
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from api.utils import quantization
+
+
+class Command(BaseCommand):
+    help = (
+        "Build (enable) or drop (disable) the optional halfvec and binary HNSW "
+        "indexes that searches passing quantization=half|binary use. They index "
+        "an expression over DocumentChunk.embedding, so no vectors are copied. "
+        "When every search uses a quantization, --drop-float-index also drops "
+        "the float32 HNSW index so the compact one is the only vector index in "
+        "memory; plain vector searches then scan the table. disable rebuilds it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=('enable', 'disable'))
+        parser.add_argument('--quantization', choices=tuple(quantization.QUANTIZED_INDEXES), action='append',
+                            help="Index to build or drop (repeatable; defaults to all).")
+        parser.add_argument('--drop-float-index', action='store_true',
+                            help=f"With enable, also drop {quantization.FLOAT_INDEX}.")
+
+    def handle(self, *args, **options):
+        names = options['quantization'] or list(quantization.QUANTIZED_INDEXES)
+        if options['action'] == 'enable':
+            for name in names:
+                self.stdout.write(f"Building the {name} index...")
+                quantization.create_quantized_index(name)
+            if options['drop_float_index']:
+                quantization.drop_float_index()
+                self.stdout.write(f"Dropped {quantization.FLOAT_INDEX}")
+        else:
+            for name in names:
+                quantization.drop_quantized_index(name)
+                self.stdout.write(f"Dropped the {name} index")
+            if not quantization.index_exists(quantization.FLOAT_INDEX):
+                self.stdout.write(f"Rebuilding {quantization.FLOAT_INDEX}...")
+                quantization.restore_float_index()
+        self.stdout.write(self.style.SUCCESS(
+            "Done; other workers notice within "
+            f"{quantization.QUANTIZED_INDEX_REFRESH_INTERVAL}s"
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.utils import embedding_migration
+
+
+class Command(BaseCommand):
+    help = (
+        "Stop writing vectors for an embedding model that searches no longer "
+        "use. Switching back to it later needs a new backfill; the column "
+        "model cannot be switched back to once retired."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help="Embedding model to retire.")
+        parser.add_argument('--purge', action='store_true', help="Also delete its stored vectors and index.")
+
+    def handle(self, *args, **options):
+        try:
+            embedding_migration.retire_model(options['model'], purge=options['purge'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Retired {options['model']}"))
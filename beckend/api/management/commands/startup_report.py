@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.utils.startup import measure_startup
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure a worker's cold start in a fresh interpreter: Django setup, "
+        "the URLconf import (which imports every view) and optionally the "
+        "warm-up, with the packages that took the longest to import. With "
+        "--budget it fails when the start takes longer, e.g. in CI."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', action='append', default=[],
+                            help="Also time importing this module (repeatable).")
+        parser.add_argument('--warm-up', action='store_true', help="Also time ApiConfig.warm_up.")
+        parser.add_argument('--top', type=int, default=15, help="Slowest packages listed.")
+        parser.add_argument('--budget', type=float, help="Seconds the measured start may take at most.")
+
+    def handle(self, *args, **options):
+        modules = [settings.ROOT_URLCONF, *options['module']]
+        try:
+            report = measure_startup(modules, warm_up=options['warm_up'])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        total = sum(seconds for _, seconds in report['phases'])
+        for name, seconds in report['phases']:
+            self.stdout.write(f"{name:<40} {seconds * 1000:8.0f} ms")
+        self.stdout.write(f"{'total':<40} {total * 1000:8.0f} ms")
+        self.stdout.write(f"\nSlowest packages to import ({len(report['modules'])} modules loaded):")
+        for package, seconds in report['packages'][:options['top']]:
+            self.stdout.write(f"  {package:<38} {seconds * 1000:8.0f} ms")
+
+        if options['budget'] is not None and total > options['budget']:
+            raise CommandError(f"Startup took {total:.2f}s, over the {options['budget']:.2f}s budget")
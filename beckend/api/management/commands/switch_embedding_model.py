@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.utils import embedding_migration
+
+
+class Command(BaseCommand):
+    help = (
+        "Make searches use another embedding model. The model must have been "
+        "backfilled; the previous one keeps receiving vectors, so switching "
+        "back is instant until it is retired."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help="Embedding model to switch to.")
+        parser.add_argument('--max-missing', type=int, default=embedding_migration.CUTOVER_MAX_MISSING,
+                            help="Most chunks without a vector that are embedded during the switch itself.")
+        parser.add_argument('--max-locked-missing', type=int,
+                            default=embedding_migration.CUTOVER_MAX_LOCKED_MISSING,
+                            help="Most of them embedded while chunk writes are paused.")
+
+    def handle(self, *args, **options):
+        try:
+            embedding_migration.activate_model(
+                options['model'], max_missing=options['max_missing'],
+                max_locked_missing=options['max_locked_missing'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Searches now use {options['model']}; other workers follow within a few seconds"
+        ))
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.utils.embedding_models import COLUMN_EMBEDDING_MODEL, get_embedding_model
+from api.utils.vector_backends import NumpyVectorBackend, snapshot_dir
+
+
+class Command(BaseCommand):
+    help = (
+        "Write every chunk embedding as a normalized float32 matrix that the "
+        "numpy vector backend memory-maps (VECTOR_SNAPSHOT_PATH)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default=getattr(settings, 'VECTOR_SNAPSHOT_PATH', None),
+            help="Snapshot directory (defaults to VECTOR_SNAPSHOT_PATH).",
+        )
+        parser.add_argument(
+            '--model', default=COLUMN_EMBEDDING_MODEL,
+            help="Embedding model whose vectors are written; other models go to a subdirectory of --path.",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path:
+            raise CommandError("Pass --path or set VECTOR_SNAPSHOT_PATH.")
+        try:
+            get_embedding_model(options['model'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        path = snapshot_dir(path, options['model'])
+        backend = NumpyVectorBackend(model=options['model'])
+        backend.load()
+        backend.save_snapshot(path)
+        size = backend.matrix.nbytes / 1024 / 1024
+        self.stdout.write(f"Wrote {len(backend.ids)} embeddings ({size:.1f} MB) to {path}")
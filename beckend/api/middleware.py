@@ -0,0 +1,53 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from .utils import metrics
+
+
+class ServerTimingMiddleware:
+    """
+    Collect the pipeline spans recorded while a request is handled, report
+    them in a ``Server-Timing`` header (``embedding;dur=12.3, search;dur=4.1,
+    ...``) and observe the total request time per route.
+
+    Streaming responses send their headers before the body is produced, so
+    they only report spans that finished before the first byte.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not metrics.METRICS_ENABLED:
+            return self.get_response(request)
+        token, start = metrics.start_request(), time.perf_counter()
+        response = self.get_response(request)
+        return self._finish(request, response, token, start)
+
+    async def __acall__(self, request):
+        if not metrics.METRICS_ENABLED:
+            return await self.get_response(request)
+        token, start = metrics.start_request(), time.perf_counter()
+        response = await self.get_response(request)
+        return self._finish(request, response, token, start)
+
+    def _finish(self, request, response, token, start):
+        elapsed = time.perf_counter() - start
+        timing = metrics.finish_request(token)
+        response['Server-Timing'] = f"{timing}, total;dur={elapsed * 1000:.1f}" if timing else \
+            f"total;dur={elapsed * 1000:.1f}"
+        match = getattr(request, 'resolver_match', None)
+        metrics.request_duration.observe(
+            elapsed,
+            route=match.url_name or match.route if match else 'unmatched',
+            method=request.method,
+            status=response.status_code,
+        )
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:44
+
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_ingestionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedEmbedding',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=255)),
+                ('embedding', pgvector.django.vector.VectorField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
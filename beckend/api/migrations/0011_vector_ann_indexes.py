@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:45
+
+import pgvector.django.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Vector indexes can take a long time to build on a populated table, so
+    # build them without blocking writes. HNSW only: with an IVFFlat index on
+    # the same column the planner would never use it (ann_recall_report
+    # builds its own IVFFlat index to measure probes).
+    atomic = False
+
+    dependencies = [
+        ('api', '0010_cachedembedding'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='agent',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='agent_embedding_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='documentchunk',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='chunk_embedding_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+    ]
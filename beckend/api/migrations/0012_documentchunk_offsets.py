@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_vector_ann_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='end_offset',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='start_offset',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
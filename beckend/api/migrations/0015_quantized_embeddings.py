@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:54
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # The halfvec and binary HNSW indexes are expression indexes over
+    # DocumentChunk.embedding that are built on demand by the
+    # quantize_embeddings command (see api.utils.quantization), so there is
+    # no schema to change here: no stored copies of the vectors, no table
+    # rewrite and no index builds at migrate time.
+
+    dependencies = [
+        ('api', '0014_documentchunk_search_vector'),
+    ]
+
+    operations = []
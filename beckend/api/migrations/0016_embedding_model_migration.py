@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:16
+
+import django.db.models.deletion
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_quantized_embeddings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingModelState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=255, unique=True)),
+                ('status', models.CharField(choices=[('backfilling', 'Backfilling'), ('ready', 'Ready'), ('active', 'Active'), ('retired', 'Retired')], default='backfilling', max_length=16)),
+                ('backfilled_through', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('activated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='documentchunk',
+            name='embedding',
+            field=pgvector.django.vector.VectorField(dimensions=768, null=True),
+        ),
+        migrations.CreateModel(
+            name='ChunkEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=255)),
+                ('embedding', pgvector.django.vector.VectorField()),
+                ('chunk', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='model_embeddings', to='api.documentchunk')),
+            ],
+            options={
+                'unique_together': {('chunk', 'model')},
+            },
+        ),
+        migrations.RunSQL(
+            'ALTER TABLE api_chunkembedding ADD CONSTRAINT api_chunkembedding_chunk_id_fk '
+            'FOREIGN KEY (chunk_id) REFERENCES api_documentchunk (id) ON DELETE CASCADE',
+            reverse_sql='ALTER TABLE api_chunkembedding DROP CONSTRAINT api_chunkembedding_chunk_id_fk',
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_embedding_model_migration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoadedCorpusFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('corpus', models.CharField(max_length=1024)),
+                ('key', models.CharField(max_length=1024)),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='corpus_file', to='api.document')),
+            ],
+            options={
+                'unique_together': {('corpus', 'key')},
+            },
+        ),
+    ]
@@ -1,5 +1,28 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
-from pgvector.django import VectorField
+from django.db.models import Func
+from django.db.models.functions import Cast
+from pgvector.django import VectorField, HalfVectorField, BitField, HnswIndex
+from .utils.embedding_models import (
+    COLUMN_EMBEDDING_MODEL, EMBEDDING_MODELS, STATUS_ACTIVE, STATUS_BACKFILLING, STATUS_READY, STATUS_RETIRED,
+)
+
+# Dimensions of DocumentChunk.embedding and Agent.embedding
+EMBEDDING_DIMENSIONS = EMBEDDING_MODELS[COLUMN_EMBEDDING_MODEL].dimensions
+
+
+def half_precision(field_name):
+    """``field_name`` cast to a 16-bit halfvec, as indexed by the optional half index."""
+    return Cast(field_name, HalfVectorField(dimensions=EMBEDDING_DIMENSIONS))
+
+
+def binary_quantized(field_name):
+    """The sign bits of ``field_name``, as indexed by the optional binary index."""
+    return Cast(
+        Func(field_name, function='binary_quantize', output_field=BitField(length=EMBEDDING_DIMENSIONS)),
+        BitField(length=EMBEDDING_DIMENSIONS),
+    )
 
 class Document(models.Model):
     markdown = models.TextField()
@@ -13,27 +36,162 @@ class Document(models.Model):
 class DocumentChunk(models.Model):
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
     chunk_text = models.TextField()
-    embedding = VectorField(dimensions=768)  # Adjust dimensions based on Ollama model
+    # COLUMN_EMBEDDING_MODEL vectors; empty for chunks written after that model was retired
+    embedding = VectorField(dimensions=EMBEDDING_DIMENSIONS, null=True)
     chunk_index = models.IntegerField()
+    # Character span of the chunk in Document.markdown
+    start_offset = models.IntegerField(null=True, blank=True)
+    end_offset = models.IntegerField(null=True, blank=True)
+    # sha256 of chunk_text, used to reuse embeddings when a document is re-indexed
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    # Full-text vector for the lexical leg of hybrid search, maintained by Postgres
+    search_vector = models.GeneratedField(
+        expression=SearchVector('chunk_text', config='english'),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     class Meta:
         ordering = ['document', 'chunk_index']
         unique_together = ['document', 'chunk_index']
+        indexes = [
+            HnswIndex(
+                name='chunk_embedding_hnsw', fields=['embedding'],
+                m=16, ef_construction=64, opclasses=['vector_cosine_ops'],
+            ),
+            GinIndex(name='chunk_search_vector_gin', fields=['search_vector']),
+            # Optional halfvec/binary indexes are managed by the
+            # quantize_embeddings command (see utils.quantization)
+        ]
 
     def __str__(self):
         return f"Chunk {self.chunk_index} of Document {self.document_id}"
 
 
+class LoadedCorpusFile(models.Model):
+    """
+    A corpus file written by the load_corpus command. It is inserted in the
+    same transaction as its document, so a resumed load skips exactly the
+    files whose batch committed.
+    """
+    # Absolute path of the corpus directory or archive, and the file's path in it
+    corpus = models.CharField(max_length=1024)
+    key = models.CharField(max_length=1024)
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, related_name='corpus_file')
+
+    class Meta:
+        unique_together = ['corpus', 'key']
+
+    def __str__(self):
+        return f"{self.key} of {self.corpus}"
+
+
+class ChunkEmbedding(models.Model):
+    """
+    A chunk's vector under an embedding model other than the column model.
+
+    Rows are written by the backfill_embeddings command and, while the model
+    is live, by ingestion. Each model gets its own partial HNSW index on
+    ``embedding`` cast to the model's dimensions (see ``embedding_migration``).
+    """
+    # Deleted by Postgres (ON DELETE CASCADE, added in migration 0016) rather
+    # than by Django, so deleting chunks stays a single bulk DELETE
+    chunk = models.ForeignKey(
+        DocumentChunk, on_delete=models.DO_NOTHING, db_constraint=False, related_name='model_embeddings',
+    )
+    model = models.CharField(max_length=255)
+    embedding = VectorField()
+
+    class Meta:
+        unique_together = ['chunk', 'model']
+
+    def __str__(self):
+        return f"{self.model} embedding of Chunk {self.chunk_id}"
+
+
+class EmbeddingModelState(models.Model):
+    """Migration state of an embedding model; see ``utils.embedding_models.resolve_states``."""
+    STATUS_BACKFILLING = STATUS_BACKFILLING
+    STATUS_READY = STATUS_READY
+    STATUS_ACTIVE = STATUS_ACTIVE
+    STATUS_RETIRED = STATUS_RETIRED
+    STATUS_CHOICES = [
+        (STATUS_BACKFILLING, 'Backfilling'),
+        (STATUS_READY, 'Ready'),
+        (STATUS_ACTIVE, 'Active'),
+        (STATUS_RETIRED, 'Retired'),
+    ]
+
+    model = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_BACKFILLING)
+    # Highest chunk id the backfill has processed, so it can resume there
+    backfilled_through = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    activated_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.model} ({self.status})"
+
+
 class Agent(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     prompt = models.TextField()
-    embedding = VectorField(dimensions=768, null=True, blank=True)
+    embedding = VectorField(dimensions=EMBEDDING_DIMENSIONS, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            HnswIndex(
+                name='agent_embedding_hnsw', fields=['embedding'],
+                m=16, ef_construction=64, opclasses=['vector_cosine_ops'],
+            ),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class IngestionJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='ingestion_jobs')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    chunks_done = models.IntegerField(default=0)
+    chunks_total = models.IntegerField(default=0)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"IngestionJob {self.id} ({self.status}) for Document {self.document_id}"
+
+
+class CachedEmbedding(models.Model):
+    # sha256 of (model name, text); see api.utils.embedding_cache.cache_key
+    key = models.CharField(max_length=64, primary_key=True)
+    model = models.CharField(max_length=255)
+    embedding = VectorField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"CachedEmbedding {self.key[:12]} ({self.model})"
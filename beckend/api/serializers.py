@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Document, DocumentChunk, Agent
+from .models import Document, DocumentChunk, Agent, IngestionJob
 
         
 class DocumentChunkSerializer(serializers.ModelSerializer):
@@ -19,3 +19,20 @@ class AgentSerializer(serializers.ModelSerializer):
         model = Agent
         fields = ['id', 'name', 'description', 'prompt', 'embedding', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
+
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = IngestionJob
+        fields = [
+            'id', 'document', 'status', 'chunks_done', 'chunks_total', 'progress',
+            'attempts', 'error', 'created_at', 'started_at', 'finished_at',
+        ]
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        if not obj.chunks_total:
+            return 1.0 if obj.status == IngestionJob.STATUS_DONE else 0.0
+        return round(obj.chunks_done / obj.chunks_total, 4)
@@ -1,6 +1,53 @@
-from rest_framework.test import APITestCase
+import contextlib
+import io
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+import zipfile
+from types import SimpleNamespace
+from unittest import mock
+
+import asyncpg
+import httpx
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from pgvector import Vector
+from rest_framework.test import APIRequestFactory, APITestCase
 from django.urls import reverse
-from .models import Agent
+from .models import Agent, Document, IngestionJob
+from .utils import ingestion
+from .utils import embeddings
+from .utils.embedding_cache import EmbeddingCache, EmbeddingLRU
+from .utils.search import (
+    validate_index_params, parse_search_params, parse_batch_queries, rrf_fuse, binary_quantize, aretrieve,
+)
+from .utils import rag
+from .utils import llm
+from .utils.chunking import iter_chunks, estimate_tokens
+from .utils.context import assemble_context, build_context
+from .utils.answer_cache import AnswerCache, answer_cache
+from .utils.bulk_upload import iter_ndjson_documents
+from .utils.vector_backends import NumpyVectorBackend, PgvectorBackend
+from .utils.quantization import quantized_indexes
+from .utils.agent_router import AgentRouter
+from .benchmarks import harness
+from .management.commands.ann_recall_report import ivfflat_lists
+from .middleware import ServerTimingMiddleware
+from . import views
+from .utils import metrics
+from .benchmarks.fake_services import FakeService, fake_embedding
+from . import database
+from .utils import corpus_loader
+from .utils import embedding_models
+from .utils.embedding_models import COLUMN_EMBEDDING_MODEL, ModelStates, resolve_states
+from .utils import clients
+from .utils.clients import lazy
+from .utils.startup import measure_startup, package_times, parse_importtime
 
 
 class AgentAPITests(APITestCase):
@@ -17,3 +64,848 @@ class AgentAPITests(APITestCase):
         agent = Agent.objects.first()
         self.assertEqual(agent.name, 'Test Agent')
 
+
+class AsyncUploadTests(APITestCase):
+    def test_async_upload_queues_job(self):
+        response = self.client.post(reverse('upload') + '?async=1', {'markdown': 'hello world'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        job = IngestionJob.objects.get(pk=response.data['job_id'])
+        self.assertEqual(job.status, IngestionJob.STATUS_QUEUED)
+
+        status_response = self.client.get(reverse('ingestion-job', args=[job.id]))
+        self.assertEqual(status_response.status_code, 200)
+        self.assertEqual(status_response.data['status'], 'queued')
+        self.assertEqual(status_response.data['chunks_total'], 0)
+
+
+class ReindexTests(APITestCase):
+    def fake_embeddings(self, texts, **kwargs):
+        self.embedded.extend(texts)
+        return [[0.1] * 768 for _ in texts]
+
+    def setUp(self):
+        self.embedded = []
+        patcher = mock.patch.object(ingestion, 'generate_embeddings', side_effect=self.fake_embeddings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_only_changed_chunks_are_embedded(self):
+        paragraphs = [f"Paragraph {i}. " + "text " * 300 for i in range(3)]
+        document = Document.objects.create(markdown="\n\n".join(paragraphs))
+        ingestion.ingest_document(document)
+        original_ids = set(document.chunks.values_list('id', flat=True))
+        self.embedded.clear()
+
+        paragraphs[1] = "Paragraph 1 was edited. " + "text " * 300
+        response = self.client.put(
+            reverse('document-detail', args=[document.id]),
+            {'markdown': "\n\n".join(paragraphs)},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['chunks_embedded'], 1)
+        self.assertEqual(response.data['chunks_removed'], 1)
+        self.assertEqual(self.embedded, [paragraphs[1].strip()])
+        self.assertEqual(len(original_ids & set(document.chunks.values_list('id', flat=True))), 2)
+        self.assertEqual(list(document.chunks.values_list('chunk_index', flat=True)), [0, 1, 2])
+
+
+class ListDocumentsTests(APITestCase):
+    def test_paginates_with_sql_counts(self):
+        for i in range(3):
+            document = Document.objects.create(markdown=f"doc {i} " + "x" * 500, token_count=i)
+            document.chunks.create(chunk_text="chunk", embedding=[0.1] * 768, chunk_index=0)
+
+        response = self.client.get(reverse('list-documents'), {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['documents']), 2)
+        self.assertIsNotNone(response.data['next'])
+        first = response.data['documents'][0]
+        self.assertEqual(first['chunk_count'], 1)
+        self.assertEqual(len(first['markdown']), 200)
+        self.assertNotIn('chunks', first)
+
+        response = self.client.get(reverse('list-documents'), {'fields': 'id,chunks'})
+        self.assertEqual(set(response.data['documents'][0]), {'id', 'chunks'})
+
+        response = self.client.get(reverse('list-documents'), {'fields': 'embedding'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_stats_and_detail_chunks(self):
+        document = Document.objects.create(markdown="doc", token_count=7)
+        for index in range(2):
+            document.chunks.create(chunk_text=f"chunk {index}", embedding=[0.1] * 768, chunk_index=index)
+
+        response = self.client.get(reverse('document-stats'))
+        self.assertEqual(response.data, {'documents': 1, 'chunks': 2, 'tokens': 7})
+
+        response = self.client.get(reverse('document-detail', args=[document.id]), {'expand': 'chunks'})
+        self.assertEqual([chunk['chunk_text'] for chunk in response.data['chunks']], ['chunk 0', 'chunk 1'])
+        self.assertNotIn('embedding', response.data['chunks'][0])
+
+
+class EmbeddingBatchTests(SimpleTestCase):
+    def setUp(self):
+        # Cross-process slots are covered by EmbeddingSchedulerTests
+        patcher = mock.patch.object(embeddings.scheduler, 'global_slots', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_generate_embeddings_preserves_order_across_batches(self):
+        def fake_batch(texts, model):
+            return [[float(text)] for text in texts]
+
+        texts = [str(i) for i in range(10)]
+        with mock.patch.object(embeddings, 'embedding_cache', EmbeddingCache(persist=False)), \
+                mock.patch.object(embeddings, '_embed_batch', side_effect=fake_batch) as batch:
+            result = embeddings.generate_embeddings(texts, batch_size=3, max_in_flight=2)
+        self.assertEqual(result, [[float(i)] for i in range(10)])
+        self.assertEqual(batch.call_count, 4)
+
+    def test_cached_texts_skip_ollama(self):
+        cache = EmbeddingCache(persist=False)
+        with mock.patch.object(embeddings, 'embedding_cache', cache), \
+                mock.patch.object(embeddings, '_embed_batch', side_effect=lambda texts, model: [[1.0] for _ in texts]) as batch:
+            embeddings.generate_embeddings(['a', 'b', 'a'])
+            embeddings.generate_embedding('b')
+        self.assertEqual(batch.call_count, 1)
+        self.assertEqual(batch.call_args[0][0], ['a', 'b'])
+        self.assertEqual(cache.stats()['memory_hits'], 1)
+
+    def test_agenerate_embeddings_uses_batch_endpoint(self):
+        def handler(request):
+            texts = json.loads(request.content)['input']
+            return httpx.Response(200, json={'embeddings': [[float(len(text))] for text in texts]})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with mock.patch.object(embeddings, 'embedding_cache', EmbeddingCache(persist=False)), \
+                mock.patch.object(embeddings, 'get_async_client', return_value=client):
+            result = async_to_sync(embeddings.agenerate_embeddings)(['a', 'bb', 'a'], batch_size=1)
+        self.assertEqual(result, [[1.0], [2.0], [1.0]])
+
+
+class EmbeddingLRUTests(SimpleTestCase):
+    def test_evicts_least_recently_used_by_size(self):
+        lru = EmbeddingLRU(max_bytes=2 * 4 * 4)  # room for two 4-dim vectors
+        lru.set('a', [1, 2, 3, 4])
+        lru.set('b', [1, 2, 3, 4])
+        lru.get('a')
+        lru.set('c', [1, 2, 3, 4])
+        self.assertIsNone(lru.get('b'))
+        self.assertIsNotNone(lru.get('a'))
+        self.assertEqual(lru.evictions, 1)
+
+
+class IndexParamTests(SimpleTestCase):
+    def test_validate_index_params(self):
+        self.assertEqual(validate_index_params('40', None), {'ef_search': 40, 'probes': None})
+        with self.assertRaises(ValueError):
+            validate_index_params(0, None)
+        with self.assertRaises(ValueError):
+            validate_index_params(None, 'many')
+
+    def test_parse_search_params(self):
+        params = parse_search_params({'mode': 'hybrid', 'weights': {'lexical': 2}})
+        self.assertEqual(params['mode'], 'hybrid')
+        self.assertEqual(params['weights'], {'lexical': 2.0})
+        self.assertFalse(parse_search_params({'exact': 'false'})['exact'])
+        self.assertTrue(parse_search_params({'exact': '1'})['exact'])
+        with self.assertRaises(ValueError):
+            parse_search_params({'exact': 'yes please'})
+        with self.assertRaises(ValueError):
+            parse_search_params({'mode': 'fuzzy'})
+        with self.assertRaises(ValueError):
+            parse_search_params({'weights': {'semantic': 1}})
+
+    def test_parse_quantization_params(self):
+        params = parse_search_params({'quantization': 'binary', 'rerank_factor': '4'})
+        self.assertEqual((params['quantization'], params['rerank_factor']), ('binary', 4))
+        self.assertNotIn('quantization', parse_search_params({}))
+        with self.assertRaises(ValueError):
+            parse_search_params({'quantization': 'int8'})
+        with self.assertRaises(ValueError):
+            parse_search_params({'quantization': 'half', 'mode': 'hybrid'})
+
+    def test_ivfflat_lists_follow_row_count(self):
+        self.assertEqual(ivfflat_lists(0), 1)
+        self.assertEqual(ivfflat_lists(250_000), 250)
+        self.assertEqual(ivfflat_lists(4_000_000), 2000)
+
+    def test_binary_quantize_keeps_sign_bits(self):
+        self.assertEqual(binary_quantize([0.5, -0.1, 0.0, 2.0]), '1001')
+
+    def test_quantization_needs_its_index(self):
+        backend = PgvectorBackend()
+        with mock.patch('api.utils.search.search_chunks', return_value=['exact']) as exact, \
+                mock.patch('api.utils.search.quantized_search', return_value=['compact']), \
+                mock.patch.object(quantized_indexes, 'get', return_value=frozenset({'half'})):
+            self.assertEqual(backend.search([0.1], limit=5, min_similarity=0.4, quantization='half'), ['compact'])
+            self.assertEqual(backend.search([0.1], limit=5, min_similarity=0.4, quantization='binary'), ['exact'])
+        self.assertNotIn('quantization', exact.call_args.kwargs)
+
+
+class RankFusionTests(SimpleTestCase):
+    def test_rrf_rewards_agreement_and_respects_weights(self):
+        a, b, c = (SimpleNamespace(id=i) for i in range(3))
+        fused = rrf_fuse({'vector': [a, b], 'lexical': [c, b]}, {'vector': 1.0, 'lexical': 1.0})
+        self.assertEqual(fused[0], b)
+
+        fused = rrf_fuse({'vector': [a], 'lexical': [c]}, {'vector': 1.0, 'lexical': 3.0})
+        self.assertEqual([chunk.id for chunk in fused], [2, 0])
+
+
+class RagPipelineTests(SimpleTestCase):
+    def setUp(self):
+        answer_cache.clear()
+        patcher = mock.patch.object(rag, 'active_model', return_value=COLUMN_EMBEDDING_MODEL)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_answer_query_retrieves_and_calls_llm_once(self):
+        chunk = SimpleNamespace(id=2, document_id=1, chunk_index=0, chunk_text='The sky is blue.')
+        completion = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='Blue.'))])
+        with mock.patch.object(rag, 'retrieve', return_value=([0.1], [chunk])) as retrieve, \
+                mock.patch.object(rag.get_openai_client().chat.completions, 'create', return_value=completion) as create:
+            answer, chunks = rag.answer_query('What colour is the sky?')
+        self.assertEqual(answer, 'Blue.')
+        self.assertEqual(chunks, [chunk])
+        retrieve.assert_called_once()
+        create.assert_called_once()
+        self.assertIn('The sky is blue.', create.call_args.kwargs['messages'][0]['content'])
+
+    def test_agent_prompt_leads_the_system_message(self):
+        chunk = SimpleNamespace(id=2, document_id=1, chunk_index=0, chunk_text='The sky is blue.')
+        completion = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='Blue.'))])
+        with mock.patch.object(rag, 'retrieve', return_value=([0.1], [chunk])), \
+                mock.patch.object(rag.get_openai_client().chat.completions, 'create', return_value=completion) as create:
+            rag.answer_query('What colour is the sky?', agent_prompt='You are a meteorologist.')
+        system = create.call_args.kwargs['messages'][0]
+        self.assertEqual(system['role'], 'system')
+        self.assertTrue(system['content'].startswith('You are a meteorologist.'))
+        self.assertIn('The sky is blue.', system['content'])
+
+
+class StreamResponseTests(SimpleTestCase):
+    def test_stream_response_yields_tokens_then_usage(self):
+        body = (
+            'data: {"choices": [{"delta": {"content": "Hel"}}]}\n\n'
+            'data: {"choices": [{"delta": {"content": "lo"}}]}\n\n'
+            'data: {"choices": [], "usage": {"total_tokens": 7}}\n\n'
+            'data: [DONE]\n\n'
+        )
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, text=body))
+        with mock.patch.object(llm, '_client', httpx.Client(transport=transport)):
+            events = list(llm.stream_response('hi', 'context'))
+        self.assertEqual(events, [
+            {'type': 'token', 'content': 'Hel'},
+            {'type': 'token', 'content': 'lo'},
+            {'type': 'usage', 'usage': {'total_tokens': 7}},
+        ])
+
+
+class ChunkingTests(SimpleTestCase):
+    DOCUMENT = (
+        "# Guide\n\nIntro paragraph.\n\n"
+        "```python\ndef f():\n\n    return 1\n```\n\n"
+        "| a | b |\n|---|---|\n| 1 | 2 |\n\n"
+        + "lorem ipsum " * 400 + "\n\n## Next\n\nThe end.\n"
+    )
+
+    def test_offsets_match_source_and_budget_is_respected(self):
+        chunks = list(iter_chunks(self.DOCUMENT, max_tokens=120, overlap_tokens=20))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertEqual(self.DOCUMENT[chunk.start:chunk.end], chunk.text)
+            self.assertLessEqual(estimate_tokens(chunk.text), 120)
+
+    def test_long_line_windows_keep_offsets(self):
+        source = ' '.join(f"word{i}" for i in range(700)) + "\nSecond line of the same paragraph.\n\nMore text.\n"
+        for max_tokens in (16, 512):
+            chunks = list(iter_chunks(source, max_tokens=max_tokens))
+            self.assertGreater(len(chunks), 1)
+            for chunk in chunks:
+                self.assertEqual(source[chunk.start:chunk.end], chunk.text)
+                self.assertNotIn('word699Second', chunk.text)
+
+    def test_code_blocks_are_not_split(self):
+        chunks = list(iter_chunks(self.DOCUMENT, max_tokens=120, overlap_tokens=20))
+        code = [chunk for chunk in chunks if '```python' in chunk.text]
+        self.assertEqual(len(code), 1)
+        self.assertIn('return 1\n```', code[0].text)
+
+    def test_accepts_line_iterables(self):
+        lines = self.DOCUMENT.splitlines(keepends=True)
+        self.assertEqual(list(iter_chunks(iter(lines))), list(iter_chunks(self.DOCUMENT)))
+
+
+class NDJSONParsingTests(SimpleTestCase):
+    def test_parses_lines_and_rejects_bad_ones(self):
+        body = b'\n'.join([
+            json.dumps({'markdown': '# One'}).encode(),
+            b'not json',
+            json.dumps({'markdown': 'x' * 100}).encode(),
+            json.dumps({'title': 'no markdown'}).encode(),
+            json.dumps({'markdown': 'last'}).encode(),
+        ])
+        items = list(iter_ndjson_documents(io.BytesIO(body), max_bytes=50))
+        self.assertEqual([index for index, _, _ in items], [0, 1, 2, 3, 4])
+        self.assertEqual(items[0][1], '# One')
+        self.assertIsNotNone(items[1][2])
+        self.assertIn('exceeds', items[2][2])
+        self.assertEqual(items[3][2], 'No markdown provided')
+        self.assertEqual(items[4][1], 'last')
+
+
+class NumpyVectorBackendTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(200, 16)).astype(np.float32)
+        self.ids = np.arange(1000, 1200)
+        self.backend = NumpyVectorBackend.from_arrays(self.ids, self.vectors)
+
+    def test_top_k_matches_brute_force(self):
+        queries = self.vectors[:3] + 0.01
+        for query, (ids, scores) in zip(queries, self.backend.top_k(queries, 5)):
+            expected = embeddings.cosine_similarity(query, self.vectors)
+            best = np.argsort(-expected)[:5]
+            self.assertEqual(list(ids), list(self.ids[best]))
+            np.testing.assert_allclose(scores, expected[best], rtol=1e-5)
+
+    def test_snapshot_is_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as path:
+            self.backend.save_snapshot(path)
+            snapshot = NumpyVectorBackend(snapshot_path=path)
+            snapshot.load()
+            self.assertIsInstance(snapshot.matrix, np.memmap)
+            [(ids, _)] = snapshot.top_k([self.vectors[7]], 1)
+            self.assertEqual(ids[0], 1007)
+
+
+class BatchSearchTests(SimpleTestCase):
+    def test_parse_batch_queries(self):
+        parsed = parse_batch_queries({
+            'queries': ['a', {'query': 'b', 'synthesize': True}], 'synthesize': False,
+        })
+        self.assertEqual(parsed, [('a', False), ('b', True)])
+        parsed = parse_batch_queries({
+            'queries': ['a', {'query': 'b', 'synthesize': 'false'}, {'query': 'c'}], 'synthesize': '1',
+        })
+        self.assertEqual(parsed, [('a', True), ('b', False), ('c', True)])
+        self.assertEqual(parse_batch_queries({'queries': ['a'], 'synthesize': 'false'}), [('a', False)])
+        for bad in ({}, {'queries': []}, {'queries': ['ok', '  ']}, {'queries': ['q'] * 1000},
+                    {'queries': ['q'], 'synthesize': 'maybe'}, {'queries': [{'query': 'q', 'synthesize': 'no thanks'}]}):
+            with self.assertRaises(ValueError):
+                parse_batch_queries(bad)
+
+    def test_generate_responses_keeps_order_and_isolates_failures(self):
+        def fake(query, context):
+            if query == 'bad':
+                raise RuntimeError('boom')
+            return query.upper()
+
+        with mock.patch.object(llm, 'generate_response_sync', side_effect=fake):
+            answers = llm.generate_responses_sync([('a', ''), ('bad', ''), ('c', '')])
+        self.assertEqual(answers[0], 'A')
+        self.assertIsInstance(answers[1], RuntimeError)
+        self.assertEqual(answers[2], 'C')
+
+
+class _FakePool:
+    """Pool whose connections fail with ``errors`` in turn, then succeed."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.expired = 0
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        if self.errors:
+            raise self.errors.pop(0)
+        yield 'conn'
+
+    def expire_connections(self):
+        self.expired += 1
+
+
+class AsyncDatabaseTests(SimpleTestCase):
+    def test_connect_kwargs_follow_django_settings(self):
+        db = {'HOST': 'db.internal', 'PORT': '6543', 'USER': 'rag', 'PASSWORD': '', 'NAME': 'test_rag_db'}
+        with mock.patch.dict(database.connections['default'].settings_dict, db):
+            kwargs = database.connect_kwargs()
+        self.assertEqual(kwargs, {'host': 'db.internal', 'port': 6543, 'user': 'rag', 'database': 'test_rag_db'})
+
+    def test_rows_become_chunks_with_deferred_embedding(self):
+        rows = [
+            {'id': 1, 'document_id': 9, 'chunk_text': 'a', 'chunk_index': 0,
+             'start_offset': 0, 'end_offset': 1, 'distance': 0.1},
+            {'id': 2, 'document_id': 9, 'chunk_text': 'b', 'chunk_index': 1,
+             'start_offset': 1, 'end_offset': 2, 'distance': 0.9},
+        ]
+        [chunk] = database.rows_to_chunks(rows, min_similarity=0.4)
+        self.assertEqual((chunk.id, chunk.document_id, chunk.chunk_index), (1, 9, 0))
+        self.assertAlmostEqual(chunk.similarity, 0.9)
+        self.assertIn('embedding', chunk.get_deferred_fields())
+
+    def test_reads_are_retried_once_on_a_lost_connection(self):
+        async def operation(conn):
+            return conn
+
+        pool = _FakePool(asyncpg.ConnectionDoesNotExistError('gone'))
+        with mock.patch.object(database, 'get_pool', mock.AsyncMock(return_value=pool)):
+            self.assertEqual(async_to_sync(database._run)(operation), 'conn')
+            self.assertEqual(pool.expired, 1)
+
+            pool.errors = [asyncpg.ConnectionDoesNotExistError('gone')]
+            with self.assertRaises(asyncpg.ConnectionDoesNotExistError):
+                async_to_sync(database._run)(operation, retry=False)
+
+    def test_searches_use_the_orm_without_the_pool(self):
+        chunk = SimpleNamespace(id=1)
+        with mock.patch.object(database, 'DB_POOL_ENABLED', False), \
+                mock.patch('api.utils.search.agenerate_embedding', mock.AsyncMock(return_value=[0.1])), \
+                mock.patch('api.utils.search.run_search', return_value=[chunk]) as run_search, \
+                mock.patch.object(database, 'search_chunks') as search_chunks:
+            _, chunks = async_to_sync(aretrieve)('query', model=COLUMN_EMBEDDING_MODEL)
+            with self.assertRaises(RuntimeError):
+                async_to_sync(database.get_pool)()
+        self.assertEqual(chunks, [chunk])
+        run_search.assert_called_once()
+        search_chunks.assert_not_called()
+
+
+class CorpusLoaderTests(SimpleTestCase):
+    def test_directory_and_zip_yield_the_same_files(self):
+        files = {'b.md': '# B', 'a/c.markdown': 'C', 'notes.txt': 'skip', 'bad.md': b'\xff\xfe'}
+        with tempfile.TemporaryDirectory() as root:
+            corpus = os.path.join(root, 'corpus')
+            archive_path = os.path.join(root, 'corpus.zip')
+            with zipfile.ZipFile(archive_path, 'w') as archive:
+                for name, content in files.items():
+                    data = content if isinstance(content, bytes) else content.encode()
+                    os.makedirs(os.path.dirname(os.path.join(corpus, name)), exist_ok=True)
+                    with open(os.path.join(corpus, name), 'wb') as f:
+                        f.write(data)
+                    archive.writestr(name, data)
+            expected = [('a/c.markdown', 'C'), ('b.md', '# B')]
+            for path in (corpus, archive_path):
+                with self.assertLogs(corpus_loader.logger, 'WARNING'):
+                    self.assertEqual(list(corpus_loader.iter_corpus(path)), expected)
+            with self.assertRaises(ValueError):
+                list(corpus_loader.iter_corpus(os.path.join(corpus, 'notes.txt')))
+
+    def test_copy_rows_use_the_binary_format(self):
+        data = corpus_loader.encode_copy_rows([(7, 'héllo', [1.0, -2.5], 0, None, 5, 'abc')]).read()
+        self.assertTrue(data.startswith(corpus_loader.COPY_HEADER))
+        self.assertTrue(data.endswith(corpus_loader.COPY_TRAILER))
+        row = io.BytesIO(data[len(corpus_loader.COPY_HEADER):-len(corpus_loader.COPY_TRAILER)])
+        self.assertEqual(struct.unpack('!h', row.read(2))[0], 7)
+        fields = []
+        for _ in range(7):
+            length = struct.unpack('!i', row.read(4))[0]
+            fields.append(None if length == -1 else row.read(length))
+        self.assertEqual(struct.unpack('!q', fields[0])[0], 7)
+        self.assertEqual(fields[1].decode('utf-8'), 'héllo')
+        self.assertEqual(Vector.from_binary(fields[2]).to_list(), [1.0, -2.5])
+        self.assertIsNone(fields[4])
+        self.assertEqual(struct.unpack('!i', fields[5])[0], 5)
+
+    def test_checkpoint_resumes_index_rebuild(self):
+        definition = 'CREATE INDEX chunk_hnsw ON public.api_documentchunk USING hnsw (embedding)'
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'load.checkpoint')
+            checkpoint = corpus_loader.Checkpoint(path)
+            checkpoint.record_dropped_indexes([definition])
+
+            resumed = corpus_loader.Checkpoint(path)
+            self.assertEqual(resumed.dropped_indexes, [definition])
+            resumed.mark_indexes_restored()
+            self.assertIsNone(corpus_loader.Checkpoint(path).dropped_indexes)
+        self.assertEqual(
+            corpus_loader.if_not_exists(definition),
+            'CREATE INDEX IF NOT EXISTS chunk_hnsw ON public.api_documentchunk USING hnsw (embedding)',
+        )
+
+    def test_load_skips_files_committed_by_earlier_loads(self):
+        written = []
+        with tempfile.TemporaryDirectory() as corpus:
+            for name in ('a.md', 'b.md'):
+                with open(os.path.join(corpus, name), 'w') as f:
+                    f.write(f"# {name}\n\nSome text.")
+            with mock.patch.object(corpus_loader, 'loaded_keys', return_value={'a.md'}) as loaded, \
+                    mock.patch.object(corpus_loader, 'live_models', return_value=['test-model']), \
+                    mock.patch.object(corpus_loader, 'generate_embeddings',
+                                      side_effect=lambda texts, **kwargs: [[0.0]] * len(texts)) as embed, \
+                    mock.patch.object(corpus_loader, '_validate_embedding'), \
+                    mock.patch.object(corpus_loader, 'write_batch',
+                                      side_effect=lambda batch, vectors, corpus: written.append(
+                                          ([key for key, _, _ in batch], corpus)) or 0):
+                self.assertEqual(corpus_loader.load_corpus(corpus + '/', workers=1), (1, 0))
+        loaded.assert_called_once_with(os.path.abspath(corpus))
+        self.assertEqual(written, [(['b.md'], os.path.abspath(corpus))])
+        # Bulk loads leave the embedding cache alone unless asked to use it
+        self.assertFalse(embed.call_args.kwargs['use_cache'])
+
+
+class AgentRouterTests(SimpleTestCase):
+    def test_routes_to_closest_agents(self):
+        router = AgentRouter()
+        router.set_agents([
+            Agent(id=1, name='math', prompt='Math tutor', embedding=[1.0, 0.0, 0.0]),
+            Agent(id=2, name='code', prompt='Code reviewer', embedding=[0.0, 1.0, 0.0]),
+            Agent(id=3, name='both', prompt='Generalist', embedding=[1.0, 1.0, 0.0]),
+        ])
+        with mock.patch.object(router, 'ensure_loaded'):
+            routed = router.route([0.9, 0.2, 0.0], k=2)
+        self.assertEqual([agent.name for agent in routed], ['math', 'both'])
+        self.assertGreater(routed[0].similarity, routed[1].similarity)
+        self.assertIsNone(routed[0].embedding)
+
+    def test_rag_search_rejects_bad_agent_ids_and_reports_embedding_failures(self):
+        request = lambda data: APIRequestFactory().post('/rag_search/', data, format='json')
+        response = views.rag_search(request({'query': 'q', 'agent_id': 'abc'}))
+        self.assertEqual(response.status_code, 400)
+
+        with mock.patch.object(views, 'generate_embedding', side_effect=RuntimeError('Ollama is down')), \
+                self.assertLogs(views.logger, 'ERROR'):
+            response = views.rag_search(request({'query': 'q', 'route_agent': True}))
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.data, {"error": "Failed to generate query embedding"})
+
+
+class BenchmarkHarnessTests(SimpleTestCase):
+    def test_compare_flags_slower_latency_and_lower_throughput(self):
+        baseline = {'search.1000.p95_ms': 100.0, 'upload.chunks_per_s': 50.0, 'rag.p50_ms': 200.0}
+        metrics = {'search.1000.p95_ms': 130.0, 'upload.chunks_per_s': 35.0, 'rag.p50_ms': 150.0}
+        regressions = harness.compare(metrics, baseline, tolerance=0.2)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('search.1000.p95_ms'))
+        self.assertTrue(regressions[1].startswith('upload.chunks_per_s'))
+
+    def test_fake_ollama_returns_deterministic_unit_vectors(self):
+        with FakeService() as ollama, harness.use_services(ollama.url, 'http://unused/v1'), \
+                mock.patch.object(embeddings, 'embedding_cache', EmbeddingCache(persist=False)), \
+                mock.patch.object(embeddings.scheduler, 'global_slots', None):
+            vectors = embeddings.generate_embeddings(['alpha', 'beta', 'alpha'])
+        self.assertEqual(vectors[0], vectors[2])
+        self.assertEqual(vectors[0], fake_embedding('alpha'))
+        self.assertAlmostEqual(float(np.linalg.norm(vectors[1])), 1.0, places=5)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = metrics.Histogram('test_seconds', "Test.", labels=('stage',), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, stage='embedding')
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{stage="embedding",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="embedding",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="embedding",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{stage="embedding"} 3', lines)
+
+    def test_middleware_reports_spans_in_server_timing(self):
+        def view(request):
+            with metrics.span('embedding'):
+                pass
+            with metrics.span('search'):
+                pass
+            return HttpResponse('ok')
+
+        response = ServerTimingMiddleware(view)(RequestFactory().get('/'))
+        stages = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['embedding', 'search', 'total'])
+        self.assertIn('rag_stage_duration_seconds_count{stage="search"}', metrics.registry.render())
+
+
+class ContextAssemblyTests(SimpleTestCase):
+    @staticmethod
+    def _hit(chunk_id, document_id, index, text, similarity, start=None, end=None):
+        return SimpleNamespace(
+            id=chunk_id, document_id=document_id, chunk_index=index, chunk_text=text,
+            similarity=similarity, start_offset=start, end_offset=end,
+        )
+
+    def test_overlapping_chunks_merge_into_the_source_text(self):
+        source = '\n\n'.join(f"Paragraph {n} " + ' '.join(f"w{n}x{i}" for i in range(40)) for n in range(12))
+        chunks = list(iter_chunks(source, max_tokens=120, overlap_tokens=40))
+        hits = [
+            self._hit(index, 1, index, chunk.text, 0.9 - index / 100, chunk.start, chunk.end)
+            for index, chunk in enumerate(chunks[:3])
+        ]
+        [passage] = assemble_context(list(reversed(hits)), max_tokens=1000)
+        self.assertEqual(passage.text, source[chunks[0].start:chunks[2].end])
+        self.assertEqual(passage.chunk_ids, (0, 1, 2))
+
+    def test_drops_near_duplicates_and_respects_the_budget(self):
+        text = ' '.join(f"word{i}" for i in range(60))
+        other = ' '.join(f"other{i}" for i in range(60))
+        hits = [
+            self._hit(1, 1, 0, text, 0.9),
+            self._hit(2, 2, 5, text + ' extra', 0.85),
+            self._hit(3, 3, 0, other, 0.6),
+            self._hit(4, 4, 0, ' '.join(f"third{i}" for i in range(60)), 0.5),
+        ]
+        passages = assemble_context(hits, max_tokens=estimate_tokens(text) + estimate_tokens(other))
+        self.assertEqual([p.chunk_ids for p in passages], [(1,), (3,)])
+        self.assertLessEqual(estimate_tokens(build_context(hits, max_tokens=50)), 50)
+
+
+class AnswerCacheTests(SimpleTestCase):
+    def test_hits_only_for_close_queries_over_the_same_chunks(self):
+        cache = AnswerCache(max_entries=10, ttl=60, max_distance=0.05)
+        cache.set('search', [1.0, 0.0, 0.0], [1, 2], 'answer')
+        self.assertEqual(cache.get('search', [1.0, 0.02, 0.0], [2, 1]), 'answer')
+        self.assertIsNone(cache.get('search', [1.0, 0.5, 0.0], [1, 2]))
+        self.assertIsNone(cache.get('search', [1.0, 0.0, 0.0], [1, 3]))
+        self.assertIsNone(cache.get('rag', [1.0, 0.0, 0.0], [1, 2]))
+
+    def test_expiry_eviction_and_chunk_invalidation(self):
+        cache = AnswerCache(max_entries=2, ttl=60, max_distance=0.05)
+        cache.set('search', [1.0, 0.0], [1], 'a')
+        cache.set('search', [0.0, 1.0], [2], 'b')
+        cache.set('search', [-1.0, 0.0], [3], 'c')
+        self.assertIsNone(cache.get('search', [1.0, 0.0], [1]))
+        self.assertEqual(cache.evictions, 1)
+
+        cache.invalidate_chunks([2])
+        self.assertIsNone(cache.get('search', [0.0, 1.0], [2]))
+
+        with mock.patch('api.utils.answer_cache.time.monotonic', return_value=time.monotonic() + 120):
+            self.assertIsNone(cache.get('search', [-1.0, 0.0], [3]))
+        self.assertEqual(len(cache), 0)
+
+    def test_entries_of_different_models_are_kept_apart(self):
+        cache = AnswerCache(max_entries=10, ttl=60, max_distance=0.05)
+        cache.set('search@old', [1.0, 0.0, 0.0], [1], 'old')
+        cache.set('search@new', [1.0, 0.0, 0.0, 0.0], [1], 'new')
+        self.assertEqual(cache.get('search@new', [1.0, 0.0, 0.0, 0.0], [1]), 'new')
+        self.assertEqual(cache.get('search@old', [1.0, 0.0, 0.0], [1]), 'old')
+        self.assertIsNone(cache.get('search@new', [1.0, 0.0, 0.0], [1]))
+
+
+class EmbeddingModelTests(SimpleTestCase):
+    def test_resolve_states(self):
+        self.assertEqual(resolve_states({}), (COLUMN_EMBEDDING_MODEL, (COLUMN_EMBEDDING_MODEL,)))
+        active, live = resolve_states({'mxbai-embed-large': 'backfilling', 'all-minilm': 'retired'})
+        self.assertEqual(active, COLUMN_EMBEDDING_MODEL)
+        self.assertEqual(live, (COLUMN_EMBEDDING_MODEL, 'mxbai-embed-large'))
+        active, live = resolve_states({COLUMN_EMBEDDING_MODEL: 'ready', 'mxbai-embed-large': 'active'})
+        self.assertEqual(live, ('mxbai-embed-large', COLUMN_EMBEDDING_MODEL))
+        active, live = resolve_states({COLUMN_EMBEDDING_MODEL: 'retired', 'mxbai-embed-large': 'active'})
+        self.assertEqual(live, ('mxbai-embed-large',))
+
+    def test_switch_listeners_run_when_the_active_model_changes(self):
+        statuses = [[], [('mxbai-embed-large', 'backfilling')], [('mxbai-embed-large', 'active')]]
+        states, switched = ModelStates(refresh_interval=0), []
+        states.on_switch(switched.append)
+        with mock.patch('api.models.EmbeddingModelState.objects') as objects:
+            objects.values_list.side_effect = statuses
+            for _ in statuses:
+                states.get()
+        self.assertEqual(switched, ['mxbai-embed-large'])
+
+    def test_live_models_are_embedded_and_validated(self):
+        dimensions = {name: model.dimensions for name, model in embedding_models.EMBEDDING_MODELS.items()}
+
+        def fake(texts, model):
+            return [[0.1] * dimensions[model] for _ in texts]
+
+        with mock.patch.object(ingestion, 'generate_embeddings', side_effect=fake):
+            vectors = ingestion.embed_live_models(['a', 'b'], models=(COLUMN_EMBEDDING_MODEL, 'all-minilm'))
+            chunk = ingestion._new_chunk(vectors, 1, chunk_text='b', chunk_index=1)
+            self.assertEqual(len(chunk.embedding), dimensions[COLUMN_EMBEDDING_MODEL])
+            self.assertEqual(list(chunk.unsaved_model_embeddings), ['all-minilm'])
+
+            chunk = ingestion._new_chunk({'all-minilm': vectors['all-minilm']}, 0, chunk_text='a', chunk_index=0)
+            self.assertIsNone(chunk.embedding)
+
+            with mock.patch.dict(dimensions, {'all-minilm': 768}), self.assertLogs(ingestion.logger, 'ERROR'):
+                with self.assertRaises(ValueError):
+                    ingestion.embed_live_models(['a'], models=('all-minilm',))
+
+
+class EmbeddingSchedulerTests(SimpleTestCase):
+    def start(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return thread
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.005)
+
+    def test_interactive_calls_go_first_and_keep_a_reserved_slot(self):
+        scheduler = embeddings.EmbeddingScheduler(max_concurrency=2, interactive_reserve=1)
+        started = []
+
+        def call(lane, name):
+            scheduler.acquire(lane)
+            started.append(name)
+
+        scheduler.acquire(embeddings.LANE_BULK)
+        self.start(call, embeddings.LANE_BULK, 'bulk')
+        self.wait_for(lambda: len(scheduler._queue) == 1)
+        self.assertEqual(started, [])  # the second slot is reserved
+        self.start(call, embeddings.LANE_INTERACTIVE, 'query-1')
+        self.wait_for(lambda: started == ['query-1'])
+        self.start(call, embeddings.LANE_INTERACTIVE, 'query-2')
+        self.wait_for(lambda: len(scheduler._queue) == 2)
+
+        scheduler.release()
+        self.wait_for(lambda: len(started) == 2)
+        scheduler.release()
+        self.assertEqual(started, ['query-1', 'query-2'])  # bulk is still capped at one slot
+        scheduler.release()
+        self.wait_for(lambda: len(started) == 3)
+        self.assertEqual(started, ['query-1', 'query-2', 'bulk'])
+
+    def test_identical_requests_in_flight_are_coalesced(self):
+        scheduler = embeddings.EmbeddingScheduler(max_concurrency=2)
+        release, calls, results, leaders = threading.Event(), [], [], []
+        join = scheduler._join
+
+        def recording_join(*args):
+            key, future, leader = join(*args)
+            leaders.append(leader)
+            return key, future, leader
+
+        scheduler._join = recording_join
+
+        def call():
+            calls.append(1)
+            release.wait(5)
+            return [[1.0]]
+
+        def run():
+            results.append(scheduler.run(embeddings.LANE_INTERACTIVE, 'm', ['q'], call))
+
+        self.start(run)
+        self.wait_for(lambda: calls)
+        self.start(run)
+        self.wait_for(lambda: leaders == [True, False])
+        release.set()
+        self.wait_for(lambda: len(results) == 2)
+        self.assertEqual((len(calls), results), (1, [[[1.0]], [[1.0]]]))
+        self.assertEqual(scheduler._in_flight, {})
+
+    def test_overloaded_calls_are_retried_after_a_pause(self):
+        scheduler = embeddings.EmbeddingScheduler(max_retries=2, backoff_base=0.01)
+        outcomes = [embeddings.OllamaOverloaded('busy'), embeddings.OllamaOverloaded('busy', retry_after=0), [[1.0]]]
+
+        def call():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        with self.assertLogs(embeddings.logger, 'WARNING'):
+            self.assertEqual(scheduler.run(embeddings.LANE_BULK, 'm', ['a'], call), [[1.0]])
+        self.assertEqual(scheduler.active, 0)
+
+        outcomes[:] = [embeddings.OllamaOverloaded('busy', retry_after=0)] * 3
+        with self.assertLogs(embeddings.logger, 'WARNING'), self.assertRaises(embeddings.OllamaOverloaded):
+            scheduler.run(embeddings.LANE_BULK, 'm', ['a'], call)
+        self.assertEqual(scheduler.active, 0)
+
+
+    def test_bulk_calls_of_all_processes_share_the_global_slots(self):
+        locks = {}  # advisory lock -> connection holding it, as in Postgres
+
+        class Cursor:
+            def __init__(self, conn):
+                self.conn = conn
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql, params):
+                key = tuple(params)
+                if 'unlock' in sql:
+                    self.result = locks.pop(key, None) is self.conn
+                else:
+                    self.result = locks.setdefault(key, self.conn) is self.conn
+
+            def fetchone(self):
+                return (self.result,)
+
+        class Connection:
+            def cursor(self):
+                return Cursor(self)
+
+        web = embeddings.AdvisorySlots(1, poll_interval=0.005, connect=Connection)
+        worker = embeddings.EmbeddingScheduler(
+            global_slots=embeddings.AdvisorySlots(1, poll_interval=0.005, connect=Connection),
+        )
+        slot = web.try_acquire()
+        self.assertEqual(slot, 0)
+        self.assertIsNone(web.try_acquire())
+
+        results = []
+        self.start(lambda: results.append(worker.run(embeddings.LANE_BULK, 'm', ['a'], lambda: [[1.0]])))
+        time.sleep(0.05)
+        self.assertEqual(results, [])  # the other process holds the only slot
+        self.assertEqual(worker.run(embeddings.LANE_INTERACTIVE, 'm', ['q'], lambda: [[2.0]]), [[2.0]])
+        web.release(slot)
+        self.wait_for(lambda: results == [[[1.0]]])
+        self.assertEqual(locks, {})
+
+    def test_unreachable_database_leaves_bulk_calls_limited_per_process(self):
+        slots = embeddings.AdvisorySlots(1, connect=mock.Mock(side_effect=OSError('refused')))
+        with self.assertLogs(embeddings.logger, 'WARNING'):
+            self.assertEqual(slots.try_acquire(), slots.UNLIMITED)
+        self.assertEqual(slots.try_acquire(), slots.UNLIMITED)  # not retried yet
+        slots.release(slots.UNLIMITED)
+
+
+class StartupTests(SimpleTestCase):
+    def test_lazy_builds_once(self):
+        built = []
+        get = lazy(lambda: built.append(1) or object())
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIs(get(), get())
+        self.assertEqual(built, [1])
+
+    def test_loop_local_objects_close_with_their_loop(self):
+        closed = []
+
+        class Client:
+            is_closed = False
+
+            async def aclose(self):
+                closed.append(self)
+
+        async def use():
+            client = clients.loop_local('test', Client)
+            self.assertIs(clients.loop_local('test', Client), client)
+            return client
+
+        used = [async_to_sync(use)() for _ in range(5)]
+        self.assertEqual(closed, used)
+        self.assertFalse(any(loop_objects for loop_objects, _ in clients._loop_objects.values()
+                             if 'test' in loop_objects))
+
+    def test_parse_importtime(self):
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |     numpy.core\n"
+            "import time:       300 |        420 |   numpy\n"
+            "import time:        50 |        50 | api.utils.rag\n"
+        )
+        records = parse_importtime(output)
+        self.assertEqual(records[1], ('numpy', 300, 420, 1))
+        self.assertEqual(package_times(records), [('numpy', 420e-6), ('api', 50e-6)])
+
+    def test_views_import_without_the_llm_stack(self):
+        report = measure_startup(['api.urls'])
+        self.assertEqual([name for name, _ in report['phases']], ['django.setup', 'api.urls'])
+        for heavy in ('langchain', 'langchain_core', 'openai'):
+            self.assertNotIn(heavy, report['modules'])
@@ -1,10 +1,25 @@
 from django.urls import path
-from .views import rag_search, ListDocumentsAPIView, SearchAPIView, DocumentUploadView, AgentListCreateView
+from .views import (
+    rag_search, ListDocumentsAPIView, SearchAPIView, DocumentUploadView, BulkDocumentUploadView,
+    DocumentDetailView, AgentListCreateView, IngestionJobStatusView, EmbeddingCacheStatsView, SearchStreamView,
+    AsyncDocumentUploadView, AsyncSearchView, AsyncRagSearchView, BatchSearchView, AgentRouteView, DocumentStatsView,
+)
 
 urlpatterns = [
     path('upload/', DocumentUploadView.as_view(), name='upload'),
+    path('upload/async/', AsyncDocumentUploadView.as_view(), name='upload-async'),
+    path('upload/bulk/', BulkDocumentUploadView.as_view(), name='upload-bulk'),
+    path('<int:pk>/', DocumentDetailView.as_view(), name='document-detail'),
+    path('jobs/<int:pk>/', IngestionJobStatusView.as_view(), name='ingestion-job'),
     path('list-documents/', ListDocumentsAPIView.as_view(), name='list-documents'),
+    path('document-stats/', DocumentStatsView.as_view(), name='document-stats'),
     path('search/', SearchAPIView.as_view(), name='search'),
+    path('search/batch/', BatchSearchView.as_view(), name='search-batch'),
+    path('search/stream/', SearchStreamView.as_view(), name='search-stream'),
+    path('search/async/', AsyncSearchView.as_view(), name='search-async'),
     path('rag_search/', rag_search, name='rag-search'),  # Added for rag_search view
+    path('rag_search/async/', AsyncRagSearchView.as_view(), name='rag-search-async'),
     path('agents/', AgentListCreateView.as_view(), name='agents'),
+    path('agents/route/', AgentRouteView.as_view(), name='agent-route'),
+    path('embedding-cache/', EmbeddingCacheStatsView.as_view(), name='embedding-cache'),
 ]
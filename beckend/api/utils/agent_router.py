@@ -0,0 +1,102 @@
+import copy
+import logging
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from ..models import Agent
+from .vector_backends import normalize, top_k
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for agents changed by other worker processes.
+# Changes made in this process are picked up immediately through signals.
+AGENT_ROUTER_REFRESH_INTERVAL = getattr(settings, 'AGENT_ROUTER_REFRESH_INTERVAL', 30)
+MAX_ROUTE_K = 20
+
+
+class AgentRouter:
+    """
+    Route queries to agents by cosine similarity of the query embedding to
+    each agent's stored prompt embedding.
+
+    Agents are few, so every worker keeps them as a small normalized matrix
+    in memory and routing is one matrix-vector product, with no database
+    access on the request path. The matrix is rebuilt after an ``Agent`` is
+    saved or deleted in this process, and when the agent count or latest
+    ``updated_at`` in the database changes (checked every
+    ``AGENT_ROUTER_REFRESH_INTERVAL`` seconds).
+    """
+
+    def __init__(self, refresh_interval=AGENT_ROUTER_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        # (ids, matrix, agents by id), replaced as a whole so a concurrent
+        # reload never mixes two generations
+        self._state = (np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32), {})
+        self._version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._version = None
+        self._checked_at = None
+
+    def _current_version(self):
+        stats = Agent.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+        return stats['count'], stats['updated']
+
+    def load(self):
+        version = self._current_version()
+        self.set_agents(
+            Agent.objects.filter(embedding__isnull=False).only('id', 'name', 'description', 'prompt', 'embedding')
+        )
+        self._version = version
+
+    def set_agents(self, agents):
+        agents = list(agents)
+        ids = np.array([agent.id for agent in agents], dtype=np.int64)
+        matrix = normalize([agent.embedding for agent in agents]) if agents else np.empty((0, 0), dtype=np.float32)
+        for agent in agents:
+            agent.embedding = None  # the matrix holds the vectors
+        self._state = (ids, matrix, {agent.id: agent for agent in agents})
+        logger.info(f"Agent router loaded {len(agents)} agents")
+
+    def ensure_loaded(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.refresh_interval:
+                return
+            if self._version is None or self._current_version() != self._version:
+                self.load()
+            self._checked_at = time.monotonic()
+
+    def route(self, query_embedding, k=1):
+        """
+        Return up to ``k`` agents, best first, each with a ``similarity``
+        attribute.
+        """
+        self.ensure_loaded()
+        ids, matrix, agents = self._state
+        if not agents:
+            return []
+        [(ids, scores)] = top_k(ids, matrix, [query_embedding], k)
+        routed = []
+        for agent_id, score in zip(ids, scores):
+            agent = copy.copy(agents[int(agent_id)])
+            agent.similarity = float(score)
+            routed.append(agent)
+        return routed
+
+
+agent_router = AgentRouter()
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+def _invalidate_agent_router(sender, **kwargs):
+    agent_router.invalidate()
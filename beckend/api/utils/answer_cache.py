@@ -0,0 +1,204 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from ..models import DocumentChunk
+from .embedding_models import model_states
+from .metrics import Counter, Gauge, registry
+from .vector_backends import normalize
+
+ANSWER_CACHE_ENABLED = getattr(settings, 'ANSWER_CACHE_ENABLED', True)
+ANSWER_CACHE_MAX_ENTRIES = getattr(settings, 'ANSWER_CACHE_MAX_ENTRIES', 1000)
+ANSWER_CACHE_TTL = getattr(settings, 'ANSWER_CACHE_TTL', 600)
+# Cosine distance between two query embeddings that still counts as the same question
+ANSWER_CACHE_MAX_DISTANCE = getattr(settings, 'ANSWER_CACHE_MAX_DISTANCE', 0.05)
+
+
+def prompt_namespace(kind, prompt=None, model=None):
+    """
+    Cache namespace: answers are only shared between identical prompt setups
+    and queries embedded with the same ``model``.
+    """
+    namespace = f"{kind}@{model}" if model else kind
+    if not prompt:
+        return namespace
+    return f"{namespace}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]}"
+
+
+class AnswerCache:
+    """
+    Semantic cache of synthesized answers.
+
+    An entry is reused when a new query's embedding is within ``max_distance``
+    (cosine) of the cached query's, under the same namespace, and the search
+    returned exactly the same chunk ids. Chunk text never changes in place (an
+    edit is a new row), so an unchanged id set means unchanged context, even
+    when chunks were rewritten by another worker. Entries expire after ``ttl``
+    seconds, the least recently used are evicted beyond ``max_entries``, and
+    saving a ``DocumentChunk`` or deleting it through the ingestion code drops
+    every entry it contributed to. (Deletes are invalidated explicitly rather
+    than through ``post_delete``, which would make Django load every chunk
+    row, embeddings included, before deleting it.)
+
+    Cached query embeddings are kept as one normalized matrix per dimension
+    count, so a lookup is a single matrix-vector product. An answer stored
+    after a model switch (its LLM call was already running) may have a query
+    embedding of the old model: it sits in its own namespace, and in its own
+    matrix when the dimensions differ.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl=ANSWER_CACHE_TTL,
+                 max_distance=ANSWER_CACHE_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # key -> (namespace, chunk_ids, answer, expires_at)
+        self._vectors = {}  # key -> normalized query embedding
+        self._by_chunk = {}  # chunk id -> keys of entries built from it
+        self._matrices = {}  # dimensions -> (keys, matrix), rebuilt lazily after changes
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        namespace, chunk_ids, _, _ = self._entries.pop(key)
+        self._matrices.pop(len(self._vectors.pop(key)), None)
+        for chunk_id in chunk_ids:
+            keys = self._by_chunk.get(chunk_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_chunk[chunk_id]
+
+    def _search_matrix(self, dimensions):
+        if dimensions not in self._matrices:
+            keys = [key for key, vector in self._vectors.items() if len(vector) == dimensions]
+            matrix = np.vstack([self._vectors[key] for key in keys]) if keys else None
+            self._matrices[dimensions] = (keys, matrix)
+        return self._matrices[dimensions]
+
+    def get(self, namespace, query_embedding, chunk_ids):
+        chunk_ids = frozenset(chunk_ids)
+        query = normalize(query_embedding)
+        now = time.monotonic()
+        with self._lock:
+            keys, matrix = self._search_matrix(len(query))
+            if matrix is not None:
+                similarities = matrix @ query
+                for position in np.argsort(-similarities):
+                    if 1 - similarities[position] > self.max_distance:
+                        break
+                    key = keys[position]
+                    entry_namespace, entry_chunks, answer, expires_at = self._entries[key]
+                    if expires_at <= now:
+                        self._remove(key)
+                        continue
+                    if entry_namespace == namespace and entry_chunks == chunk_ids:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return answer
+            self.misses += 1
+            return None
+
+    def set(self, namespace, query_embedding, chunk_ids, answer):
+        chunk_ids = frozenset(chunk_ids)
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = (namespace, chunk_ids, answer, time.monotonic() + self.ttl)
+            self._vectors[key] = normalize(query_embedding)
+            for chunk_id in chunk_ids:
+                self._by_chunk.setdefault(chunk_id, set()).add(key)
+            self._matrices.pop(len(self._vectors[key]), None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_chunks(self, chunk_ids):
+        with self._lock:
+            for chunk_id in chunk_ids:
+                for key in list(self._by_chunk.get(chunk_id, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+answer_cache = AnswerCache()
+
+
+def cached_answer(namespace, query_embedding, chunks, generate):
+    """
+    Return ``(answer, cached)``: the cached answer for this query and chunk
+    set, or ``generate()``'s result, which is then cached.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return generate(), False
+    chunk_ids = [chunk.id for chunk in chunks]
+    answer = answer_cache.get(namespace, query_embedding, chunk_ids)
+    if answer is not None:
+        return answer, True
+    answer = generate()
+    answer_cache.set(namespace, query_embedding, chunk_ids, answer)
+    return answer, False
+
+
+async def acached_answer(namespace, query_embedding, chunks, generate):
+    """``cached_answer`` for a coroutine function ``generate``."""
+    if not ANSWER_CACHE_ENABLED:
+        return await generate(), False
+    chunk_ids = [chunk.id for chunk in chunks]
+    answer = answer_cache.get(namespace, query_embedding, chunk_ids)
+    if answer is not None:
+        return answer, True
+    answer = await generate()
+    answer_cache.set(namespace, query_embedding, chunk_ids, answer)
+    return answer, False
+
+
+@receiver(post_save, sender=DocumentChunk)
+def _invalidate_answers(sender, instance, **kwargs):
+    answer_cache.invalidate_chunks([instance.pk])
+
+
+# Answers to the old model's queries can no longer be hit (see
+# prompt_namespace), so free them
+model_states.on_switch(lambda model: answer_cache.clear())
+
+
+def _answer_cache_metrics():
+    stats = answer_cache.stats()
+    lookups = Counter('rag_answer_cache_lookups_total', "Semantic answer cache lookups by result.", labels=('result',))
+    lookups.set(stats['hits'], result='hit')
+    lookups.set(stats['misses'], result='miss')
+    removed = Counter('rag_answer_cache_removals_total', "Answers removed from the cache.", labels=('reason',))
+    removed.set(stats['evictions'], reason='evicted')
+    removed.set(stats['invalidations'], reason='invalidated')
+    entries = Gauge('rag_answer_cache_entries', "Answers held in the semantic cache.")
+    entries.set(stats['entries'])
+    return [lookups, removed, entries]
+
+
+registry.add_collector(_answer_cache_metrics)
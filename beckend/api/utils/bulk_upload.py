@@ -0,0 +1,117 @@
+import json
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connections
+from ..models import Document
+from .ingestion import prepare_chunks, store_chunks
+
+logger = logging.getLogger(__name__)
+
+# Largest single document accepted by the bulk endpoint, and the number of
+# documents being chunked/embedded concurrently. Together they bound the
+# memory used by a bulk upload regardless of the request body size.
+MAX_DOCUMENT_BYTES = 10 * 1024 * 1024
+BULK_PIPELINE_DEPTH = 4
+
+_DISCARD_BLOCK = 64 * 1024
+
+
+def iter_ndjson_documents(stream, max_bytes=MAX_DOCUMENT_BYTES):
+    """
+    Parse newline-delimited JSON documents from a binary stream as it arrives.
+
+    Each line must be an object with a ``markdown`` string. Yields
+    ``(index, markdown, error)`` with exactly one of ``markdown``/``error``
+    set; lines over ``max_bytes`` are skipped without being buffered.
+    """
+    index = 0
+    while True:
+        line = stream.readline(max_bytes + 1)
+        if not line:
+            break
+        if len(line) > max_bytes and not line.endswith(b'\n'):
+            while True:
+                rest = stream.readline(_DISCARD_BLOCK)
+                if not rest or rest.endswith(b'\n'):
+                    break
+            yield index, None, f"Document exceeds {max_bytes} bytes"
+            index += 1
+            continue
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            yield index, None, f"Invalid JSON: {str(e)}"
+        else:
+            markdown = item.get('markdown') if isinstance(item, dict) else None
+            if isinstance(markdown, str) and markdown.strip():
+                yield index, markdown, None
+            else:
+                yield index, None, "No markdown provided"
+        index += 1
+
+
+def iter_uploaded_documents(files, max_bytes=MAX_DOCUMENT_BYTES):
+    """Yield ``(index, markdown, error)`` for each uploaded multipart file."""
+    for index, uploaded in enumerate(files):
+        if uploaded.size > max_bytes:
+            yield index, None, f"Document exceeds {max_bytes} bytes"
+            continue
+        try:
+            markdown = uploaded.read().decode('utf-8')
+        except UnicodeDecodeError:
+            yield index, None, "Document is not valid UTF-8"
+            continue
+        finally:
+            uploaded.close()
+        if markdown.strip():
+            yield index, markdown, None
+        else:
+            yield index, None, "No markdown provided"
+
+
+def _prepare(document):
+    try:
+        return prepare_chunks(document)
+    finally:
+        # Worker threads get their own DB connection (for the embedding cache)
+        connections.close_all()
+
+
+def ingest_many(items, depth=BULK_PIPELINE_DEPTH):
+    """
+    Pipelined chunk -> embed -> bulk insert over ``(index, markdown, error)`` items.
+
+    While up to ``depth`` documents are being chunked and embedded on worker
+    threads, the request thread keeps parsing the next documents and writes
+    finished ones with ``bulk_create``. Returns one result dict per item.
+    """
+    results = []
+    in_flight = deque()
+
+    def finish_oldest():
+        index, document, future = in_flight.popleft()
+        try:
+            chunk_objects, token_count = future.result()
+            store_chunks(document, chunk_objects, token_count)
+        except Exception as e:
+            logger.error(f"Failed to process chunks for document {document.id}: {str(e)}")
+            document.delete()
+            results.append({"index": index, "error": f"Failed to process chunks: {str(e)}"})
+            return
+        results.append({"index": index, "document_id": document.id, "chunks": len(chunk_objects)})
+
+    with ThreadPoolExecutor(max_workers=depth) as executor:
+        for index, markdown, error in items:
+            if error:
+                results.append({"index": index, "error": error})
+                continue
+            document = Document.objects.create(markdown=markdown)
+            in_flight.append((index, document, executor.submit(_prepare, document)))
+            if len(in_flight) >= depth:
+                finish_oldest()
+        while in_flight:
+            finish_oldest()
+    return results
@@ -1,9 +1,223 @@
 import re
+from typing import Iterable, Iterator, NamedTuple, Union
 
-def chunk_text(text, chunk_size=500, overlap=50):
-    words = re.split(r'\s+', text)
-    chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = " ".join(words[i:i + chunk_size])
-        chunks.append(chunk)
-    return chunks
\ No newline at end of file
+# Chunk size is measured in estimated model tokens. nomic-embed-text runs with
+# a 2048 token context in Ollama and silently truncates anything longer, so
+# chunks are kept well below that.
+DEFAULT_MAX_TOKENS = 512
+DEFAULT_OVERLAP_TOKENS = 64
+
+_TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+_WORD_RE = re.compile(r'\S+')
+_FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+_HEADING_RE = re.compile(r'^ {0,3}#{1,6}(\s|$)')
+_TABLE_RE = re.compile(r'^\s*\|')
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int  # character offset of the chunk in the source document
+    end: int
+    tokens: int
+
+
+def estimate_tokens(text):
+    """
+    Estimate the number of WordPiece tokens the embedding model sees.
+
+    Every word and punctuation mark is at least one token and long words are
+    split into several pieces, so this errs on the side of over-counting.
+    """
+    return sum(1 + (len(match.group()) - 1) // 6 for match in _TOKEN_RE.finditer(text))
+
+
+def _iter_lines(source):
+    """Yield lines (with their newline) from a string or a text stream."""
+    if isinstance(source, str):
+        position = 0
+        while position < len(source):
+            newline = source.find('\n', position)
+            end = len(source) if newline == -1 else newline + 1
+            yield source[position:end]
+            position = end
+    else:
+        for line in source:
+            yield line
+
+
+def _iter_blocks(source):
+    """
+    Split markdown into structural blocks: fenced code blocks, tables,
+    headings and paragraphs. Blank lines are attached to the preceding block,
+    so consecutive blocks are contiguous in the source.
+
+    Yields ``(kind, text, start)`` tuples.
+    """
+    kind, lines, start = None, [], 0
+    position = 0
+    fence = None
+    ended = False  # a blank line closed the current block
+
+    for line in _iter_lines(source):
+        line_start = position
+        position += len(line)
+
+        if fence is not None:
+            lines.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+            continue
+
+        if not line.strip():
+            if lines:
+                lines.append(line)
+                ended = True
+            continue
+
+        fence_match = _FENCE_RE.match(line)
+        if fence_match:
+            new_kind = 'code'
+        elif _HEADING_RE.match(line):
+            new_kind = 'heading'
+        elif _TABLE_RE.match(line):
+            new_kind = 'table'
+        else:
+            new_kind = 'paragraph'
+
+        continues = not ended and new_kind == kind and kind in ('paragraph', 'table')
+        if lines and not continues:
+            yield (kind, ''.join(lines), start)
+            lines = []
+        if not lines:
+            start = line_start
+        kind, ended = new_kind, False
+        lines.append(line)
+        if fence_match:
+            fence = fence_match.group(1)
+
+    if lines:
+        yield (kind, ''.join(lines), start)
+
+
+def _split_block(text, start, max_tokens, overlap_tokens):
+    """Split an oversized block on line boundaries, falling back to words."""
+    pieces = []
+    for match in re.finditer(r'[^\n]*\n|[^\n]+$', text):
+        line = match.group()
+        if estimate_tokens(line) <= max_tokens:
+            pieces.append((line, start + match.start()))
+            continue
+        words = [(word.group(), start + match.start() + word.start()) for word in _WORD_RE.finditer(line)]
+        pieces.extend(_word_windows(
+            text, start, words, start + match.start(), start + match.end(), max_tokens, overlap_tokens,
+        ))
+    return pieces
+
+
+def _word_windows(text, text_start, words, line_start, line_end, max_tokens, overlap_tokens):
+    """
+    Overlapping windows of ``words`` (``(word, offset)`` pairs of the line
+    spanning ``line_start:line_end``). Each window runs up to the next
+    window's last word, whitespace included, and the first and last windows
+    reach the line's ends, so no text between windows is lost.
+    """
+    windows = []
+    i = 0
+    while i < len(words):
+        tokens, j = 0, i
+        while j < len(words) and (j == i or tokens + estimate_tokens(words[j][0]) <= max_tokens):
+            tokens += estimate_tokens(words[j][0])
+            j += 1
+        window_start = line_start if i == 0 else words[i][1]
+        window_end = line_end if j >= len(words) else words[j][1]
+        windows.append((text[window_start - text_start:window_end - text_start], window_start))
+        if j >= len(words):
+            break
+        # Step back over up to overlap_tokens worth of words
+        back, k = 0, j
+        while k - 1 > i and back + estimate_tokens(words[k - 1][0]) <= overlap_tokens:
+            k -= 1
+            back += estimate_tokens(words[k][0])
+        i = k
+    return windows
+
+
+def _make_chunk(pieces):
+    # Pieces follow each other in the source, except that the word windows of
+    # a long line overlap: offsets tell how much of each piece is new
+    text, start = pieces[0]
+    end = start + len(text)
+    for piece, piece_start in pieces[1:]:
+        text += piece[max(0, end - piece_start):]
+        end = max(end, piece_start + len(piece))
+    text = text.rstrip()
+    stripped = len(text) - len(text.lstrip())
+    return Chunk(text.lstrip(), start + stripped, start + len(text), estimate_tokens(text))
+
+
+def iter_chunks(source: Union[str, Iterable[str]], max_tokens=DEFAULT_MAX_TOKENS,
+                overlap_tokens=DEFAULT_OVERLAP_TOKENS) -> Iterator[Chunk]:
+    """
+    Lazily split markdown into chunks of at most ``max_tokens`` estimated tokens.
+
+    ``source`` may be a string or any iterable of lines (e.g. an open text
+    file), which is consumed incrementally, so memory stays bounded by the
+    chunk size rather than the document size. Code blocks and tables are
+    kept whole unless they alone exceed the budget, a heading starts a new
+    chunk once the current one is reasonably full, and up to
+    ``overlap_tokens`` of trailing blocks are repeated at the start of the
+    next chunk. ``chunk.text == source[chunk.start:chunk.end]``.
+    """
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    pieces, tokens = [], 0
+    fresh = False  # pieces holds text not yet emitted in any chunk
+
+    def flush():
+        nonlocal pieces, tokens, fresh
+        fresh = False
+        chunk = _make_chunk(pieces)
+        # Carry whole trailing pieces over as overlap for the next chunk
+        carried, carried_tokens = [], 0
+        for piece in reversed(pieces[1:]):
+            piece_tokens = estimate_tokens(piece[0])
+            if carried_tokens + piece_tokens > overlap_tokens:
+                break
+            carried.insert(0, piece)
+            carried_tokens += piece_tokens
+        pieces, tokens = carried, carried_tokens
+        return chunk
+
+    for kind, text, start in _iter_blocks(source):
+        block_tokens = estimate_tokens(text)
+        if kind == 'heading' and tokens >= max_tokens // 4:
+            yield flush()
+            pieces, tokens = [], 0
+
+        block_pieces = [(text, start)] if block_tokens <= max_tokens else \
+            _split_block(text, start, max_tokens, overlap_tokens)
+        for piece in block_pieces:
+            piece_tokens = estimate_tokens(piece[0])
+            if pieces and tokens + piece_tokens > max_tokens:
+                yield flush()
+                # Drop the carried overlap if the new piece would not fit with it
+                while pieces and tokens + piece_tokens > max_tokens:
+                    tokens -= estimate_tokens(pieces.pop(0)[0])
+            pieces.append(piece)
+            tokens += piece_tokens
+            fresh = True
+
+    if fresh:
+        yield _make_chunk(pieces)
+
+
+def chunk_text(text, max_tokens=DEFAULT_MAX_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
+    return [chunk.text for chunk in iter_chunks(text, max_tokens, overlap_tokens)]
+
+
+def chunk_item(item):
+    """
+    ``(key, text)`` -> ``(key, text, chunks)``. A module-level function of
+    this Django-free module, so process pools can run it in fresh workers.
+    """
+    key, text = item
+    return key, text, list(iter_chunks(text))
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import weakref
+from functools import wraps
+import httpx
+
+# event loop -> ({name: object}, shutdown generator); see loop_local
+_loop_objects = weakref.WeakKeyDictionary()
+
+
+def _is_closed(obj):
+    closed = getattr(obj, 'is_closed', False)
+    return closed() if callable(closed) else closed
+
+
+def loop_local(name, factory):
+    """
+    Return the long-lived object registered as ``name`` for the running event
+    loop, creating it with ``factory()`` on first use.
+
+    Async HTTP connection pools cannot be shared between event loops, so one
+    instance is kept per (loop, name). Under ASGI there is a single loop per
+    worker, so every request reuses the same pooled keep-alive connections.
+    Under WSGI each ``async_to_sync`` call runs a new loop; its objects are
+    closed when that loop shuts down (see ``_close_at_shutdown``).
+    """
+    loop = asyncio.get_running_loop()
+    entry = _loop_objects.get(loop)
+    if entry is None:
+        closer = _close_at_shutdown()
+        # Advancing the generator to its yield registers it with the loop
+        try:
+            closer.asend(None).send(None)
+        except StopIteration:
+            pass
+        entry = _loop_objects[loop] = ({}, closer)
+    objects = entry[0]
+    obj = objects.get(name)
+    if obj is None or _is_closed(obj):
+        obj = objects[name] = factory()
+    return obj
+
+
+async def _close_at_shutdown():
+    """
+    Async generator parked at its ``yield`` for the lifetime of a loop. Loops
+    finalize their async generators when they shut down (``asyncio.run``,
+    asgiref's ``async_to_sync`` and ASGI servers call
+    ``loop.shutdown_asyncgens()``), which closes the loop's objects.
+    """
+    try:
+        yield
+    finally:
+        await close_async_clients()
+
+
+def lazy(factory):
+    """
+    Decorator turning ``factory`` into a getter that builds its object on the
+    first call and returns that same object afterwards. Expensive clients and
+    chains are built this way so importing their module stays cheap for
+    processes that never use them (see ``ApiConfig.warm_up``).
+    """
+    lock = threading.Lock()
+    built = []
+
+    @wraps(factory)
+    def get():
+        if not built:
+            with lock:
+                if not built:
+                    built.append(factory())
+        return built[0]
+
+    return get
+
+
+def get_async_client(name, **kwargs):
+    """Pooled ``httpx.AsyncClient`` for ``name``; see ``loop_local``."""
+    return loop_local(name, lambda: httpx.AsyncClient(**kwargs))
+
+
+async def close_async_clients():
+    """Close every client that belongs to the running event loop."""
+    entry = _loop_objects.pop(asyncio.get_running_loop(), None)
+    if entry is None:
+        return
+    closes = [(getattr(obj, 'aclose', None) or obj.close)() for obj in entry[0].values()]
+    await asyncio.gather(*closes, return_exceptions=True)
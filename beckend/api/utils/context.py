@@ -0,0 +1,156 @@
+import re
+from typing import NamedTuple, Optional, Tuple
+from django.conf import settings
+from .chunking import estimate_tokens
+
+# Prompt tokens (as estimated by the chunker) spent on retrieved context
+CONTEXT_TOKEN_BUDGET = getattr(settings, 'CONTEXT_TOKEN_BUDGET', 1500)
+# Maximal marginal relevance trade-off: 1.0 ranks by relevance only, lower
+# values favour passages that add something the selection does not cover yet
+MMR_LAMBDA = getattr(settings, 'CONTEXT_MMR_LAMBDA', 0.7)
+# Word-trigram Jaccard similarity above which a passage counts as a duplicate
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+_WORD_RE = re.compile(r'\w+')
+
+
+class Passage(NamedTuple):
+    document_id: int
+    chunk_ids: Tuple[int, ...]
+    text: str
+    start: Optional[int]  # character offsets in the document, when known
+    end: Optional[int]
+    chunk_index: int  # index of the first merged chunk
+    relevance: float
+    rank: int  # best search rank among the merged chunks
+
+
+def _shingles(text):
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < 3:
+        return {tuple(words)}
+    return {tuple(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _suffix_prefix_overlap(a, b, minimum=20):
+    """
+    Length of the longest suffix of ``a`` that is also a prefix of ``b``, or 0
+    if it is shorter than ``minimum`` characters (too short to be chunk overlap).
+    """
+    for size in range(min(len(a), len(b)), minimum - 1, -1):
+        if a.endswith(b[:size]):
+            return size
+    return 0
+
+
+def _join(first, second):
+    """Concatenate two passages that follow each other in the same document."""
+    if first.start is not None and second.start is not None and second.start <= first.end:
+        # Chunk text is an exact slice of the document, so offsets give the overlap
+        text = first.text + second.text[first.end - second.start:] if second.end > first.end else first.text
+        end = max(first.end, second.end)
+    else:
+        overlap = _suffix_prefix_overlap(first.text, second.text)
+        text = first.text + second.text[overlap:] if overlap else f"{first.text}\n\n{second.text}"
+        end = second.end
+    return first._replace(
+        chunk_ids=first.chunk_ids + second.chunk_ids,
+        text=text,
+        end=end,
+        relevance=max(first.relevance, second.relevance),
+        rank=min(first.rank, second.rank),
+    )
+
+
+def _follows(first, second, last_index):
+    if first.document_id != second.document_id:
+        return False
+    if first.end is not None and second.start is not None and second.start <= first.end:
+        return True
+    return second.chunk_index == last_index + 1
+
+
+def merge_passages(chunks, max_tokens=CONTEXT_TOKEN_BUDGET):
+    """
+    Turn search hits into passages, merging hits from the same document that
+    overlap or are adjacent chunks (as long as the result fits ``max_tokens``),
+    so text repeated by the chunk overlap is sent only once.
+    """
+    items = []
+    for rank, chunk in enumerate(chunks):
+        items.append(Passage(
+            document_id=chunk.document_id,
+            chunk_ids=(chunk.id,),
+            text=chunk.chunk_text,
+            start=getattr(chunk, 'start_offset', None),
+            end=getattr(chunk, 'end_offset', None),
+            chunk_index=chunk.chunk_index,
+            relevance=float(getattr(chunk, 'similarity', 0.0)),
+            rank=rank,
+        ))
+    items.sort(key=lambda passage: (passage.document_id, passage.chunk_index))
+
+    passages = []
+    last_index = None  # chunk_index of the last chunk merged into passages[-1]
+    for passage in items:
+        if passages and _follows(passages[-1], passage, last_index):
+            merged = _join(passages[-1], passage)
+            if estimate_tokens(merged.text) <= max_tokens:
+                passages[-1] = merged
+                last_index = passage.chunk_index
+                continue
+        passages.append(passage)
+        last_index = passage.chunk_index
+    return passages
+
+
+def assemble_context(chunks, max_tokens=CONTEXT_TOKEN_BUDGET, mmr_lambda=MMR_LAMBDA,
+                     duplicate_threshold=NEAR_DUPLICATE_THRESHOLD):
+    """
+    Pick the passages to send to the LLM from ranked search hits.
+
+    Overlapping and adjacent chunks are merged, near-duplicate passages are
+    dropped, and the rest are chosen by maximal marginal relevance (relevance
+    is the cosine similarity, redundancy the word-trigram overlap with the
+    passages already chosen) until ``max_tokens`` is spent. Passages are
+    returned grouped by document in reading order.
+    """
+    candidates = []
+    for passage in sorted(merge_passages(chunks, max_tokens), key=lambda p: (-p.relevance, p.rank)):
+        shingles = _shingles(passage.text)
+        if any(_jaccard(shingles, kept) >= duplicate_threshold for _, kept, _ in candidates):
+            continue
+        candidates.append((passage, shingles, estimate_tokens(passage.text)))
+
+    selected, remaining = [], max_tokens
+    while candidates:
+        best, best_score = None, None
+        for position, (passage, shingles, tokens) in enumerate(candidates):
+            if tokens > remaining:
+                continue
+            redundancy = max((_jaccard(shingles, chosen) for _, chosen, _ in selected), default=0.0)
+            score = mmr_lambda * passage.relevance - (1 - mmr_lambda) * redundancy
+            if best_score is None or score > best_score:
+                best, best_score = position, score
+        if best is None:
+            break
+        choice = candidates.pop(best)
+        selected.append(choice)
+        remaining -= choice[2]
+
+    first_rank = {}
+    for passage, _, _ in selected:
+        first_rank[passage.document_id] = min(first_rank.get(passage.document_id, passage.rank), passage.rank)
+    passages = [passage for passage, _, _ in selected]
+    return sorted(passages, key=lambda p: (first_rank[p.document_id], p.chunk_index))
+
+
+def build_context(chunks, max_tokens=CONTEXT_TOKEN_BUDGET):
+    """LLM context text for search hits; see ``assemble_context``."""
+    return "\n\n".join(passage.text for passage in assemble_context(chunks, max_tokens))
@@ -0,0 +1,363 @@
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import struct
+import tarfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from django.db import connection, connections, transaction
+from ..database import INSERT_COLUMNS, MODEL_EMBEDDING_COLUMNS
+from ..models import ChunkEmbedding, Document, DocumentChunk, LoadedCorpusFile
+from .chunking import chunk_item
+from .embedding_models import COLUMN_EMBEDDING_MODEL, live_models
+from .embeddings import generate_embeddings
+from .ingestion import _validate_embedding, content_hash
+from .metrics import span
+
+logger = logging.getLogger(__name__)
+
+CORPUS_EXTENSIONS = ('.md', '.markdown')
+# Chunks embedded and written per transaction, and documents being chunked
+# ahead of the embedder per worker process
+LOAD_BATCH_CHUNKS = 2000
+CHUNK_LOOKAHEAD = 8
+
+# Binary COPY framing: signature, flags and header extension length, then
+# one tuple per row and a -1 field count as trailer
+COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+COPY_TRAILER = struct.pack('!h', -1)
+COPY_SQL = (
+    f"COPY {DocumentChunk._meta.db_table} ({', '.join(INSERT_COLUMNS)}) "
+    f"FROM STDIN WITH (FORMAT binary)"
+)
+MODEL_EMBEDDING_COPY_SQL = (
+    f"COPY {ChunkEmbedding._meta.db_table} ({', '.join(MODEL_EMBEDDING_COLUMNS)}) "
+    f"FROM STDIN WITH (FORMAT binary)"
+)
+
+_CREATE_INDEX_RE = re.compile(r'^CREATE (UNIQUE )?INDEX ')
+
+
+def corpus_kind(path):
+    """'directory', 'zip' or 'tar'; raises ``ValueError`` for anything else."""
+    if os.path.isdir(path):
+        return 'directory'
+    if os.path.isfile(path):
+        if zipfile.is_zipfile(path):
+            return 'zip'
+        if tarfile.is_tarfile(path):
+            return 'tar'
+    raise ValueError(f"{path} is neither a directory nor a zip/tar archive")
+
+
+def iter_corpus(path):
+    """
+    Yield ``(key, markdown)`` for every markdown file under directory
+    ``path`` or in the zip/tar archive ``path``, in a stable order. ``key``
+    is the path relative to the corpus root; files that are not valid UTF-8
+    are logged and skipped.
+    """
+    kind = corpus_kind(path)
+    if kind == 'directory':
+        keys = sorted(
+            os.path.relpath(os.path.join(root, name), path)
+            for root, _, files in os.walk(path)
+            for name in files if name.lower().endswith(CORPUS_EXTENSIONS)
+        )
+        for key in keys:
+            with open(os.path.join(path, key), 'rb') as f:
+                yield from _decoded(key, f.read())
+    elif kind == 'zip':
+        with zipfile.ZipFile(path) as archive:
+            for info in sorted(archive.infolist(), key=lambda info: info.filename):
+                if not info.is_dir() and info.filename.lower().endswith(CORPUS_EXTENSIONS):
+                    yield from _decoded(info.filename, archive.read(info))
+    else:
+        # Streamed in archive order: sorting would need a second pass over a
+        # compressed archive
+        with tarfile.open(path, 'r|*') as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(CORPUS_EXTENSIONS):
+                    yield from _decoded(member.name, archive.extractfile(member).read())
+
+
+def _decoded(key, data):
+    try:
+        yield key, data.decode('utf-8')
+    except UnicodeDecodeError:
+        logger.warning(f"Skipping {key}: not valid UTF-8")
+
+
+def _bounded_map(executor, fn, items, depth):
+    """``executor.map`` that keeps at most ``depth`` items in flight instead of submitting everything."""
+    in_flight = deque()
+    for item in items:
+        in_flight.append(executor.submit(fn, item))
+        if len(in_flight) >= depth:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+def _batches(chunked, batch_chunks):
+    """Group chunked documents into batches of at least ``batch_chunks`` chunks."""
+    batch, size = [], 0
+    for key, markdown, chunks in chunked:
+        batch.append((key, markdown, chunks))
+        size += len(chunks)
+        if size >= batch_chunks:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+_NULL = struct.pack('!i', -1)
+
+
+def _int4(value):
+    return _NULL if value is None else struct.pack('!ii', 4, value)
+
+
+def _int8(value):
+    return struct.pack('!iq', 8, value)
+
+
+def _text(value):
+    data = value.encode('utf-8')
+    return struct.pack('!i', len(data)) + data
+
+
+def _vector(embedding):
+    # pgvector's binary format: dimensions, an unused int16, big-endian float4s
+    if embedding is None:
+        return _NULL
+    values = np.asarray(embedding, dtype='>f4')
+    return struct.pack('!ihh', 4 + 4 * len(values), len(values), 0) + values.tobytes()
+
+
+# Field encoders of INSERT_COLUMNS and MODEL_EMBEDDING_COLUMNS rows
+CHUNK_ENCODERS = (_int8, _text, _vector, _int4, _int4, _int4, _text)
+MODEL_EMBEDDING_ENCODERS = (_int8, _text, _vector)
+
+
+def encode_copy_rows(rows, encoders=CHUNK_ENCODERS):
+    """
+    Encode ``rows`` (chunk tuples in ``INSERT_COLUMNS`` order by default) as
+    a binary COPY stream, which Postgres loads without parsing text vector
+    literals.
+    """
+    buffer = io.BytesIO()
+    buffer.write(COPY_HEADER)
+    field_count = struct.pack('!h', len(encoders))
+    for row in rows:
+        buffer.write(field_count)
+        for encode, value in zip(encoders, row):
+            buffer.write(encode(value))
+    buffer.write(COPY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
+
+class Checkpoint:
+    """
+    Append-only JSON lines file recording the definitions of the chunk
+    indexes dropped for a corpus load, so a crashed run rebuilds them when
+    resumed. Which files were loaded is kept in the database instead (see
+    ``loaded_keys``), where it commits together with the files' documents.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.dropped_indexes = None
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        self._apply(json.loads(line))
+
+    def _apply(self, record):
+        if 'dropped_indexes' in record:
+            self.dropped_indexes = record['dropped_indexes']
+        if record.get('indexes_restored'):
+            self.dropped_indexes = None
+
+    def _append(self, record):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._apply(record)
+
+    def record_dropped_indexes(self, definitions):
+        self._append({'dropped_indexes': definitions})
+
+    def mark_indexes_restored(self):
+        self._append({'indexes_restored': True})
+
+
+def corpus_id(path):
+    """The ``LoadedCorpusFile.corpus`` value of the corpus at ``path``."""
+    return os.path.abspath(path).rstrip(os.sep)
+
+
+def loaded_keys(corpus):
+    """Keys of the files of ``corpus`` (see ``corpus_id``) that earlier loads committed."""
+    return set(LoadedCorpusFile.objects.filter(corpus=corpus).values_list('key', flat=True).iterator())
+
+
+def chunk_index_definitions():
+    """``CREATE INDEX`` statements of the chunk table's indexes, except those backing constraints."""
+    table = DocumentChunk._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass) "
+            "ORDER BY indexname",
+            [table, table],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def if_not_exists(definition):
+    """Make a ``pg_indexes.indexdef`` statement safe to re-run."""
+    return _CREATE_INDEX_RE.sub(lambda m: f"CREATE {m.group(1) or ''}INDEX IF NOT EXISTS ", definition, count=1)
+
+
+def drop_chunk_indexes(checkpoint):
+    """
+    Drop the chunk indexes before a load, recording their definitions in
+    ``checkpoint`` first. Does nothing when a resumed load already dropped them.
+    """
+    if checkpoint.dropped_indexes is not None:
+        return
+    definitions = chunk_index_definitions()
+    checkpoint.record_dropped_indexes(definitions)
+    names = [definition.split(' INDEX ', 1)[1].split(' ON ', 1)[0] for definition in definitions]
+    with connection.cursor() as cursor:
+        for name in names:
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def restore_chunk_indexes(checkpoint, maintenance_work_mem=None):
+    """Rebuild the indexes dropped by ``drop_chunk_indexes`` and refresh planner statistics."""
+    if checkpoint.dropped_indexes is None:
+        return
+    with connection.cursor() as cursor:
+        if maintenance_work_mem:
+            cursor.execute("SELECT set_config('maintenance_work_mem', %s, false)", [maintenance_work_mem])
+        for definition in checkpoint.dropped_indexes:
+            logger.info(f"Rebuilding index: {definition}")
+            cursor.execute(if_not_exists(definition))
+        cursor.execute(f"ANALYZE {DocumentChunk._meta.db_table}")
+    checkpoint.mark_indexes_restored()
+
+
+def _chunk_ids(document_ids):
+    """``{(document_id, chunk_index): chunk_id}`` of the given documents' chunks."""
+    rows = DocumentChunk.objects.filter(document_id__in=document_ids).values_list('document_id', 'chunk_index', 'id')
+    return {(document_id, index): chunk_id for document_id, index, chunk_id in rows.iterator()}
+
+
+def write_batch(batch, vectors, corpus):
+    """
+    Create the batch's documents, record their files as loaded from
+    ``corpus`` and COPY their chunks, all in one transaction. ``vectors``
+    maps every live embedding model to the batch's embeddings; those of the
+    non-column models are copied into ``ChunkEmbedding``. Returns the chunk
+    count.
+    """
+    column = vectors.get(COLUMN_EMBEDDING_MODEL)
+    with span('bulk_insert'), transaction.atomic():
+        documents = Document.objects.bulk_create([
+            Document(markdown=markdown, token_count=sum(chunk.tokens for chunk in chunks))
+            for _, markdown, chunks in batch
+        ])
+        LoadedCorpusFile.objects.bulk_create([
+            LoadedCorpusFile(corpus=corpus, key=key, document=document)
+            for document, (key, _, _) in zip(documents, batch)
+        ])
+        rows, keys = [], []
+        for document, (_, _, chunks) in zip(documents, batch):
+            for index, chunk in enumerate(chunks):
+                rows.append((
+                    document.id, chunk.text, column[len(rows)] if column is not None else None,
+                    index, chunk.start, chunk.end, content_hash(chunk.text),
+                ))
+                keys.append((document.id, index))
+        with connection.cursor() as cursor:
+            cursor.copy_expert(COPY_SQL, encode_copy_rows(rows))
+            models = [model for model in vectors if model != COLUMN_EMBEDDING_MODEL]
+            if models:
+                ids = _chunk_ids([document.id for document in documents])
+                model_rows = [
+                    (ids[key], model, embedding)
+                    for model in models for key, embedding in zip(keys, vectors[model])
+                ]
+                cursor.copy_expert(MODEL_EMBEDDING_COPY_SQL, encode_copy_rows(model_rows, MODEL_EMBEDDING_ENCODERS))
+    return len(rows)
+
+
+def load_corpus(path, workers=None, batch_chunks=LOAD_BATCH_CHUNKS,
+                embedding_batch_size=None, max_in_flight=None, use_embedding_cache=False, progress=None):
+    """
+    Load every markdown file of ``path`` (see ``iter_corpus``) that no
+    earlier load of the same corpus committed.
+
+    Files are chunked in a pool of ``workers`` processes, chunks are embedded
+    in batches of ``batch_chunks`` while the previous batch is being written
+    on a writer thread, and each batch is written by ``write_batch``. The
+    embedding cache is skipped unless ``use_embedding_cache`` is set, since
+    filling it would write every vector a second time, row by row.
+    ``progress(documents, chunks)`` is called after every batch. Returns
+    ``(documents, chunks)`` loaded by this run.
+    """
+    workers = workers or os.cpu_count() or 1
+    models = live_models()
+    corpus = corpus_id(path)
+    done = loaded_keys(corpus)
+    totals = [0, 0]  # documents, chunks
+
+    def finish(pending):
+        future, batch_documents = pending
+        totals[1] += future.result()
+        totals[0] += batch_documents
+        if progress:
+            progress(*totals)
+
+    items = (
+        (key, markdown) for key, markdown in iter_corpus(path)
+        if key not in done and markdown.strip()
+    )
+    # Chunking workers are spawned, not forked: the parent holds threads and
+    # a database connection, and chunking needs neither Django nor the database
+    spawn = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=spawn) as pool, \
+            ThreadPoolExecutor(max_workers=1) as writer:
+        chunked = _bounded_map(pool, chunk_item, items, depth=workers * CHUNK_LOOKAHEAD)
+        pending = None
+        try:
+            for batch in _batches(chunked, batch_chunks):
+                texts = [chunk.text for _, _, chunks in batch for chunk in chunks]
+                vectors = {}
+                for model in models:
+                    vectors[model] = generate_embeddings(
+                        texts, batch_size=embedding_batch_size, max_in_flight=max_in_flight,
+                        use_cache=use_embedding_cache, model=model,
+                    )
+                    for index, embedding in enumerate(vectors[model]):
+                        _validate_embedding(index, embedding, model)
+                if pending is not None:
+                    finish(pending)
+                pending = (writer.submit(write_batch, batch, vectors, corpus), len(batch))
+            if pending is not None:
+                finish(pending)
+        finally:
+            # The writer thread has its own database connection
+            writer.submit(connections.close_all).result()
+    return tuple(totals)
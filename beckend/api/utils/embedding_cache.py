@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from django.conf import settings
+from .metrics import Counter, Gauge, registry
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_MAX_BYTES = getattr(settings, 'EMBEDDING_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+EMBEDDING_CACHE_PERSIST = getattr(settings, 'EMBEDDING_CACHE_PERSIST', True)
+
+
+def cache_key(model, text):
+    """Content address for an embedding: sha256 of the model name and the text."""
+    digest = hashlib.sha256()
+    digest.update(model.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class EmbeddingLRU:
+    """
+    Thread-safe in-process LRU of embeddings bounded by total bytes.
+
+    Vectors are stored as ``array('f')`` (4 bytes per dimension) so the
+    byte budget maps directly onto the number of cached vectors.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector.tolist()
+
+    def set(self, key, embedding):
+        vector = array('f', embedding)
+        size = vector.itemsize * len(vector)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous.itemsize * len(previous)
+            self._entries[key] = vector
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.itemsize * len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-process LRU in front of the
+    ``CachedEmbedding`` table. Entries are content addressed, so they never
+    need invalidation; a different model or text is simply a different key.
+    """
+
+    def __init__(self, max_bytes=EMBEDDING_CACHE_MAX_BYTES, persist=EMBEDDING_CACHE_PERSIST):
+        self.memory = EmbeddingLRU(max_bytes)
+        self.persist = persist
+        self._lock = threading.Lock()
+        self.db_hits = 0
+        self.misses = 0
+
+    def get_many(self, model, texts):
+        """Return ``{index: embedding}`` for every text of ``texts`` that is cached."""
+        found = {}
+        pending = {}
+        for index, text in enumerate(texts):
+            key = cache_key(model, text)
+            embedding = self.memory.get(key)
+            if embedding is not None:
+                found[index] = embedding
+            else:
+                pending.setdefault(key, []).append(index)
+
+        if pending and self.persist:
+            from ..models import CachedEmbedding
+            try:
+                rows = CachedEmbedding.objects.filter(key__in=list(pending)).values_list('key', 'embedding')
+                for key, embedding in rows:
+                    embedding = [float(x) for x in embedding]
+                    self.memory.set(key, embedding)
+                    for index in pending.pop(key):
+                        found[index] = embedding
+                        self._count(db_hits=1)
+            except Exception as e:
+                logger.warning(f"Embedding cache lookup failed: {str(e)}")
+
+        self._count(misses=sum(len(indexes) for indexes in pending.values()))
+        return found
+
+    def set_many(self, model, texts, embeddings):
+        entries = {}
+        for text, embedding in zip(texts, embeddings):
+            key = cache_key(model, text)
+            self.memory.set(key, embedding)
+            entries[key] = embedding
+
+        if entries and self.persist:
+            from ..models import CachedEmbedding
+            try:
+                CachedEmbedding.objects.bulk_create(
+                    [CachedEmbedding(key=key, model=model, embedding=embedding) for key, embedding in entries.items()],
+                    batch_size=500,
+                    ignore_conflicts=True,
+                )
+            except Exception as e:
+                logger.warning(f"Embedding cache write failed: {str(e)}")
+
+    def _count(self, db_hits=0, misses=0):
+        with self._lock:
+            self.db_hits += db_hits
+            self.misses += misses
+
+    def stats(self):
+        return {
+            "memory_hits": self.memory.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.current_bytes,
+            "memory_max_bytes": self.memory.max_bytes,
+            "evictions": self.memory.evictions,
+        }
+
+
+embedding_cache = EmbeddingCache()
+
+
+def _cache_metrics():
+    stats = embedding_cache.stats()
+    lookups = Counter('rag_embedding_cache_lookups_total', "Embedding cache lookups by result.", labels=('result',))
+    lookups.set(stats['memory_hits'], result='memory_hit')
+    lookups.set(stats['db_hits'], result='db_hit')
+    lookups.set(stats['misses'], result='miss')
+    evictions = Counter('rag_embedding_cache_evictions_total', "Entries evicted from the in-process cache.")
+    evictions.set(stats['evictions'])
+    size = Gauge('rag_embedding_cache_bytes', "Bytes held by the in-process embedding cache.")
+    size.set(stats['memory_bytes'])
+    return [lookups, evictions, size]
+
+
+registry.add_collector(_cache_metrics)
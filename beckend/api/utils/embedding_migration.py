@@ -0,0 +1,217 @@
+import hashlib
+import logging
+import re
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from ..models import ChunkEmbedding, DocumentChunk, EmbeddingModelState
+from .embedding_models import (
+    COLUMN_EMBEDDING_MODEL, EMBEDDING_STATE_REFRESH_INTERVAL, STATUS_ACTIVE, STATUS_BACKFILLING, STATUS_READY,
+    STATUS_RETIRED, get_embedding_model, model_states, resolve_states, validate_embedding,
+)
+from .embeddings import generate_embeddings
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 256
+# Chunks per second the backfill embeds by default, leaving Ollama capacity
+# for live traffic
+BACKFILL_RATE = getattr(settings, 'EMBEDDING_BACKFILL_RATE', 50)
+# Most chunks the cutover will embed itself before pausing chunk writes;
+# with more missing the backfill has to catch up first
+CUTOVER_MAX_MISSING = 500
+# Most chunks (written while the cutover caught up) it will embed while chunk
+# writes are paused; with more, writes are too busy to switch now
+CUTOVER_MAX_LOCKED_MISSING = 20
+
+_INDEX_NAME_RE = re.compile(r'[^a-z0-9]+')
+
+
+def model_index_name(model):
+    """Name of the partial HNSW index over ``model``'s ``ChunkEmbedding`` rows."""
+    slug = _INDEX_NAME_RE.sub('_', model.lower()).strip('_')[:30]
+    digest = hashlib.sha256(model.encode('utf-8')).hexdigest()[:8]
+    return f"chunk_embedding_{slug}_{digest}_hnsw"
+
+
+def create_model_index(model):
+    """
+    Build ``model``'s HNSW index concurrently, so neither searches nor writes
+    are blocked. The index covers ``embedding`` cast to the model's
+    dimensions (the column itself has none) and only that model's rows, so
+    searches must use the same expression and filter (see
+    ``search.model_search``). Must run outside a transaction.
+    """
+    name = model_index_name(model)
+    dimensions = get_embedding_model(model).dimensions
+    with connection.cursor() as cursor:
+        # An interrupted concurrent build leaves an invalid index behind
+        cursor.execute(
+            "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", [name]
+        )
+        row = cursor.fetchone()
+        if row and row[0]:
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        cursor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {ChunkEmbedding._meta.db_table} "
+            f"USING hnsw ((embedding::vector({dimensions})) vector_cosine_ops) "
+            f"WITH (m = 16, ef_construction = 64) WHERE model = %s",
+            [model],
+        )
+
+
+def drop_model_index(model):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {model_index_name(model)}")
+
+
+def start_backfill(model):
+    """
+    Register ``model`` as a backfill target. From then on ingestion also
+    writes its vectors, so the backfill only has to cover older chunks.
+    Returns the ``EmbeddingModelState``.
+    """
+    get_embedding_model(model)
+    if model == COLUMN_EMBEDDING_MODEL:
+        raise ValueError(f"{model} is stored in DocumentChunk.embedding and needs no backfill")
+    state, created = EmbeddingModelState.objects.get_or_create(model=model)
+    if not created and state.status == STATUS_RETIRED:
+        # Chunks written while retired have no vector: scan everything again
+        state.status = STATUS_BACKFILLING
+        state.backfilled_through = 0
+        state.save(update_fields=['status', 'backfilled_through', 'updated_at'])
+    return state
+
+
+def _missing_vectors(model, chunks):
+    """The subset of ``chunks`` with no ``model`` vector yet."""
+    present = set(ChunkEmbedding.objects.filter(
+        model=model, chunk_id__in=[chunk.id for chunk in chunks]
+    ).values_list('chunk_id', flat=True))
+    return [chunk for chunk in chunks if chunk.id not in present]
+
+
+def _embed_into(model, chunks, batch_size=None, max_in_flight=None):
+    embeddings = generate_embeddings(
+        [chunk.chunk_text for chunk in chunks], batch_size=batch_size, max_in_flight=max_in_flight, model=model,
+    )
+    for embedding in embeddings:
+        validate_embedding(model, embedding)
+    ChunkEmbedding.objects.bulk_create([
+        ChunkEmbedding(chunk_id=chunk.id, model=model, embedding=embedding)
+        for chunk, embedding in zip(chunks, embeddings)
+    ], batch_size=500, ignore_conflicts=True)
+
+
+def backfill_batch(state, batch_size=BACKFILL_BATCH_SIZE, max_in_flight=None):
+    """
+    Embed the next ``batch_size`` chunks after ``state.backfilled_through``
+    that have no vector for the model yet, and advance the cursor in the same
+    transaction so an interrupted backfill resumes where it stopped. Returns
+    ``(scanned, embedded)``; ``scanned == 0`` means the backfill is complete.
+    """
+    chunks = list(DocumentChunk.objects.filter(
+        id__gt=state.backfilled_through
+    ).order_by('id').only('id', 'chunk_text')[:batch_size])
+    if not chunks:
+        return 0, 0
+    missing = _missing_vectors(state.model, chunks)
+    with transaction.atomic():
+        if missing:
+            _embed_into(state.model, missing, batch_size=batch_size, max_in_flight=max_in_flight)
+        state.backfilled_through = chunks[-1].id
+        state.save(update_fields=['backfilled_through', 'updated_at'])
+    return len(chunks), len(missing)
+
+
+def finish_backfill(state):
+    """Index the backfilled vectors and mark the model ready for cutover."""
+    create_model_index(state.model)
+    if state.status == STATUS_BACKFILLING:
+        state.status = STATUS_READY
+        state.save(update_fields=['status', 'updated_at'])
+
+
+def _chunks_missing(model, limit):
+    """Up to ``limit + 1`` chunks with no ``model`` vector, so callers can tell when there are too many."""
+    return list(DocumentChunk.objects.exclude(
+        model_embeddings__model=model
+    ).only('id', 'chunk_text')[:limit + 1])
+
+
+def activate_model(model, max_missing=CUTOVER_MAX_MISSING, max_locked_missing=CUTOVER_MAX_LOCKED_MISSING):
+    """
+    Atomically make ``model`` the one searches use.
+
+    Chunks still missing a ``model`` vector are embedded first, with writes
+    going on. Chunk writes (not reads) are then paused with a table lock
+    while the few written meanwhile are embedded and the active model is
+    switched, so no chunk can be written without one in between. The
+    previous model stays live, with its vectors still written, so it can be
+    switched back to until it is retired.
+    """
+    get_embedding_model(model)
+    states = {state.model: state for state in EmbeddingModelState.objects.all()}
+    state = states.get(model)
+    if model == COLUMN_EMBEDDING_MODEL:
+        if state is not None and state.status == STATUS_RETIRED:
+            raise ValueError(f"{model} was retired; new chunks have no {model} vectors")
+    elif state is None or state.status not in (STATUS_READY, STATUS_ACTIVE):
+        raise ValueError(f"{model} is not ready: run backfill_embeddings {model} first")
+    if resolve_states({name: s.status for name, s in states.items()})[0] == model:
+        return
+
+    if model != COLUMN_EMBEDDING_MODEL:
+        missing = _chunks_missing(model, max_missing)
+        if len(missing) > max_missing:
+            raise ValueError(f"More than {max_missing} chunks lack {model} vectors: run backfill_embeddings again")
+        if missing:
+            _embed_into(model, missing)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {DocumentChunk._meta.db_table} IN SHARE ROW EXCLUSIVE MODE")
+        if model != COLUMN_EMBEDDING_MODEL:
+            missing = _chunks_missing(model, max_locked_missing)
+            if len(missing) > max_locked_missing:
+                raise ValueError(f"Chunks lacking {model} vectors are being written too fast: retry the switch")
+            if missing:
+                _embed_into(model, missing)
+        EmbeddingModelState.objects.filter(status=STATUS_ACTIVE).update(status=STATUS_READY, updated_at=timezone.now())
+        # Record the column model explicitly once it is no longer active
+        EmbeddingModelState.objects.get_or_create(model=COLUMN_EMBEDDING_MODEL, defaults={'status': STATUS_READY})
+        EmbeddingModelState.objects.update_or_create(
+            model=model, defaults={'status': STATUS_ACTIVE, 'activated_at': timezone.now()},
+        )
+    model_states.invalidate()
+    logger.info(f"Embedding model switched to {model}")
+
+
+def retire_model(model, purge=False):
+    """
+    Stop writing ``model``'s vectors. ``purge`` also deletes its stored
+    vectors and index (the column model's vectors stay in the chunk table).
+    """
+    get_embedding_model(model)
+    states = {state.model: state for state in EmbeddingModelState.objects.all()}
+    active = resolve_states({name: state.status for name, state in states.items()})[0]
+    if active == model:
+        raise ValueError(f"{model} is the active model: switch to another model first")
+    # Workers notice a switch within EMBEDDING_STATE_REFRESH_INTERVAL and may
+    # search the previous model until then
+    activated_at = states[active].activated_at if active in states else None
+    if activated_at and (timezone.now() - activated_at).total_seconds() < 2 * EMBEDDING_STATE_REFRESH_INTERVAL:
+        raise ValueError("Other workers may still be searching with it: retry in a few seconds")
+    EmbeddingModelState.objects.update_or_create(model=model, defaults={'status': STATUS_RETIRED})
+    model_states.invalidate()
+    if purge and model != COLUMN_EMBEDDING_MODEL:
+        drop_model_index(model)
+        ChunkEmbedding.objects.filter(model=model).delete()
+
+
+@receiver(post_save, sender=EmbeddingModelState)
+@receiver(post_delete, sender=EmbeddingModelState)
+def _invalidate_model_states(sender, **kwargs):
+    model_states.invalidate()
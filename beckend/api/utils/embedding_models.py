@@ -0,0 +1,120 @@
+import threading
+import time
+from typing import NamedTuple
+from django.conf import settings
+
+
+class EmbeddingModel(NamedTuple):
+    name: str  # Ollama model name
+    dimensions: int
+
+
+# Embedding models the service can switch between. More can be added with
+# the EMBEDDING_MODELS setting, as {name: dimensions}.
+EMBEDDING_MODELS = {
+    name: EmbeddingModel(name, dimensions)
+    for name, dimensions in {
+        'nomic-embed-text:v1.5': 768,
+        'mxbai-embed-large': 1024,
+        'snowflake-arctic-embed:m': 768,
+        'all-minilm': 384,
+        **getattr(settings, 'EMBEDDING_MODELS', {}),
+    }.items()
+}
+
+# The model stored in DocumentChunk.embedding, which its optional quantized
+# indexes cover. Vectors of every other model live in ChunkEmbedding, so moving to
+# another model never alters the chunk table. Changing this needs a migration.
+COLUMN_EMBEDDING_MODEL = 'nomic-embed-text:v1.5'
+
+# Seconds a worker keeps using its view of the active and live models before
+# re-reading it; changes made in this process apply immediately.
+EMBEDDING_STATE_REFRESH_INTERVAL = getattr(settings, 'EMBEDDING_STATE_REFRESH_INTERVAL', 5)
+
+STATUS_BACKFILLING = 'backfilling'
+STATUS_READY = 'ready'
+STATUS_ACTIVE = 'active'
+STATUS_RETIRED = 'retired'
+
+
+def get_embedding_model(name):
+    """Registry entry for ``name``; raises ``ValueError`` for unknown models."""
+    try:
+        return EMBEDDING_MODELS[name]
+    except KeyError:
+        raise ValueError(f"Unknown embedding model: {name}")
+
+
+def validate_embedding(model, embedding):
+    """Raise ``ValueError`` unless ``embedding`` has ``model``'s dimensions."""
+    dimensions = get_embedding_model(model).dimensions
+    if not embedding or len(embedding) != dimensions:
+        raise ValueError(
+            f"Expected a {dimensions}-dimensional {model} embedding, got {len(embedding or [])} dimensions"
+        )
+
+
+def resolve_states(statuses):
+    """
+    ``(active, live)`` from ``{model: status}`` as stored in
+    ``EmbeddingModelState``. The active model answers queries; every live
+    model (the active one first) gets vectors for newly written chunks. The
+    column model is active and live until states say otherwise.
+    """
+    statuses = dict(statuses)
+    statuses.setdefault(COLUMN_EMBEDDING_MODEL, STATUS_READY)
+    active = next((model for model, status in statuses.items() if status == STATUS_ACTIVE), COLUMN_EMBEDDING_MODEL)
+    live = [active] + sorted(
+        model for model, status in statuses.items() if status != STATUS_RETIRED and model != active
+    )
+    return active, tuple(live)
+
+
+class ModelStates:
+    """
+    Per-process cache of ``resolve_states`` over the ``EmbeddingModelState``
+    rows. Callbacks registered with ``on_switch`` run with the new active
+    model whenever this process notices a switch, e.g. to drop caches keyed
+    by query embeddings of the old model.
+    """
+
+    def __init__(self, refresh_interval=EMBEDDING_STATE_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._states = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def invalidate(self):
+        self._checked_at = None
+
+    def on_switch(self, callback):
+        self._listeners.append(callback)
+
+    def get(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.refresh_interval:
+            with self._lock:
+                if self._checked_at is None or time.monotonic() - self._checked_at >= self.refresh_interval:
+                    from ..models import EmbeddingModelState
+
+                    previous = self._states
+                    self._states = resolve_states(dict(EmbeddingModelState.objects.values_list('model', 'status')))
+                    self._checked_at = time.monotonic()
+                    if previous is not None and previous[0] != self._states[0]:
+                        for callback in self._listeners:
+                            callback(self._states[0])
+        return self._states
+
+
+model_states = ModelStates()
+
+
+def active_model():
+    """The model queries are embedded with and searched against."""
+    return model_states.get()[0]
+
+
+def live_models():
+    """Every model whose vectors must be written for new chunks, active first."""
+    return model_states.get()[1]
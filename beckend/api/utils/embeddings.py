@@ -1,32 +1,578 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
 import re
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
 import numpy as np
-from typing import List
+from typing import List, Union
 from django.conf import settings
+import httpx
 import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from .clients import get_async_client
+from .embedding_cache import embedding_cache
+from .embedding_models import COLUMN_EMBEDDING_MODEL
+from . import metrics
 
-OLLAMA_API_URL = "http://localhost:11434/api/embeddings"
+logger = logging.getLogger(__name__)
 
-def generate_embedding(text):
+OLLAMA_EMBED_URL = os.getenv("OLLAMA_EMBED_URL", "http://localhost:11434/api/embed")
+# Default model: the one stored in DocumentChunk.embedding. Searches pass the
+# model that is active at the time (see embedding_models.active_model()).
+EMBEDDING_MODEL = COLUMN_EMBEDDING_MODEL
+
+# Batching knobs for generate_embeddings: chunks per /api/embed request and
+# the number of batches allowed in flight against Ollama at the same time.
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_MAX_IN_FLIGHT = 4
+EMBEDDING_TIMEOUT = 120
+
+# Admission control for every Ollama embedding call made by this process
+# (see EmbeddingScheduler). Interactive requests (search queries, agent
+# routing) always go before bulk ones (ingestion, backfills, agent creation),
+# and EMBEDDING_INTERACTIVE_RESERVE of the slots are kept free of bulk work so
+# a query never waits for a long ingestion batch to finish.
+EMBEDDING_MAX_CONCURRENCY = getattr(settings, 'EMBEDDING_MAX_CONCURRENCY', EMBEDDING_MAX_IN_FLIGHT)
+EMBEDDING_INTERACTIVE_RESERVE = getattr(settings, 'EMBEDDING_INTERACTIVE_RESERVE', 1)
+# Retries of a call Ollama rejected as overloaded (HTTP 429/503), and the
+# bounds of the exponential pause applied to every lane meanwhile
+EMBEDDING_OVERLOAD_RETRIES = getattr(settings, 'EMBEDDING_OVERLOAD_RETRIES', 3)
+EMBEDDING_BACKOFF_BASE = getattr(settings, 'EMBEDDING_BACKOFF_BASE', 0.5)
+EMBEDDING_BACKOFF_MAX = getattr(settings, 'EMBEDDING_BACKOFF_MAX', 10)
+# The limits above apply within one process. Bulk calls of every process
+# sharing the database (web workers, ingest_worker, load_corpus,
+# backfill_embeddings) together also take at most EMBEDDING_GLOBAL_BULK_SLOTS
+# Ollama slots (see AdvisorySlots), so web workers' queries still find
+# capacity while bulk loads run elsewhere. Run Ollama with OLLAMA_NUM_PARALLEL
+# above it; 0 limits bulk calls per process only.
+EMBEDDING_GLOBAL_BULK_SLOTS = getattr(settings, 'EMBEDDING_GLOBAL_BULK_SLOTS', 2)
+# Seconds between attempts to take a global slot while all are held
+EMBEDDING_GLOBAL_SLOT_POLL = getattr(settings, 'EMBEDDING_GLOBAL_SLOT_POLL', 0.05)
+
+LANE_INTERACTIVE = 'interactive'
+LANE_BULK = 'bulk'
+LANES = (LANE_INTERACTIVE, LANE_BULK)  # highest priority first
+OVERLOAD_STATUSES = (429, 503)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide keep-alive session used for Ollama calls."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=EMBEDDING_MAX_IN_FLIGHT * 2,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+class OllamaOverloaded(RuntimeError):
+    """Ollama refused a request because it is busy; ``retry_after`` is in seconds, if it said."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _retry_after(response):
     try:
-        response = requests.post(
-            OLLAMA_API_URL,
-            json={"model": "nomic-embed-text:v1.5", "prompt": text}
-        )
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class _Waiter:
+    """A request queued for an Ollama slot; ``wake`` is called once it is granted."""
+
+    __slots__ = ('lane', 'wake', 'granted', 'cancelled')
+
+    def __init__(self, lane, wake):
+        self.lane = lane
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+
+def _new_db_connection():
+    from django.db import connections
+
+    wrapper = connections['default']
+    conn = wrapper.get_new_connection(wrapper.get_connection_params())
+    conn.autocommit = True
+    return conn
+
+
+class AdvisorySlots:
+    """
+    Cross-process semaphore of ``slots`` Postgres advisory locks.
+
+    The locks are held on one connection per process, opened on first use
+    and separate from Django's, so the slots of a crashed process are freed
+    with its connection. Taking a slot never blocks that connection: every
+    free slot is tried and callers poll while all are held elsewhere. When
+    the database cannot be reached, ``try_acquire`` returns ``UNLIMITED`` for
+    ``retry_interval`` seconds rather than stalling bulk work.
+    """
+
+    NAMESPACE = zlib.crc32(b'ollama-bulk-embeddings') & 0x7fffffff
+    UNLIMITED = -1
+
+    def __init__(self, slots, poll_interval=EMBEDDING_GLOBAL_SLOT_POLL, retry_interval=30, connect=_new_db_connection):
+        self.slots = slots
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self._connect = connect
+        self._conn = None
+        self._held = set()
+        self._unavailable_until = 0.0
+        self._lock = threading.Lock()
+
+    def _execute(self, sql, slot):
+        # Called with the lock held
+        if self._conn is None:
+            self._conn = self._connect()
+        with self._conn.cursor() as cursor:
+            cursor.execute(sql, [self.NAMESPACE, slot])
+            return cursor.fetchone()[0]
+
+    def _reset(self):
+        # The connection's locks go with it
+        conn, self._conn = self._conn, None
+        self._held.clear()
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def try_acquire(self):
+        """A slot now held by this process, ``None`` if all are taken, or ``UNLIMITED``."""
+        with self._lock:
+            if time.monotonic() < self._unavailable_until:
+                return self.UNLIMITED
+            try:
+                for slot in range(self.slots):
+                    # Advisory locks are re-entrant within a session: skip our own
+                    if slot not in self._held and self._execute("SELECT pg_try_advisory_lock(%s, %s)", slot):
+                        self._held.add(slot)
+                        return slot
+            except Exception as e:
+                self._reset()
+                self._unavailable_until = time.monotonic() + self.retry_interval
+                logger.warning(f"Cannot take cross-process embedding slots, limiting bulk calls per process: {e}")
+                return self.UNLIMITED
+        return None
+
+    def acquire(self):
+        """Block until ``try_acquire`` succeeds; pair with ``release``."""
+        while True:
+            slot = self.try_acquire()
+            if slot is not None:
+                return slot
+            time.sleep(self.poll_interval)
+
+    def release(self, slot):
+        with self._lock:
+            if slot not in self._held:
+                return
+            self._held.discard(slot)
+            try:
+                self._execute("SELECT pg_advisory_unlock(%s, %s)", slot)
+            except Exception:
+                self._reset()
+
+
+class EmbeddingScheduler:
+    """
+    Process-wide admission control for Ollama embedding calls.
+
+    At most ``max_concurrency`` calls run at once; waiting calls are started
+    in lane priority order (``LANES``), first come first served within a
+    lane, and bulk calls may only take ``max_concurrency - interactive_reserve``
+    slots. Calls for the same model and texts that overlap in time are merged
+    into one: later callers wait for the first one's result. When Ollama
+    answers 429/503, new calls are held back for an exponentially growing,
+    jittered pause (or its ``Retry-After``) and the rejected call is retried.
+
+    Slots are shared by threads and event loops: sync callers block on an
+    event and async callers await a future that is resolved thread-safely.
+    With ``global_slots`` (``AdvisorySlots``) a bulk call also holds one of
+    the slots shared by all processes while it runs.
+    """
+
+    def __init__(self, max_concurrency=EMBEDDING_MAX_CONCURRENCY, interactive_reserve=EMBEDDING_INTERACTIVE_RESERVE,
+                 max_retries=EMBEDDING_OVERLOAD_RETRIES, backoff_base=EMBEDDING_BACKOFF_BASE,
+                 backoff_max=EMBEDDING_BACKOFF_MAX, global_slots=None):
+        self.max_concurrency = max_concurrency
+        self.global_slots = global_slots
+        self.bulk_limit = max(1, max_concurrency - interactive_reserve)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.active = 0
+        self._queue = []  # heap of (lane priority, sequence, waiter)
+        self._sequence = itertools.count()
+        self._in_flight = {}  # (model, texts) -> Future of the call serving them
+        self._paused_until = 0.0
+        self._overloads = 0
+        self._lock = threading.Lock()
+
+    def _limit(self, lane):
+        return self.max_concurrency if lane == LANE_INTERACTIVE else self.bulk_limit
+
+    def _dispatch(self):
+        # Called with the lock held: start queued calls while slots allow
+        while self._queue and time.monotonic() >= self._paused_until:
+            _, _, waiter = self._queue[0]
+            if waiter.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if self.active >= self._limit(waiter.lane):
+                break
+            heapq.heappop(self._queue)
+            self.active += 1
+            waiter.granted = True
+            waiter.wake()
+
+    def _enqueue(self, waiter):
+        with self._lock:
+            heapq.heappush(self._queue, (LANES.index(waiter.lane), next(self._sequence), waiter))
+            self._dispatch()
+
+    def _resume(self):
+        with self._lock:
+            remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                self._dispatch()
+                return
+        self._resume_after(remaining)
+
+    def _resume_after(self, delay):
+        timer = threading.Timer(delay, self._resume)
+        timer.daemon = True
+        timer.start()
+
+    def acquire(self, lane):
+        """Block until a slot in ``lane`` is free; pair with ``release``."""
+        started = time.perf_counter()
+        event = threading.Event()
+        self._enqueue(_Waiter(lane, event.set))
+        event.wait()
+        metrics.ollama_queue_wait.observe(time.perf_counter() - started, lane=lane)
+
+    async def aacquire(self, lane):
+        """``acquire`` for coroutines; a cancelled wait gives its slot back."""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = _Waiter(lane, wake)
+        self._enqueue(waiter)
+        try:
+            await granted
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                if waiter.granted:
+                    self.active -= 1
+                    self._dispatch()
+            raise
+        metrics.ollama_queue_wait.observe(time.perf_counter() - started, lane=lane)
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+            self._dispatch()
+
+    def _overloaded(self, error):
+        with self._lock:
+            self._overloads += 1
+            delay = error.retry_after
+            if delay is None:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (self._overloads - 1))
+                delay *= random.uniform(0.5, 1.0)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        logger.warning(f"Ollama is overloaded, pausing embedding calls for {delay:.1f}s")
+        self._resume_after(delay)
+
+    def _succeeded(self):
+        with self._lock:
+            self._overloads = 0
+
+    def _uses_global_slots(self, lane):
+        return lane == LANE_BULK and self.global_slots is not None
+
+    def _call(self, lane, call):
+        if not self._uses_global_slots(lane):
+            return call()
+        slot = self.global_slots.acquire()
+        try:
+            return call()
+        finally:
+            self.global_slots.release(slot)
+
+    async def _acall(self, lane, call):
+        if not self._uses_global_slots(lane):
+            return await call()
+        try_acquire = sync_to_async(self.global_slots.try_acquire, thread_sensitive=False)
+        while (slot := await try_acquire()) is None:
+            await asyncio.sleep(self.global_slots.poll_interval)
+        try:
+            return await call()
+        finally:
+            await sync_to_async(self.global_slots.release, thread_sensitive=False)(slot)
+
+    def _join(self, model, texts):
+        """
+        ``(key, future, leader)``: the in-flight call for these texts, or a
+        new future that this caller (the leader) must run the call for.
+        """
+        key = (model, tuple(texts))
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return key, future, False
+            future = self._in_flight[key] = Future()
+            return key, future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            del self._in_flight[key]
+        if error is None:
+            future.set_result(result)
+        else:
+            if isinstance(error, asyncio.CancelledError):
+                error = RuntimeError("Embedding request was cancelled")
+            future.set_exception(error)
+
+    def run(self, lane, model, texts, call):
+        """Run ``call()`` (embedding ``texts`` with ``model``) under admission control."""
+        key, future, leader = self._join(model, texts)
+        if not leader:
+            metrics.ollama_coalesced.inc(lane=lane)
+            return future.result()
+        try:
+            for attempt in itertools.count():
+                self.acquire(lane)
+                try:
+                    result = self._call(lane, call)
+                    break
+                except OllamaOverloaded as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    self._overloaded(e)
+                finally:
+                    self.release()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._succeeded()
+        self._finish(key, future, result)
+        return result
+
+    async def arun(self, lane, model, texts, call):
+        """``run`` for a coroutine function ``call``."""
+        key, future, leader = self._join(model, texts)
+        if not leader:
+            metrics.ollama_coalesced.inc(lane=lane)
+            return await asyncio.wrap_future(future)
+        try:
+            for attempt in itertools.count():
+                await self.aacquire(lane)
+                try:
+                    result = await self._acall(lane, call)
+                    break
+                except OllamaOverloaded as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    self._overloaded(e)
+                finally:
+                    self.release()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._succeeded()
+        self._finish(key, future, result)
+        return result
+
+
+scheduler = EmbeddingScheduler(
+    global_slots=AdvisorySlots(EMBEDDING_GLOBAL_BULK_SLOTS) if EMBEDDING_GLOBAL_BULK_SLOTS else None,
+)
+
+
+def generate_embedding(text, model=EMBEDDING_MODEL, lane=LANE_BULK):
+    return generate_embeddings([text], model=model, lane=lane)[0]
+
+
+def _embed_batch(texts, model=EMBEDDING_MODEL):
+    try:
+        with metrics.ollama_in_flight.track():
+            response = get_session().post(
+                OLLAMA_EMBED_URL,
+                json={"model": model, "input": texts},
+                timeout=EMBEDDING_TIMEOUT,
+            )
+        if response.status_code in OVERLOAD_STATUSES:
+            metrics.ollama_requests.inc(outcome='overloaded')
+            raise OllamaOverloaded(
+                f"Failed to generate embeddings: Ollama is overloaded ({response.status_code})",
+                retry_after=_retry_after(response),
+            )
         response.raise_for_status()
         data = response.json()
-        if "embedding" not in data:
-            raise RuntimeError(f"Embedding not found in Ollama response: {data}")
-        return data["embedding"]
     except requests.RequestException as e:
-        raise RuntimeError(f"Failed to generate embedding: {e}")
+        metrics.ollama_requests.inc(outcome='error')
+        raise RuntimeError(f"Failed to generate embeddings: {e}")
+    metrics.ollama_requests.inc(outcome='ok')
+    metrics.embedded_texts.inc(len(texts))
+    embeddings = data.get("embeddings")
+    if not embeddings or len(embeddings) != len(texts):
+        raise RuntimeError(
+            f"Expected {len(texts)} embeddings from Ollama, got {len(embeddings or [])}"
+        )
+    return embeddings
+
+
+@metrics.timed('embedding')
+def generate_embeddings(texts, batch_size=None, max_in_flight=None, use_cache=True, model=EMBEDDING_MODEL,
+                        lane=LANE_BULK):
+    """
+    Embed many texts with ``model`` using Ollama's batch endpoint.
+
+    Texts already in the embedding cache are served from it; the rest are
+    de-duplicated, split into batches of ``batch_size`` and at most
+    ``max_in_flight`` batches are sent concurrently over the pooled session,
+    each admitted by the ``scheduler`` in ``lane`` (requests someone is
+    waiting on pass ``LANE_INTERACTIVE``). ``use_cache=False`` skips the
+    cache both ways (for one-off bulk loads). Embeddings are returned in the
+    same order as ``texts``.
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+    results = embedding_cache.get_many(model, texts) if use_cache else {}
+    missing = list(dict.fromkeys(text for index, text in enumerate(texts) if index not in results))
+    if missing:
+        computed = dict(zip(missing, _embed_uncached(missing, batch_size, max_in_flight, model, lane)))
+        if use_cache:
+            embedding_cache.set_many(model, missing, [computed[text] for text in missing])
+        for index, text in enumerate(texts):
+            if index not in results:
+                results[index] = computed[text]
+    return [results[index] for index in range(len(texts))]
+
+
+def _embed_uncached(texts, batch_size=None, max_in_flight=None, model=EMBEDDING_MODEL, lane=LANE_BULK):
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    max_in_flight = max_in_flight or EMBEDDING_MAX_IN_FLIGHT
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    def embed(batch):
+        return scheduler.run(lane, model, batch, lambda: _embed_batch(batch, model))
+
+    if len(batches) == 1:
+        return embed(batches[0])
+
+    embeddings = []
+    with ThreadPoolExecutor(max_workers=min(max_in_flight, len(batches))) as executor:
+        for batch_embeddings in executor.map(embed, batches):
+            embeddings.extend(batch_embeddings)
+    return embeddings
+
+
+async def _aembed_batch(texts, model=EMBEDDING_MODEL):
+    client = get_async_client(
+        'ollama',
+        timeout=EMBEDDING_TIMEOUT,
+        limits=httpx.Limits(max_connections=EMBEDDING_MAX_IN_FLIGHT * 2),
+    )
+    try:
+        with metrics.ollama_in_flight.track():
+            response = await client.post(OLLAMA_EMBED_URL, json={"model": model, "input": texts})
+        if response.status_code in OVERLOAD_STATUSES:
+            metrics.ollama_requests.inc(outcome='overloaded')
+            raise OllamaOverloaded(
+                f"Failed to generate embeddings: Ollama is overloaded ({response.status_code})",
+                retry_after=_retry_after(response),
+            )
+        response.raise_for_status()
+        data = response.json()
+    except httpx.HTTPError as e:
+        metrics.ollama_requests.inc(outcome='error')
+        raise RuntimeError(f"Failed to generate embeddings: {e}")
+    metrics.ollama_requests.inc(outcome='ok')
+    metrics.embedded_texts.inc(len(texts))
+    embeddings = data.get("embeddings")
+    if not embeddings or len(embeddings) != len(texts):
+        raise RuntimeError(
+            f"Expected {len(texts)} embeddings from Ollama, got {len(embeddings or [])}"
+        )
+    return embeddings
+
+
+@metrics.timed('embedding')
+async def agenerate_embeddings(texts, batch_size=None, max_in_flight=None, model=EMBEDDING_MODEL, lane=LANE_BULK):
+    """Async counterpart of ``generate_embeddings`` using the pooled httpx client."""
+    texts = list(texts)
+    if not texts:
+        return []
+    results = await sync_to_async(embedding_cache.get_many)(model, texts)
+    missing = list(dict.fromkeys(text for index, text in enumerate(texts) if index not in results))
+    if missing:
+        batch_size = batch_size or EMBEDDING_BATCH_SIZE
+        semaphore = asyncio.Semaphore(max_in_flight or EMBEDDING_MAX_IN_FLIGHT)
+
+        async def embed(batch):
+            async with semaphore:
+                return await scheduler.arun(lane, model, batch, lambda: _aembed_batch(batch, model))
+
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        computed = [embedding for batch in await asyncio.gather(*map(embed, batches)) for embedding in batch]
+        await sync_to_async(embedding_cache.set_many)(model, missing, computed)
+        computed = dict(zip(missing, computed))
+        for index, text in enumerate(texts):
+            if index not in results:
+                results[index] = computed[text]
+    return [results[index] for index in range(len(texts))]
+
+
+async def agenerate_embedding(text, model=EMBEDDING_MODEL, lane=LANE_BULK):
+    return (await agenerate_embeddings([text], model=model, lane=lane))[0]
+
 
-        
 def count_tokens(text):
     """Estimate tokens by counting words."""
     words = re.split(r'\s+', text.strip())
     return len(words)
 
-def cosine_similarity(a: List[float], b: List[float]) -> float:
-    a = np.array(a)
-    b = np.array(b)
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
\ No newline at end of file
+def cosine_similarity(a: List[float], b) -> Union[float, np.ndarray]:
+    """
+    Cosine similarity of ``a`` with ``b``. ``b`` may be a single vector or a
+    2-D array of vectors, in which case an array of similarities is returned
+    from one matrix-vector product. Zero vectors have similarity 0.
+    """
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    norms = np.linalg.norm(b, axis=-1) * np.linalg.norm(a)
+    similarities = np.divide(b @ a, norms, out=np.zeros_like(norms), where=norms != 0)
+    return float(similarities) if similarities.ndim == 0 else similarities
@@ -0,0 +1,327 @@
+import hashlib
+import logging
+from collections import defaultdict
+from django.db import transaction
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from ..models import ChunkEmbedding, Document, DocumentChunk, IngestionJob
+from .chunking import iter_chunks
+from .embeddings import generate_embeddings, agenerate_embeddings, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_IN_FLIGHT
+from .embedding_models import COLUMN_EMBEDDING_MODEL, get_embedding_model, live_models
+from .metrics import span
+from .answer_cache import answer_cache
+from .. import database
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _validate_embedding(index, embedding, model=COLUMN_EMBEDDING_MODEL):
+    if not embedding or len(embedding) != get_embedding_model(model).dimensions:
+        logger.error(f"Embedding inválido ({model}) para chunk {index}: {embedding}")
+        raise ValueError(f"Embedding inválido ({model}) para chunk {index}")
+
+
+def embed_live_models(texts, start=0, models=None):
+    """
+    Embed ``texts`` with every live model (see ``embedding_models.live_models``),
+    so chunks written during a model migration get vectors for both the old
+    and the new model. Returns ``{model: embeddings}``; ``start`` is the
+    chunk index of ``texts[0]``, for error messages.
+    """
+    vectors = {}
+    for model in models or live_models():
+        embeddings = generate_embeddings(texts, model=model)
+        for offset, embedding in enumerate(embeddings):
+            _validate_embedding(start + offset, embedding, model)
+        vectors[model] = embeddings
+    return vectors
+
+
+def _new_chunk(vectors, position, **fields):
+    """
+    An unsaved ``DocumentChunk`` holding the column model's vector (if that
+    model is live) and, in ``unsaved_model_embeddings``, the other models'
+    vectors for ``store_model_embeddings``.
+    """
+    column = vectors.get(COLUMN_EMBEDDING_MODEL)
+    chunk = DocumentChunk(embedding=column[position] if column is not None else None, **fields)
+    chunk.unsaved_model_embeddings = {
+        model: embeddings[position] for model, embeddings in vectors.items() if model != COLUMN_EMBEDDING_MODEL
+    }
+    return chunk
+
+
+def store_model_embeddings(chunk_objects):
+    """Write the ``unsaved_model_embeddings`` of chunks saved by ``bulk_create``."""
+    ChunkEmbedding.objects.bulk_create([
+        ChunkEmbedding(chunk_id=chunk.id, model=model, embedding=embedding)
+        for chunk in chunk_objects
+        for model, embedding in getattr(chunk, 'unsaved_model_embeddings', {}).items()
+    ], batch_size=500)
+
+
+def prepare_chunks(document, progress=None):
+    """
+    Chunk and embed ``document.markdown`` without touching the database.
+
+    Chunks are embedded in windows of ``EMBEDDING_BATCH_SIZE * EMBEDDING_MAX_IN_FLIGHT``
+    so ``progress(done, total)`` can be reported between windows. Returns
+    unsaved ``(chunk_objects, token_count)`` ready for ``store_chunks``.
+    """
+    with span('chunking'):
+        chunks = list(iter_chunks(document.markdown))
+    total = len(chunks)
+    logger.info(f"Chunks gerados: {total}")
+    if progress:
+        progress(0, total)
+
+    window = EMBEDDING_BATCH_SIZE * EMBEDDING_MAX_IN_FLIGHT
+    models = live_models()
+    chunk_objects = []
+    for start in range(0, total, window):
+        window_chunks = chunks[start:start + window]
+        vectors = embed_live_models([chunk.text for chunk in window_chunks], start=start, models=models)
+        for offset, chunk in enumerate(window_chunks):
+            chunk_objects.append(_new_chunk(
+                vectors, offset,
+                document=document,
+                chunk_text=chunk.text,
+                chunk_index=start + offset,
+                start_offset=chunk.start,
+                end_offset=chunk.end,
+                content_hash=content_hash(chunk.text)
+            ))
+        if progress:
+            progress(len(chunk_objects), total)
+    return chunk_objects, sum(chunk.tokens for chunk in chunks)
+
+
+def store_chunks(document, chunk_objects, token_count):
+    """Write prepared chunks and the token count in a single transaction."""
+    with span('bulk_insert'), transaction.atomic():
+        DocumentChunk.objects.bulk_create(chunk_objects, batch_size=500)
+        store_model_embeddings(chunk_objects)
+        document.token_count = token_count
+        document.save(update_fields=['token_count'])
+
+
+def ingest_document(document, progress=None):
+    """
+    Chunk, embed and store ``document``. All chunks are written in one
+    transaction at the end, so a failure never leaves a partially indexed
+    document behind. Returns the number of chunks stored.
+    """
+    chunk_objects, token_count = prepare_chunks(document, progress=progress)
+    store_chunks(document, chunk_objects, token_count)
+    return len(chunk_objects)
+
+
+async def aingest_document(document):
+    """
+    Async ``ingest_document``: chunks are embedded over the pooled async
+    Ollama client and written with one binary COPY on the asyncpg pool (see
+    ``api.database``), in the same single transaction. With the pool
+    disabled they are written through the ORM instead.
+    """
+    with span('chunking'):
+        chunks = list(iter_chunks(document.markdown))
+    logger.info(f"Chunks gerados: {len(chunks)}")
+    texts = [chunk.text for chunk in chunks]
+    vectors = {}
+    for model in await sync_to_async(live_models)():
+        vectors[model] = await agenerate_embeddings(texts, model=model)
+        for index, embedding in enumerate(vectors[model]):
+            _validate_embedding(index, embedding, model)
+    token_count = sum(chunk.tokens for chunk in chunks)
+    if not database.DB_POOL_ENABLED:
+        chunk_objects = [
+            _new_chunk(
+                vectors, index,
+                document=document,
+                chunk_text=chunk.text,
+                chunk_index=index,
+                start_offset=chunk.start,
+                end_offset=chunk.end,
+                content_hash=content_hash(chunk.text)
+            )
+            for index, chunk in enumerate(chunks)
+        ]
+        await sync_to_async(store_chunks)(document, chunk_objects, token_count)
+        return len(chunk_objects)
+    column = vectors.get(COLUMN_EMBEDDING_MODEL)
+    rows = [
+        (
+            document.id, chunk.text, column[index] if column is not None else None,
+            index, chunk.start, chunk.end, content_hash(chunk.text),
+        )
+        for index, chunk in enumerate(chunks)
+    ]
+    model_rows = [
+        (index, model, embedding)
+        for model, embeddings in vectors.items() if model != COLUMN_EMBEDDING_MODEL
+        for index, embedding in enumerate(embeddings)
+    ]
+    with span('bulk_insert'):
+        await database.store_chunks(document.id, rows, token_count, model_rows=model_rows)
+    document.token_count = token_count
+    return len(rows)
+
+
+class ReindexConflict(Exception):
+    """The document's chunks changed while a re-index was being prepared."""
+
+
+def reindex_document(document, markdown):
+    """
+    Replace ``document.markdown`` and update its chunks incrementally.
+
+    The new markdown is re-chunked and each chunk's content hash is matched
+    against the existing rows: unchanged chunks keep their row and embedding,
+    only new or edited chunks are embedded, and chunks that disappeared are
+    deleted. Embedding happens before the write transaction so row locks are
+    held only for the actual delete/renumber/insert. Returns a summary dict.
+    """
+    with span('chunking'):
+        new_chunks = list(iter_chunks(markdown))
+    new_hashes = [content_hash(chunk.text) for chunk in new_chunks]
+
+    existing = list(document.chunks.only('id', 'chunk_text', 'content_hash').order_by('chunk_index'))
+    available = defaultdict(list)
+    for row in existing:
+        available[row.content_hash or content_hash(row.chunk_text)].append(row)
+
+    reused = {}  # new chunk index -> existing row
+    for index, digest in enumerate(new_hashes):
+        if available[digest]:
+            reused[index] = available[digest].pop(0)
+    to_embed = [index for index in range(len(new_chunks)) if index not in reused]
+    removed_ids = [row.id for rows in available.values() for row in rows]
+
+    vectors = embed_live_models([new_chunks[index].text for index in to_embed])
+
+    with span('bulk_insert'), transaction.atomic():
+        Document.objects.select_for_update().get(pk=document.pk)
+        current_ids = set(document.chunks.values_list('id', flat=True))
+        if current_ids != {row.id for row in existing}:
+            raise ReindexConflict(f"Document {document.id} was modified concurrently")
+
+        DocumentChunk.objects.filter(id__in=removed_ids).delete()
+        answer_cache.invalidate_chunks(removed_ids)
+
+        # Move kept rows out of the way first so renumbering never collides
+        # with the (document, chunk_index) unique constraint.
+        kept = list(reused.items())
+        for position, (index, row) in enumerate(kept):
+            row.chunk_index = -(position + 1)
+        DocumentChunk.objects.bulk_update([row for _, row in kept], ['chunk_index'], batch_size=500)
+        for index, row in kept:
+            chunk = new_chunks[index]
+            row.chunk_index = index
+            row.start_offset = chunk.start
+            row.end_offset = chunk.end
+            row.content_hash = new_hashes[index]
+        DocumentChunk.objects.bulk_update(
+            [row for _, row in kept],
+            ['chunk_index', 'start_offset', 'end_offset', 'content_hash'],
+            batch_size=500,
+        )
+
+        created = DocumentChunk.objects.bulk_create([
+            _new_chunk(
+                vectors, position,
+                document=document,
+                chunk_text=new_chunks[index].text,
+                chunk_index=index,
+                start_offset=new_chunks[index].start,
+                end_offset=new_chunks[index].end,
+                content_hash=new_hashes[index]
+            )
+            for position, index in enumerate(to_embed)
+        ], batch_size=500)
+        store_model_embeddings(created)
+
+        document.markdown = markdown
+        document.token_count = sum(chunk.tokens for chunk in new_chunks)
+        document.save(update_fields=['markdown', 'token_count', 'updated_at'])
+
+    logger.info(
+        f"Document {document.id} re-indexed: {len(to_embed)} embedded, "
+        f"{len(reused)} unchanged, {len(removed_ids)} removed"
+    )
+    return {
+        "document_id": document.id,
+        "chunks_total": len(new_chunks),
+        "chunks_embedded": len(to_embed),
+        "chunks_unchanged": len(reused),
+        "chunks_removed": len(removed_ids),
+    }
+
+
+def enqueue_ingestion(document):
+    """Queue ``document`` for background ingestion and return the job."""
+    return IngestionJob.objects.create(document=document)
+
+
+def claim_next_job(stale_after=None):
+    """
+    Atomically claim the oldest queued job, or ``None`` if the queue is empty.
+
+    ``SELECT ... FOR UPDATE SKIP LOCKED`` lets many workers poll the same table
+    without handing out a job twice. Running jobs that have not reported
+    progress for ``stale_after`` (a timedelta) are treated as abandoned by a
+    dead worker and claimed again.
+    """
+    with transaction.atomic():
+        jobs = IngestionJob.objects.select_for_update(skip_locked=True)
+        job = jobs.filter(status=IngestionJob.STATUS_QUEUED).order_by('created_at').first()
+        if job is None and stale_after is not None:
+            job = jobs.filter(
+                status=IngestionJob.STATUS_RUNNING,
+                updated_at__lt=timezone.now() - stale_after,
+            ).order_by('updated_at').first()
+        if job is None:
+            return None
+        job.status = IngestionJob.STATUS_RUNNING
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.error = ''
+        job.save(update_fields=['status', 'attempts', 'started_at', 'error', 'updated_at'])
+        return job
+
+
+def run_job(job):
+    """Run a claimed ingestion job, recording progress and the final status."""
+    def progress(done, total):
+        IngestionJob.objects.filter(pk=job.pk).update(
+            chunks_done=done, chunks_total=total, updated_at=timezone.now()
+        )
+
+    try:
+        # A retried job must not duplicate chunks written by an earlier attempt
+        stale_ids = list(job.document.chunks.values_list('id', flat=True))
+        job.document.chunks.all().delete()
+        answer_cache.invalidate_chunks(stale_ids)
+        total = ingest_document(job.document, progress=progress)
+    except Exception as e:
+        logger.error(f"Ingestion job {job.id} failed for document {job.document_id}: {str(e)}")
+        IngestionJob.objects.filter(pk=job.pk).update(
+            status=IngestionJob.STATUS_FAILED,
+            error=str(e),
+            finished_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        return False
+
+    IngestionJob.objects.filter(pk=job.pk).update(
+        status=IngestionJob.STATUS_DONE,
+        chunks_done=total,
+        chunks_total=total,
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    logger.info(f"Ingestion job {job.id} finished document {job.document_id} with {total} chunks")
+    return True
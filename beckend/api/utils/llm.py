@@ -1,41 +1,132 @@
 import httpx
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
-from dotenv import load_dotenv
-
-load_dotenv()
+from .clients import get_async_client
+from . import metrics
 
 XAI_API_KEY = os.getenv('XAI_API_KEY')
-XAI_API_URL = 'https://api.x.ai/v1/chat/completions'
+XAI_BASE_URL = os.getenv('XAI_BASE_URL', 'https://api.x.ai/v1').rstrip('/')
+XAI_API_URL = f'{XAI_BASE_URL}/chat/completions'
+XAI_MODEL = 'grok-2-latest'
+XAI_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+# Completions requested concurrently by generate_responses_sync
+XAI_MAX_IN_FLIGHT = 8
 
-async def generate_response(query: str, context: str) -> str:
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            XAI_API_URL,
-            headers={
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {XAI_API_KEY}'
+_client = None
+
+
+def _get_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        _client = httpx.Client(timeout=XAI_TIMEOUT)
+    return _client
+
+
+def _headers() -> Dict[str, str]:
+    return {
+        'Content-Type': 'application/json',
+        'Authorization': f'Bearer {XAI_API_KEY}'
+    }
+
+
+def _payload(query: str, context: str, stream: bool) -> Dict:
+    payload = {
+        'messages': [
+            {
+                'role': 'system',
+                'content': f'You are a helpful AI assistant that answers questions based on the provided context. Context: {context}'
             },
-            json={
-                'messages': [
-                    {
-                        'role': 'system',
-                        'content': f'You are a helpful AI assistant that answers questions based on the provided context. Context: {context}'
-                    },
-                    {
-                        'role': 'user',
-                        'content': query
-                    }
-                ],
-                'model': 'grok-2-latest',
-                'stream': False,
-                'temperature': 0.1,
-                'max_tokens': 1000
+            {
+                'role': 'user',
+                'content': query
             }
-        )
-        
+        ],
+        'model': XAI_MODEL,
+        'stream': stream,
+        'temperature': 0.1,
+        'max_tokens': 1000
+    }
+    if stream:
+        payload['stream_options'] = {'include_usage': True}
+    return payload
+
+
+def _parse_completion(response: httpx.Response) -> str:
+    if response.status_code != 200:
+        raise Exception(f"Failed to generate response: {response.text}")
+    data = response.json()
+    return data['choices'][0]['message']['content']
+
+
+@metrics.timed('llm')
+async def generate_response(query: str, context: str) -> str:
+    client = get_async_client('xai', timeout=XAI_TIMEOUT)
+    response = await client.post(
+        XAI_API_URL,
+        headers=_headers(),
+        json=_payload(query, context, stream=False)
+    )
+    return _parse_completion(response)
+
+
+@metrics.timed('llm')
+def generate_response_sync(query: str, context: str) -> str:
+    """Blocking ``generate_response`` for sync views, on the shared pooled client."""
+    response = _get_client().post(
+        XAI_API_URL,
+        headers=_headers(),
+        json=_payload(query, context, stream=False)
+    )
+    return _parse_completion(response)
+
+
+def generate_responses_sync(requests, max_in_flight=XAI_MAX_IN_FLIGHT):
+    """
+    Run ``generate_response_sync`` for each ``(query, context)`` pair with up
+    to ``max_in_flight`` requests in flight on the shared client. Returns the
+    answers in order; a failed request yields its exception instead.
+    """
+    def run(item):
+        try:
+            return generate_response_sync(*item)
+        except Exception as e:
+            return e
+
+    if len(requests) <= 1:
+        return [run(item) for item in requests]
+    with ThreadPoolExecutor(max_workers=min(max_in_flight, len(requests))) as executor:
+        return list(executor.map(run, requests))
+
+
+def stream_response(query: str, context: str):
+    """
+    Stream a completion from xAI.
+
+    Yields ``{"type": "token", "content": str}`` for every content delta and,
+    if the API reports it, a final ``{"type": "usage", "usage": dict}``.
+    """
+    with metrics.span('llm_stream'), _get_client().stream(
+        'POST',
+        XAI_API_URL,
+        headers=_headers(),
+        json=_payload(query, context, stream=True)
+    ) as response:
         if response.status_code != 200:
+            response.read()
             raise Exception(f"Failed to generate response: {response.text}")
-            
-        data = response.json()
-        return data['choices'][0]['message']['content']
\ No newline at end of file
+
+        for line in response.iter_lines():
+            if not line.startswith('data:'):
+                continue
+            data = line[len('data:'):].strip()
+            if data == '[DONE]':
+                break
+            chunk = json.loads(data)
+            for choice in chunk.get('choices', []):
+                content = choice.get('delta', {}).get('content')
+                if content:
+                    yield {'type': 'token', 'content': content}
+            if chunk.get('usage'):
+                yield {'type': 'usage', 'usage': chunk['usage']}
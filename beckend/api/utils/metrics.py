@@ -0,0 +1,228 @@
+import bisect
+import contextvars
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from django.conf import settings
+
+# Turns every span, counter and the Server-Timing header into a no-op
+METRICS_ENABLED = getattr(settings, 'METRICS_ENABLED', True)
+
+# Seconds; spans range from sub-millisecond searches to multi-second LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Spans recorded during the current request, for the Server-Timing header.
+# Holds a list that is appended to (not replaced), so spans recorded inside
+# sync_to_async threads reach the request that started them.
+_request_spans = contextvars.ContextVar('request_spans', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def set(self, value, **labels):
+        """Set the value outright (used by scrape-time collectors)."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the block as in progress while it runs."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _render_value(self, key, value):
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.label_names, key, [f'le="{bound}"'])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {total}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """``collector()`` returns extra metrics computed at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for metric in collector():
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+stage_duration = registry.register(Histogram(
+    'rag_stage_duration_seconds', "Time spent in each pipeline stage.", labels=('stage',),
+))
+request_duration = registry.register(Histogram(
+    'rag_http_request_duration_seconds', "Request handling time by route.", labels=('route', 'method', 'status'),
+))
+ollama_in_flight = registry.register(Gauge(
+    'rag_ollama_requests_in_flight', "Embedding requests currently waiting on Ollama.",
+))
+ollama_in_flight.set(0)
+ollama_requests = registry.register(Counter(
+    'rag_ollama_requests_total', "Embedding requests sent to Ollama.", labels=('outcome',),
+))
+embedded_texts = registry.register(Counter(
+    'rag_embedded_texts_total', "Texts embedded by Ollama (embedding cache misses).",
+))
+ollama_queue_wait = registry.register(Histogram(
+    'rag_ollama_queue_wait_seconds', "Time embedding requests waited for an Ollama slot, by lane.", labels=('lane',),
+))
+ollama_coalesced = registry.register(Counter(
+    'rag_ollama_coalesced_total', "Embedding requests served by an identical request already in flight.",
+    labels=('lane',),
+))
+
+
+@contextmanager
+def span(stage):
+    """
+    Time the enclosed block as pipeline ``stage``: it is observed in the
+    stage histogram and, during a request, reported in ``Server-Timing``.
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, stage=stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+
+def timed(stage):
+    """Decorator form of ``span`` for plain and async functions."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_request():
+    """Start collecting spans for the current request; returns a reset token."""
+    return _request_spans.set([])
+
+
+def finish_request(token):
+    """Stop collecting and return the ``Server-Timing`` header value."""
+    spans = _request_spans.get() or []
+    _request_spans.reset(token)
+    totals = {}
+    for stage, elapsed in spans:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    return ', '.join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in totals.items())
@@ -0,0 +1,103 @@
+import threading
+import time
+from django.db import connection
+from ..models import DocumentChunk, EMBEDDING_DIMENSIONS
+
+# Compact HNSW indexes over DocumentChunk.embedding, for when the float32 HNSW
+# index no longer fits in memory. They are opt-in (see the quantize_embeddings
+# command) and index an expression rather than a stored copy of the vectors,
+# so the chunk table does not grow: quantized_search orders by the same
+# expression and Postgres matches it to the index.
+QUANTIZED_INDEXES = {
+    'half': (
+        'chunk_embedding_half_hnsw',
+        f'(embedding::halfvec({EMBEDDING_DIMENSIONS}))', 'halfvec_cosine_ops',
+    ),
+    'binary': (
+        'chunk_embedding_binary_hnsw',
+        f'(binary_quantize(embedding)::bit({EMBEDDING_DIMENSIONS}))', 'bit_hamming_ops',
+    ),
+}
+
+# The full-precision index declared on DocumentChunk. Once searches pass a
+# quantization it only serves exact-precision searches and can be dropped to
+# free its memory (quantize_embeddings --drop-float-index); plain vector
+# searches then scan the table.
+FLOAT_INDEX = 'chunk_embedding_hnsw'
+FLOAT_INDEX_SQL = (
+    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {FLOAT_INDEX} ON {DocumentChunk._meta.db_table} "
+    f"USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+)
+
+# Seconds a worker trusts its view of which quantized indexes exist
+QUANTIZED_INDEX_REFRESH_INTERVAL = 60
+
+
+def index_exists(name):
+    """Whether ``name`` is a valid (completely built) index."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", [name])
+        row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def create_quantized_index(quantization):
+    """
+    Build the ``quantization`` index concurrently, so neither searches nor
+    writes are blocked. Must run outside a transaction.
+    """
+    name, expression, opclass = QUANTIZED_INDEXES[quantization]
+    with connection.cursor() as cursor:
+        # An interrupted concurrent build leaves an invalid index behind
+        if not index_exists(name):
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        cursor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {DocumentChunk._meta.db_table} "
+            f"USING hnsw ({expression} {opclass}) WITH (m = 16, ef_construction = 64)"
+        )
+    quantized_indexes.invalidate()
+
+
+def drop_quantized_index(quantization):
+    name = QUANTIZED_INDEXES[quantization][0]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    quantized_indexes.invalidate()
+
+
+def drop_float_index():
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {FLOAT_INDEX}")
+
+
+def restore_float_index():
+    with connection.cursor() as cursor:
+        cursor.execute(FLOAT_INDEX_SQL)
+
+
+class QuantizedIndexes:
+    """Per-process cache of the quantizations whose index is built."""
+
+    def __init__(self, refresh_interval=QUANTIZED_INDEX_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._built = frozenset()
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._checked_at = None
+
+    def get(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.refresh_interval:
+            with self._lock:
+                if self._checked_at is None or time.monotonic() - self._checked_at >= self.refresh_interval:
+                    self._built = frozenset(
+                        quantization for quantization, (name, _, _) in QUANTIZED_INDEXES.items()
+                        if index_exists(name)
+                    )
+                    self._checked_at = time.monotonic()
+        return self._built
+
+
+quantized_indexes = QuantizedIndexes()
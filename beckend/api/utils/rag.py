@@ -1,73 +1,116 @@
 import os
-from openai import OpenAI
-from langchain_core.language_models import BaseChatModel
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_core.outputs import ChatGeneration, ChatResult
-from langchain_core.retrievers import BaseRetriever
-from langchain_core.documents import Document
-from langchain.chains import RetrievalQA
-import requests
-from typing import List, Optional
-
-# Inicializa o client X.AI (OpenAI compatible)
-client = OpenAI(
-    api_key=os.environ.get("XAI_API_KEY"),
-    base_url="https://api.x.ai/v1",
-)
-
-class XAIChat(BaseChatModel):
-    model: str
-
-    def __init__(self, model: str = "grok-3"):
-        super().__init__(model=model)
-        self.model = model
-
-    def _generate(self, messages: List[HumanMessage | AIMessage], stop: Optional[List[str]] = None) -> ChatResult:
-        # Converte mensagens para o formato esperado pelo client
-        api_messages = [
-            {"role": "user" if isinstance(msg, HumanMessage) else "assistant", "content": msg.content}
-            for msg in messages
-        ]
-        # Exemplo: pode adicionar uma mensagem system se desejar
-        # api_messages.insert(0, {"role": "system", "content": "You are a PhD-level mathematician."})
-        response = client.chat.completions.create(
-            model=self.model,
-            messages=api_messages,
-        )
-        content = response.choices[0].message.content
-        message = AIMessage(content=content)
-        generation = ChatGeneration(message=message)
-        return ChatResult(generations=[generation])
-
-    @property
-    def _llm_type(self) -> str:
-        return "xai-chat"
-
-class CustomRetriever(BaseRetriever):
-    def _get_relevant_documents(self, query: str) -> list[Document]:
-        try:
-            response = requests.post("http://127.0.0.1:8000/api/documents/search/", json={"query": query})
-            response.raise_for_status()
-            results = response.json().get("results", [])
-            documents = [
-                Document(
-                    page_content=result["chunk_text"],
-                    metadata={"document_id": result["document_id"], "chunk_id": result["chunk_id"]}
+from typing import Optional
+from asgiref.sync import sync_to_async
+from .search import retrieve, aretrieve
+from .embedding_models import active_model
+from .clients import lazy, loop_local
+from .llm import XAI_BASE_URL
+from .metrics import span
+from .context import assemble_context
+from .answer_cache import cached_answer, acached_answer, prompt_namespace
+
+# The OpenAI SDK and LangChain take seconds to import, so the client, the LLM
+# and the chains (see ``rag_chain``) are built on first use rather than at
+# import: management commands, migrations and tests that never answer a
+# question do not pay for them. Serving workers can build them up front with
+# ``ApiConfig.warm_up``.
+
+
+@lazy
+def get_openai_client():
+    """The X.AI client (OpenAI compatible) shared by sync LLM calls."""
+    from openai import OpenAI
+
+    return OpenAI(
+        api_key=os.environ.get("XAI_API_KEY"),
+        base_url=XAI_BASE_URL,
+    )
+
+
+def get_async_openai_client():
+    """Long-lived AsyncOpenAI client (and connection pool) of the running loop."""
+    from openai import AsyncOpenAI
+
+    return loop_local("xai-openai", lambda: AsyncOpenAI(
+        api_key=os.environ.get("XAI_API_KEY"),
+        base_url=XAI_BASE_URL,
+    ))
+
+
+@lazy
+def get_llm():
+    from .rag_chain import XAIChat
+
+    return XAIChat(model="grok-3")
+
+
+@lazy
+def get_qa_chain():
+    from .rag_chain import build_qa_chain
+
+    return build_qa_chain(get_llm())
+
+
+@lazy
+def get_agent_chain():
+    """The "stuff" chain whose system message starts with a routed agent's prompt."""
+    from .rag_chain import build_agent_chain
+
+    return build_agent_chain(get_llm())
+
+
+def chunks_to_documents(chunks):
+    """
+    LangChain documents for the passages ``assemble_context`` picks from
+    ``chunks``: overlapping chunks merged, near-duplicates dropped and the
+    total kept within the context token budget.
+    """
+    from .rag_chain import to_documents
+
+    return to_documents(assemble_context(chunks))
+
+
+def answer_query(query: str, agent_prompt: Optional[str] = None):
+    """
+    Run the RAG pipeline in-process: one query embedding, one search and one
+    LLM call. Returns ``(answer, chunks)``.
+
+    Retrieval is done here rather than through ``get_qa_chain().invoke`` so
+    the retrieved chunks can be returned alongside the answer without
+    searching a second time; only the "stuff" step of the chain is invoked.
+    ``agent_prompt`` (e.g. a routed agent's prompt) leads the system message.
+    """
+    model = active_model()
+    query_embedding, chunks = retrieve(query, model=model)
+
+    def generate():
+        documents = chunks_to_documents(chunks)
+        with span('llm'):
+            if agent_prompt:
+                return get_agent_chain().invoke({"context": documents, "question": query, "agent_prompt": agent_prompt})
+            output = get_qa_chain().combine_documents_chain.invoke({"input_documents": documents, "question": query})
+        return output["output_text"]
+
+    answer, _ = cached_answer(prompt_namespace('rag', agent_prompt, model), query_embedding, chunks, generate)
+    return answer, chunks
+
+
+async def aanswer_query(query: str, agent_prompt: Optional[str] = None):
+    """Async ``answer_query`` for the ASGI views."""
+    model = await sync_to_async(active_model)()
+    query_embedding, chunks = await aretrieve(query, model=model)
+
+    async def generate():
+        documents = chunks_to_documents(chunks)
+        with span('llm'):
+            if agent_prompt:
+                return await get_agent_chain().ainvoke(
+                    {"context": documents, "question": query, "agent_prompt": agent_prompt}
                 )
-                for result in results
-            ]
-            return documents
-        except Exception as e:
-            print(f"Error in CustomRetriever: {str(e)}")
-            return []
-
-# Initialize LLM and QA chain
-llm = XAIChat(
-    model="grok-3"
-)
-retriever = CustomRetriever()
-qa_chain = RetrievalQA.from_chain_type(
-    llm=llm,
-    chain_type="stuff",
-    retriever=retriever
-)
+            output = await get_qa_chain().combine_documents_chain.ainvoke(
+                {"input_documents": documents, "question": query}
+            )
+        return output["output_text"]
+
+    answer, _ = await acached_answer(prompt_namespace('rag', agent_prompt, model), query_embedding, chunks, generate)
+    return answer, chunks
@@ -0,0 +1,104 @@
+import logging
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.documents import Document
+from langchain.chains import RetrievalQA
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from typing import List, Optional
+from .search import retrieve
+from .rag import chunks_to_documents, get_openai_client, get_async_openai_client
+
+logger = logging.getLogger(__name__)
+
+# LangChain pieces of the RAG pipeline. Importing LangChain takes seconds, so
+# this module is only imported by the getters in ``rag`` on first use.
+
+
+class XAIChat(BaseChatModel):
+    model: str
+
+    def __init__(self, model: str = "grok-3"):
+        super().__init__(model=model)
+        self.model = model
+
+    @staticmethod
+    def _to_api_messages(messages: List[HumanMessage | AIMessage]) -> list[dict]:
+        # Converte mensagens para o formato esperado pelo client
+        roles = {HumanMessage: "user", SystemMessage: "system"}
+        return [
+            {"role": roles.get(type(msg), "assistant"), "content": msg.content}
+            for msg in messages
+        ]
+
+    @staticmethod
+    def _to_result(response) -> ChatResult:
+        content = response.choices[0].message.content
+        message = AIMessage(content=content)
+        generation = ChatGeneration(message=message)
+        return ChatResult(generations=[generation])
+
+    def _generate(self, messages: List[HumanMessage | AIMessage], stop: Optional[List[str]] = None) -> ChatResult:
+        api_messages = self._to_api_messages(messages)
+        # Exemplo: pode adicionar uma mensagem system se desejar
+        # api_messages.insert(0, {"role": "system", "content": "You are a PhD-level mathematician."})
+        response = get_openai_client().chat.completions.create(
+            model=self.model,
+            messages=api_messages,
+        )
+        return self._to_result(response)
+
+    async def _agenerate(self, messages: List[HumanMessage | AIMessage], stop: Optional[List[str]] = None) -> ChatResult:
+        response = await get_async_openai_client().chat.completions.create(
+            model=self.model,
+            messages=self._to_api_messages(messages),
+        )
+        return self._to_result(response)
+
+    @property
+    def _llm_type(self) -> str:
+        return "xai-chat"
+
+
+def to_documents(passages) -> list[Document]:
+    return [
+        Document(
+            page_content=passage.text,
+            metadata={"document_id": passage.document_id, "chunk_ids": list(passage.chunk_ids)}
+        )
+        for passage in passages
+    ]
+
+
+class CustomRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query: str) -> list[Document]:
+        try:
+            _, chunks = retrieve(query)
+            return chunks_to_documents(chunks)
+        except Exception as e:
+            logger.error(f"Error in CustomRetriever: {str(e)}")
+            return []
+
+
+# "stuff" chain whose system message starts with a routed agent's prompt
+AGENT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     "{agent_prompt}\n\nUse the following pieces of context to answer the user's question. "
+     "If you don't know the answer, just say that you don't know, don't try to make up an answer."
+     "\n----------------\n{context}"),
+    ("human", "{question}"),
+])
+
+
+def build_qa_chain(llm):
+    return RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type="stuff",
+        retriever=CustomRetriever()
+    )
+
+
+def build_agent_chain(llm):
+    return create_stuff_documents_chain(llm, AGENT_PROMPT)
@@ -0,0 +1,492 @@
+import logging
+from asgiref.sync import sync_to_async
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery
+from pgvector.django import CosineDistance, HammingDistance
+from pgvector import HalfVector, Vector
+from ..models import ChunkEmbedding, DocumentChunk, binary_quantized, half_precision
+from .embeddings import LANE_INTERACTIVE, generate_embedding, generate_embeddings, agenerate_embedding
+from .embedding_models import COLUMN_EMBEDDING_MODEL, active_model, get_embedding_model
+from .vector_backends import get_vector_backend
+from . import metrics
+from .. import database
+
+logger = logging.getLogger(__name__)
+
+SEARCH_LIMIT = 15
+MIN_SIMILARITY = 0.4
+
+# Accepted ranges for the per-request ANN knobs
+MAX_EF_SEARCH = 1000
+MAX_PROBES = 1000
+
+SEARCH_MODES = ('vector', 'hybrid', 'prefilter')
+TEXT_SEARCH_CONFIG = 'english'
+# Reciprocal rank fusion constant and how many candidates each leg contributes
+RRF_K = 60
+HYBRID_CANDIDATES = 50
+# Lexical matches re-scored by exact vector distance in prefilter mode
+PREFILTER_CANDIDATES = 1000
+
+# Most queries accepted by one batch search request
+BATCH_MAX_QUERIES = 256
+
+QUANTIZATIONS = ('half', 'binary')
+# Candidates fetched from a quantized index per requested result before the
+# full-precision re-rank
+RERANK_FACTOR = 10
+MAX_RERANK_FACTOR = 50
+
+
+def validate_index_params(ef_search=None, probes=None):
+    """
+    Coerce the ``ef_search``/``probes`` request values to ints.
+
+    Raises ``ValueError`` with a client-facing message when a value is not a
+    positive integer within range.
+    """
+    params = {}
+    for name, value, upper in (('ef_search', ef_search, MAX_EF_SEARCH), ('probes', probes, MAX_PROBES)):
+        if value in (None, ''):
+            params[name] = None
+            continue
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be an integer")
+        if not 1 <= value <= upper:
+            raise ValueError(f"{name} must be between 1 and {upper}")
+        params[name] = value
+    return params
+
+
+def parse_flag(name, value):
+    """
+    Read a boolean request value. JSON booleans and the query string/form
+    spellings ``"true"``/``"1"`` and ``"false"``/``"0"`` are accepted;
+    anything else raises ``ValueError`` rather than being coerced with
+    ``bool()`` (which would read ``"false"`` as true).
+    """
+    if value in (None, '', False, 'false', 'False', '0', 0):
+        return False
+    if value in (True, 'true', 'True', '1', 1):
+        return True
+    raise ValueError(f"{name} must be true or false")
+
+
+def parse_search_params(data):
+    """
+    Build the ``retrieve`` keyword arguments from a search request body.
+
+    Raises ``ValueError`` with a client-facing message on invalid input.
+    """
+    params = validate_index_params(data.get('ef_search'), data.get('probes'))
+    params['exact'] = parse_flag('exact', data.get('exact'))
+
+    mode = data.get('mode') or 'vector'
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"mode must be one of: {', '.join(SEARCH_MODES)}")
+    params['mode'] = mode
+
+    quantization = data.get('quantization')
+    if quantization not in (None, '') + QUANTIZATIONS:
+        raise ValueError(f"quantization must be one of: {', '.join(QUANTIZATIONS)}")
+    if quantization:
+        if params['mode'] != 'vector':
+            raise ValueError("quantization is only supported in vector mode")
+        params['quantization'] = quantization
+        rerank_factor = data.get('rerank_factor', RERANK_FACTOR)
+        try:
+            rerank_factor = int(rerank_factor)
+        except (TypeError, ValueError):
+            raise ValueError("rerank_factor must be an integer")
+        if not 1 <= rerank_factor <= MAX_RERANK_FACTOR:
+            raise ValueError(f"rerank_factor must be between 1 and {MAX_RERANK_FACTOR}")
+        params['rerank_factor'] = rerank_factor
+
+    weights = data.get('weights')
+    if weights is not None:
+        if not isinstance(weights, dict) or set(weights) - {'vector', 'lexical'}:
+            raise ValueError("weights must be an object with 'vector' and/or 'lexical' keys")
+        try:
+            weights = {name: float(value) for name, value in weights.items()}
+        except (TypeError, ValueError):
+            raise ValueError("weights must be numbers")
+        if any(value < 0 for value in weights.values()):
+            raise ValueError("weights must not be negative")
+        params['weights'] = weights
+    return params
+
+
+def parse_batch_queries(data):
+    """
+    Read the ``queries`` list of a batch search body as ``(query, synthesize)``
+    pairs. Each entry is a string or ``{"query": ..., "synthesize": bool}``;
+    ``synthesize`` defaults to the top-level ``synthesize`` flag (false); both
+    are read with ``parse_flag``.
+    """
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not queries:
+        raise ValueError("queries must be a non-empty list")
+    if len(queries) > BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {BATCH_MAX_QUERIES} queries per batch")
+    default = parse_flag('synthesize', data.get('synthesize'))
+    parsed = []
+    for index, item in enumerate(queries):
+        if isinstance(item, dict):
+            query, synthesize = item.get('query'), item.get('synthesize')
+            synthesize = default if synthesize is None else parse_flag(f"queries[{index}].synthesize", synthesize)
+        else:
+            query, synthesize = item, default
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError(f"queries[{index}] must be a non-empty string")
+        parsed.append((query, synthesize))
+    return parsed
+
+
+def _apply_index_settings(cursor, ef_search=None, probes=None, exact=False):
+    # set_config(..., true) is the parameterisable form of SET LOCAL, so the
+    # settings only last until the surrounding transaction ends.
+    if ef_search is not None:
+        cursor.execute("SELECT set_config('hnsw.ef_search', %s, true)", [str(ef_search)])
+    if probes is not None:
+        cursor.execute("SELECT set_config('ivfflat.probes', %s, true)", [str(probes)])
+    if exact:
+        cursor.execute("SELECT set_config('enable_indexscan', 'off', true)")
+
+
+def search_chunks(query_embedding, limit=SEARCH_LIMIT, min_similarity=MIN_SIMILARITY,
+                  ef_search=None, probes=None, exact=False):
+    """
+    Return the ``limit`` chunks nearest to ``query_embedding`` by cosine distance.
+
+    The query orders by the raw distance expression with a LIMIT, which is
+    the shape the HNSW index can serve; the similarity threshold is
+    applied afterwards to the (small) candidate list instead of in SQL.
+    ``exact=True`` disables index scans to get the true nearest neighbours.
+    Each returned chunk carries a ``similarity`` attribute.
+    """
+    queryset = DocumentChunk.objects.only(
+        'id', 'document_id', 'chunk_text', 'chunk_index', 'start_offset', 'end_offset'
+    ).annotate(
+        distance=CosineDistance('embedding', query_embedding)
+    ).order_by('distance')[:limit]
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            _apply_index_settings(cursor, ef_search, probes, exact)
+        chunks = list(queryset)
+
+    results = []
+    for chunk in chunks:
+        chunk.similarity = 1 - chunk.distance
+        if chunk.similarity > min_similarity:
+            results.append(chunk)
+    return results
+
+
+def search_chunks_batch(query_embeddings, limit=SEARCH_LIMIT, min_similarity=MIN_SIMILARITY,
+                        ef_search=None, probes=None, exact=False):
+    """
+    ``search_chunks`` for many queries in a single SQL statement.
+
+    The query vectors are sent as a ``VALUES`` list and each one drives a
+    ``LATERAL`` subquery with the same ORDER BY distance LIMIT shape as
+    ``search_chunks``, so every query still gets an index scan but the
+    whole batch costs one round-trip. Returns one chunk list per query.
+    """
+    if not query_embeddings:
+        return []
+    table = DocumentChunk._meta.db_table
+    values = ', '.join(['(%s, %s::vector)'] * len(query_embeddings))
+    params = []
+    for position, embedding in enumerate(query_embeddings):
+        params += [position, Vector(embedding).to_text()]
+    sql = (
+        f'SELECT c.id, c.document_id, c.chunk_text, c.chunk_index, c.start_offset, c.end_offset, '
+        f'c.distance, q.position '
+        f'FROM (VALUES {values}) AS q(position, embedding) '
+        f'CROSS JOIN LATERAL ('
+        f'SELECT id, document_id, chunk_text, chunk_index, start_offset, end_offset, '
+        f'embedding <=> q.embedding AS distance '
+        f'FROM {table} ORDER BY embedding <=> q.embedding LIMIT %s'
+        f') AS c ORDER BY q.position, c.distance'
+    )
+    params.append(limit)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            _apply_index_settings(cursor, ef_search, probes, exact)
+        chunks = list(DocumentChunk.objects.raw(sql, params))
+
+    results = [[] for _ in query_embeddings]
+    for chunk in chunks:
+        chunk.similarity = 1 - chunk.distance
+        if chunk.similarity > min_similarity:
+            results[chunk.position].append(chunk)
+    return results
+
+
+def model_search(query_embedding, model, limit=SEARCH_LIMIT, min_similarity=MIN_SIMILARITY,
+                 ef_search=None, probes=None, exact=False):
+    """
+    ``search_chunks`` over the ``ChunkEmbedding`` vectors of a non-column
+    ``model``. The distance expression and the ``model`` filter match that
+    model's partial HNSW index (see ``embedding_migration.create_model_index``).
+    """
+    dimensions = get_embedding_model(model).dimensions
+    distance = f'(e.embedding::vector({dimensions})) <=> %s::vector({dimensions})'
+    sql = (
+        f'SELECT c.id, c.document_id, c.chunk_text, c.chunk_index, c.start_offset, c.end_offset, '
+        f'{distance} AS distance '
+        f'FROM {ChunkEmbedding._meta.db_table} e '
+        f'JOIN {DocumentChunk._meta.db_table} c ON c.id = e.chunk_id '
+        f'WHERE e.model = %s ORDER BY {distance} LIMIT %s'
+    )
+    vector = Vector(query_embedding).to_text()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            _apply_index_settings(cursor, ef_search, probes, exact)
+        chunks = list(DocumentChunk.objects.raw(sql, [vector, model, vector, limit]))
+
+    results = []
+    for chunk in chunks:
+        chunk.similarity = 1 - chunk.distance
+        if chunk.similarity > min_similarity:
+            results.append(chunk)
+    return results
+
+
+def _distance(query_embedding, model=COLUMN_EMBEDDING_MODEL):
+    """Cosine distance of a chunk to ``query_embedding``, using ``model``'s vector."""
+    if model == COLUMN_EMBEDDING_MODEL:
+        return CosineDistance('embedding', query_embedding)
+    return Subquery(ChunkEmbedding.objects.filter(chunk=OuterRef('pk'), model=model).annotate(
+        distance=CosineDistance('embedding', query_embedding)
+    ).values('distance')[:1])
+
+
+def binary_quantize(embedding):
+    """Python equivalent of pgvector's ``binary_quantize``: one bit per dimension sign."""
+    return ''.join('1' if value > 0 else '0' for value in embedding)
+
+
+def quantized_search(query_embedding, quantization='half', limit=SEARCH_LIMIT,
+                     min_similarity=MIN_SIMILARITY, rerank_factor=RERANK_FACTOR,
+                     ef_search=None, probes=None, exact=False):
+    """
+    Two-stage search: take ``limit * rerank_factor`` candidates from the
+    compact halfvec or binary HNSW index, then re-rank just those by cosine
+    distance on the full-precision embeddings, all in one SQL statement.
+    The candidates are ordered by the indexed expression (see
+    ``quantization.QUANTIZED_INDEXES``); the pgvector backend only calls this
+    once that index is built.
+    """
+    candidates = limit * rerank_factor
+    if quantization == 'binary':
+        distance = HammingDistance(binary_quantized('embedding'), binary_quantize(query_embedding))
+    else:
+        distance = CosineDistance(half_precision('embedding'), HalfVector(query_embedding))
+    candidate_ids = DocumentChunk.objects.annotate(
+        candidate_distance=distance
+    ).order_by('candidate_distance').values('id')[:candidates]
+    queryset = DocumentChunk.objects.only(
+        'id', 'document_id', 'chunk_text', 'chunk_index', 'start_offset', 'end_offset'
+    ).filter(id__in=candidate_ids).annotate(
+        distance=CosineDistance('embedding', query_embedding)
+    ).order_by('distance')[:limit]
+
+    # HNSW returns at most ef_search rows, so it must cover the candidate set
+    ef_search = max(ef_search or 0, candidates)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            _apply_index_settings(cursor, min(ef_search, MAX_EF_SEARCH), probes, exact)
+        chunks = list(queryset)
+
+    results = []
+    for chunk in chunks:
+        chunk.similarity = 1 - chunk.distance
+        if chunk.similarity > min_similarity:
+            results.append(chunk)
+    return results
+
+
+def serialize_chunk(chunk):
+    return {
+        "document_id": chunk.document_id,
+        "document_name": f"Document {chunk.document_id}",
+        "chunk_id": chunk.id,
+        "chunk_text": chunk.chunk_text,
+        "similarity": float(chunk.similarity),
+        **({"score": chunk.score} if hasattr(chunk, 'score') else {}),
+    }
+
+
+def _text_query(query):
+    return SearchQuery(query, config=TEXT_SEARCH_CONFIG, search_type='websearch')
+
+
+def lexical_search(query, query_embedding=None, limit=HYBRID_CANDIDATES, model=COLUMN_EMBEDDING_MODEL):
+    """
+    Full-text search over the GIN-indexed ``search_vector`` column, ranked
+    by ``ts_rank``. When ``query_embedding`` (of ``model``) is given each
+    chunk also gets a cosine ``similarity`` so it can be shown next to
+    vector results.
+    """
+    text_query = _text_query(query)
+    queryset = DocumentChunk.objects.only(
+        'id', 'document_id', 'chunk_text', 'chunk_index', 'start_offset', 'end_offset'
+    ).filter(search_vector=text_query).annotate(
+        rank=SearchRank(F('search_vector'), text_query)
+    )
+    if query_embedding is not None:
+        queryset = queryset.annotate(distance=_distance(query_embedding, model))
+    chunks = list(queryset.order_by('-rank')[:limit])
+    for chunk in chunks:
+        if query_embedding is not None:
+            # Chunks written after their model was retired have no vector
+            chunk.similarity = 1 - chunk.distance if chunk.distance is not None else 0.0
+    return chunks
+
+
+def rrf_fuse(ranked_lists, weights, k=RRF_K):
+    """
+    Reciprocal rank fusion: score(d) = sum(weight / (k + rank)) over the lists
+    that contain d. ``ranked_lists`` maps a leg name to its ordered chunks and
+    ``weights`` maps a leg name to its weight. Returns chunks ordered by the
+    fused ``score`` attribute.
+    """
+    fused = {}
+    for name, chunks in ranked_lists.items():
+        weight = weights.get(name, 1.0)
+        for rank, chunk in enumerate(chunks, start=1):
+            entry = fused.setdefault(chunk.id, [chunk, 0.0])
+            entry[1] += weight / (k + rank)
+    for chunk, score in fused.values():
+        chunk.score = score
+    return sorted((chunk for chunk, _ in fused.values()), key=lambda chunk: chunk.score, reverse=True)
+
+
+def hybrid_search(query, query_embedding, limit=SEARCH_LIMIT, min_similarity=MIN_SIMILARITY,
+                  weights=None, candidates=HYBRID_CANDIDATES, model=COLUMN_EMBEDDING_MODEL, **index_params):
+    """
+    Run the vector and lexical legs and merge them with reciprocal rank fusion.
+
+    Lexical hits are kept even below ``min_similarity``: exact identifiers and
+    rare terms are precisely what the vector leg tends to rank poorly.
+    """
+    weights = {'vector': 1.0, 'lexical': 1.0, **(weights or {})}
+    vector_chunks = get_vector_backend().search(
+        query_embedding, limit=candidates, min_similarity=min_similarity, model=model, **index_params
+    )
+    lexical_chunks = lexical_search(query, query_embedding, limit=candidates, model=model)
+    return rrf_fuse({'vector': vector_chunks, 'lexical': lexical_chunks}, weights)[:limit]
+
+
+def prefilter_search(query, query_embedding, limit=SEARCH_LIMIT, min_similarity=MIN_SIMILARITY,
+                     candidates=PREFILTER_CANDIDATES, model=COLUMN_EMBEDDING_MODEL):
+    """
+    Use the full-text index as a cheap prefilter: take the best ``candidates``
+    lexical matches and re-score only those by exact cosine distance.
+    """
+    text_query = _text_query(query)
+    candidate_ids = DocumentChunk.objects.filter(search_vector=text_query).annotate(
+        rank=SearchRank(F('search_vector'), text_query)
+    ).order_by('-rank').values('id')[:candidates]
+    chunks = DocumentChunk.objects.only(
+        'id', 'document_id', 'chunk_text', 'chunk_index', 'start_offset', 'end_offset'
+    ).filter(id__in=candidate_ids).annotate(
+        distance=_distance(query_embedding, model)
+    ).filter(distance__isnull=False).order_by('distance')[:limit]
+
+    results = []
+    for chunk in chunks:
+        chunk.similarity = 1 - chunk.distance
+        if chunk.similarity > min_similarity:
+            results.append(chunk)
+    return results
+
+
+@metrics.timed('search')
+def run_search(query, query_embedding, mode='vector', weights=None, model=COLUMN_EMBEDDING_MODEL, **search_params):
+    """
+    Dispatch to the vector, hybrid or lexically prefiltered search over
+    ``model``'s vectors, which ``query_embedding`` must come from. Vector
+    search goes through the configured backend (see ``vector_backends``).
+    """
+    if mode == 'hybrid':
+        return hybrid_search(query, query_embedding, weights=weights, model=model, **search_params)
+    if mode == 'prefilter':
+        limit = search_params.get('limit', SEARCH_LIMIT)
+        min_similarity = search_params.get('min_similarity', MIN_SIMILARITY)
+        return prefilter_search(query, query_embedding, limit=limit, min_similarity=min_similarity, model=model)
+    search_params.setdefault('limit', SEARCH_LIMIT)
+    search_params.setdefault('min_similarity', MIN_SIMILARITY)
+    return get_vector_backend().search(query_embedding, model=model, **search_params)
+
+
+def retrieve(query, model=None, **search_params):
+    """
+    Embed ``query`` once with ``model`` (by default the active embedding
+    model) and run one search over that model's vectors (see ``run_search``
+    for modes).
+
+    This is the in-process retrieval service shared by ``SearchAPIView``,
+    ``rag_search`` and the LangChain retriever. Returns
+    ``(query_embedding, chunks)``.
+    """
+    model = model or active_model()
+    query_embedding = generate_embedding(query, model=model, lane=LANE_INTERACTIVE)
+    if not query_embedding:
+        raise RuntimeError("Failed to generate query embedding")
+    return query_embedding, run_search(query, query_embedding, model=model, **search_params)
+
+
+async def aretrieve(query, mode='vector', weights=None, model=None, **search_params):
+    """
+    Async ``retrieve``: the query is embedded over the pooled async Ollama
+    client. Plain pgvector searches then run on the asyncpg pool (see
+    ``api.database``) when it is enabled; the other modes and backends run
+    through the ORM in Django's sync thread, so the event loop stays free
+    either way.
+    """
+    model = model or await sync_to_async(active_model)()
+    query_embedding = await agenerate_embedding(query, model=model, lane=LANE_INTERACTIVE)
+    if not query_embedding:
+        raise RuntimeError("Failed to generate query embedding")
+    if (database.DB_POOL_ENABLED and mode == 'vector' and model == COLUMN_EMBEDDING_MODEL
+            and not search_params.get('quantization') and get_vector_backend().name == 'pgvector'):
+        search_params.pop('quantization', None)
+        search_params.pop('rerank_factor', None)
+        search_params.setdefault('limit', SEARCH_LIMIT)
+        search_params.setdefault('min_similarity', MIN_SIMILARITY)
+        with metrics.span('search'):
+            chunks = await database.search_chunks(query_embedding, **search_params)
+        return query_embedding, chunks
+    chunks = await sync_to_async(run_search)(
+        query, query_embedding, mode=mode, weights=weights, model=model, **search_params
+    )
+    return query_embedding, chunks
+
+
+def batch_retrieve(queries, mode='vector', weights=None, **search_params):
+    """
+    ``retrieve`` for a list of queries: all queries are embedded through one
+    ``generate_embeddings`` call, and in vector mode the backend searches the
+    whole batch at once. Returns one chunk list per query.
+    """
+    model = active_model()
+    query_embeddings = generate_embeddings(queries, model=model, lane=LANE_INTERACTIVE)
+    if len(query_embeddings) != len(queries) or not all(query_embeddings):
+        raise RuntimeError("Failed to generate query embeddings")
+    if mode == 'vector':
+        search_params.setdefault('limit', SEARCH_LIMIT)
+        search_params.setdefault('min_similarity', MIN_SIMILARITY)
+        with metrics.span('search'):
+            return get_vector_backend().search_batch(query_embeddings, model=model, **search_params)
+    return [
+        run_search(query, embedding, mode=mode, weights=weights, model=model, **search_params)
+        for query, embedding in zip(queries, query_embeddings)
+    ]
+
@@ -0,0 +1,65 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+# Runs in a fresh interpreter, so nothing is already imported: times Django
+# setup, then each module, then optionally the warm-up
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+phases = [('django.setup', time.perf_counter() - started)]
+for module in {modules!r}:
+    started = time.perf_counter()
+    __import__(module)
+    phases.append((module, time.perf_counter() - started))
+if {warm_up!r}:
+    from django.apps import apps
+    started = time.perf_counter()
+    apps.get_app_config('api').warm_up()
+    phases.append(('warm_up', time.perf_counter() - started))
+print(json.dumps({{'phases': phases, 'modules': sorted(sys.modules)}}))
+"""
+
+_IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def parse_importtime(output):
+    """``(module, self_us, cumulative_us, depth)`` for each line of ``python -X importtime`` output."""
+    records = []
+    for line in output.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            records.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return records
+
+
+def package_times(records):
+    """Seconds spent importing each top-level package (own time of all its modules), slowest first."""
+    totals = defaultdict(int)
+    for module, self_us, _, _ in records:
+        totals[module.split('.', 1)[0]] += self_us
+    return sorted(((package, us / 1e6) for package, us in totals.items()), key=lambda item: -item[1])
+
+
+def measure_startup(modules, warm_up=False):
+    """
+    Time a cold start in a new interpreter with the current settings:
+    ``django.setup()``, importing each of ``modules`` and, with ``warm_up``,
+    ``ApiConfig.warm_up``. Returns ``{'phases': [(name, seconds)], 'modules':
+    [imported module names], 'packages': package_times(...)}``.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROBE.format(modules=list(modules), warm_up=warm_up)],
+        capture_output=True, text=True, env=os.environ.copy(), check=False,
+    )
+    if result.returncode:
+        raise RuntimeError(f"Startup probe failed:\n{result.stderr[-2000:]}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['packages'] = package_times(parse_importtime(result.stderr))
+    return report
@@ -0,0 +1,297 @@
+import copy
+import logging
+import os
+import re
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+from ..models import ChunkEmbedding, DocumentChunk
+from .embedding_models import COLUMN_EMBEDDING_MODEL, get_embedding_model
+
+logger = logging.getLogger(__name__)
+
+# 'pgvector' (default) searches in Postgres; 'numpy' keeps every chunk
+# embedding in process memory and scores queries with a matrix multiply.
+VECTOR_BACKEND = getattr(settings, 'VECTOR_BACKEND', 'pgvector')
+# Directory written by the vector_snapshot command. When set, the numpy
+# backend memory-maps it instead of loading embeddings from the database.
+VECTOR_SNAPSHOT_PATH = getattr(settings, 'VECTOR_SNAPSHOT_PATH', None)
+# Seconds between checks for chunks written since the matrix was loaded
+VECTOR_REFRESH_INTERVAL = getattr(settings, 'VECTOR_REFRESH_INTERVAL', 30)
+
+# Queries scored per matrix multiply, bounding the (queries x chunks) score
+# matrix that is held in memory at once
+QUERY_BLOCK_SIZE = 16
+LOAD_BATCH_SIZE = 2000
+
+
+def normalize(vectors):
+    """Return ``vectors`` as float32 rows of unit length (zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def snapshot_dir(path, model=COLUMN_EMBEDDING_MODEL):
+    """
+    Snapshot directory of ``model`` under ``path``: the column model's
+    snapshot is ``path`` itself, others get a subdirectory named after them.
+    """
+    if model == COLUMN_EMBEDDING_MODEL:
+        return path
+    return os.path.join(path, re.sub(r'[^A-Za-z0-9._-]+', '_', model))
+
+
+def top_k(ids, matrix, query_embeddings, k):
+    """
+    Return ``[(ids, similarities), ...]`` per query, best first, as NumPy
+    arrays. ``matrix`` holds one normalized row per entry of ``ids``.
+    """
+    k = min(k, len(ids))
+    queries = normalize(query_embeddings).reshape(len(query_embeddings), -1)
+    results = []
+    for start in range(0, len(queries), QUERY_BLOCK_SIZE):
+        scores = queries[start:start + QUERY_BLOCK_SIZE] @ matrix.T
+        if k == 0:
+            results.extend((ids[:0], scores[row, :0]) for row in range(len(scores)))
+            continue
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        results.extend((ids[top[row]], top_scores[row]) for row in range(len(top)))
+    return results
+
+
+class VectorBackend:
+    """
+    Nearest-neighbour search over chunk embeddings.
+
+    ``search_batch`` takes a list of query embeddings and returns, for each
+    query, up to ``limit`` ``DocumentChunk`` objects ordered by decreasing
+    cosine ``similarity`` (set as an attribute) and above ``min_similarity``,
+    comparing against the vectors of embedding ``model``.
+    """
+
+    name = None
+
+    def search(self, query_embedding, **params):
+        return self.search_batch([query_embedding], **params)[0]
+
+    def search_batch(self, query_embeddings, limit, min_similarity, model=COLUMN_EMBEDDING_MODEL, **params):
+        raise NotImplementedError
+
+
+class PgvectorBackend(VectorBackend):
+    """
+    The HNSW indexed search in Postgres (see ``search.search_chunks``).
+    Only the column model can have quantized indexes, and only once they are
+    built (see ``quantization``): other models, and quantizations without an
+    index, search the full-precision vectors.
+    """
+
+    name = 'pgvector'
+
+    def search_batch(self, query_embeddings, limit, min_similarity, model=COLUMN_EMBEDDING_MODEL, **params):
+        from .quantization import quantized_indexes
+        from .search import model_search, quantized_search, search_chunks, search_chunks_batch
+
+        if params.get('quantization') and (
+            model != COLUMN_EMBEDDING_MODEL or params['quantization'] not in quantized_indexes.get()
+        ):
+            params.pop('quantization')
+        if model != COLUMN_EMBEDDING_MODEL:
+            params.pop('quantization', None)
+            params.pop('rerank_factor', None)
+            return [
+                model_search(embedding, model, limit=limit, min_similarity=min_similarity, **params)
+                for embedding in query_embeddings
+            ]
+        if params.get('quantization'):
+            return [
+                quantized_search(embedding, limit=limit, min_similarity=min_similarity, **params)
+                for embedding in query_embeddings
+            ]
+        params.pop('quantization', None)
+        params.pop('rerank_factor', None)
+        if len(query_embeddings) == 1:
+            return [search_chunks(query_embeddings[0], limit=limit, min_similarity=min_similarity, **params)]
+        return search_chunks_batch(query_embeddings, limit=limit, min_similarity=min_similarity, **params)
+
+
+class NumpyVectorBackend(VectorBackend):
+    """
+    Exact in-memory search over a normalized float32 matrix of every chunk.
+
+    Cosine similarity of unit vectors is a dot product, so a block of queries
+    is scored against all chunks with one matrix multiply and the top ``k``
+    per query are selected with ``argpartition`` (linear time) before only
+    those ``k`` are sorted. The scan is exact, so ANN tuning parameters
+    (``ef_search``, ``probes``, ``quantization``) are accepted and ignored.
+
+    The matrix is loaded from the database, or memory-mapped from a snapshot
+    directory so several worker processes share one copy through the page
+    cache. Database-loaded matrices are reloaded when the chunk count or the
+    highest chunk id changes; snapshots when the snapshot files change. One
+    embedding model is held at a time: searching another model reloads the
+    matrix from that model's snapshot (see ``snapshot_dir``) if there is one,
+    else from the database.
+    """
+
+    name = 'numpy'
+
+    def __init__(self, snapshot_path=None, refresh_interval=VECTOR_REFRESH_INTERVAL, model=COLUMN_EMBEDDING_MODEL):
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self.model = model
+        self.ids = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, get_embedding_model(model).dimensions), dtype=np.float32)
+        self._version = None
+        self._checked_at = None
+        self._static = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_arrays(cls, ids, vectors):
+        """Build a backend over fixed data; it never reloads."""
+        backend = cls()
+        backend.set_data(ids, vectors)
+        backend._static = True
+        return backend
+
+    def set_data(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        matrix = normalize(vectors).reshape(len(ids), -1) if len(ids) else self.matrix[:0]
+        # Swap both arrays at once so concurrent searches never see a mix
+        self.ids, self.matrix = ids, matrix
+
+    def _snapshot_path(self):
+        """This model's snapshot directory, or ``None`` to load from the database."""
+        if not self.snapshot_path:
+            return None
+        path = snapshot_dir(self.snapshot_path, self.model)
+        if self.model != COLUMN_EMBEDDING_MODEL and not os.path.isdir(path):
+            return None
+        return path
+
+    def _snapshot_files(self, path=None):
+        path = path or self._snapshot_path()
+        return os.path.join(path, 'ids.npy'), os.path.join(path, 'vectors.npy')
+
+    def _rows(self):
+        """``(chunk_id, embedding)`` rows of this model's vectors."""
+        if self.model == COLUMN_EMBEDDING_MODEL:
+            return DocumentChunk.objects.filter(embedding__isnull=False).order_by('id').values_list('id', 'embedding')
+        return ChunkEmbedding.objects.filter(model=self.model).order_by('chunk_id').values_list('chunk_id', 'embedding')
+
+    def _current_version(self):
+        if self._snapshot_path():
+            return tuple(os.stat(name).st_mtime_ns for name in self._snapshot_files())
+        stats = self._rows().aggregate(count=Count('id'), max_id=Max('id'))
+        return stats['count'], stats['max_id']
+
+    def load(self):
+        version = self._current_version()
+        if self._snapshot_path():
+            ids_file, vectors_file = self._snapshot_files()
+            # Snapshots are normalized when written, so no copy is made here
+            self.ids, self.matrix = np.load(ids_file), np.load(vectors_file, mmap_mode='r')
+        else:
+            self.set_data(*self._read_database())
+        self._version = version
+        self._checked_at = time.monotonic()
+        logger.info(f"Vector backend loaded {len(self.ids)} {self.model} chunk embeddings")
+
+    def _read_database(self):
+        ids, blocks, block = [], [], []
+        for chunk_id, embedding in self._rows().iterator(chunk_size=LOAD_BATCH_SIZE):
+            ids.append(chunk_id)
+            block.append(embedding)
+            if len(block) == LOAD_BATCH_SIZE:
+                blocks.append(normalize(block))
+                block = []
+        if block:
+            blocks.append(normalize(block))
+        dimensions = get_embedding_model(self.model).dimensions
+        vectors = np.vstack(blocks) if blocks else np.empty((0, dimensions), dtype=np.float32)
+        return ids, vectors
+
+    def save_snapshot(self, path):
+        """Write the current matrix to ``path`` so it can be memory-mapped later."""
+        os.makedirs(path, exist_ok=True)
+        for name, array in zip(self._snapshot_files(path), (self.ids, self.matrix)):
+            temporary = f"{name}.tmp.npy"
+            np.save(temporary, np.ascontiguousarray(array))
+            os.replace(temporary, name)
+
+    def _is_fresh(self):
+        return self._checked_at is not None and time.monotonic() - self._checked_at < self.refresh_interval
+
+    def ensure_loaded(self, model=None):
+        model = model or self.model
+        if self._static or (model == self.model and self._is_fresh()):
+            return
+        with self._lock:
+            if model != self.model:
+                self.model, self._version = model, None
+            elif self._is_fresh():
+                return
+            if self._version is None or self._current_version() != self._version:
+                self.load()
+            self._checked_at = time.monotonic()
+
+    def top_k(self, query_embeddings, k):
+        """Best ``k`` chunks per query; see the module-level ``top_k``."""
+        return top_k(self.ids, self.matrix, query_embeddings, k)
+
+    def search_batch(self, query_embeddings, limit, min_similarity, model=COLUMN_EMBEDDING_MODEL, **params):
+        self.ensure_loaded(model)
+        hits = [
+            [(int(chunk_id), float(score)) for chunk_id, score in zip(*result) if score > min_similarity]
+            for result in self.top_k(query_embeddings, limit)
+        ]
+        wanted = {chunk_id for result in hits for chunk_id, _ in result}
+        rows = DocumentChunk.objects.only(
+            'id', 'document_id', 'chunk_text', 'chunk_index', 'start_offset', 'end_offset'
+        ).in_bulk(wanted)
+
+        results = []
+        for result in hits:
+            chunks = []
+            for chunk_id, score in result:
+                row = rows.get(chunk_id)
+                if row is None:  # deleted since the matrix was loaded
+                    continue
+                # Copy so a chunk matched by several queries keeps per-query scores
+                chunk = copy.copy(row)
+                chunk.similarity = score
+                chunks.append(chunk)
+            results.append(chunks)
+        return results
+
+
+BACKENDS = {
+    PgvectorBackend.name: PgvectorBackend,
+    NumpyVectorBackend.name: NumpyVectorBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_vector_backend():
+    """The process-wide backend selected by ``settings.VECTOR_BACKEND``."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if VECTOR_BACKEND not in BACKENDS:
+                    raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+                if VECTOR_BACKEND == NumpyVectorBackend.name:
+                    _backend = NumpyVectorBackend(snapshot_path=VECTOR_SNAPSHOT_PATH)
+                else:
+                    _backend = BACKENDS[VECTOR_BACKEND]()
+    return _backend
@@ -1,28 +1,41 @@
 from django.shortcuts import render
+from asgiref.sync import sync_to_async
 import logging
-import asyncio
-from django.db.models import Sum, Count
+import json
+import time
+from django.db.models import Sum, Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce, Left
 from django.db import transaction
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from rest_framework.decorators import api_view, permission_classes
-import requests
 from rest_framework.permissions import AllowAny
-from .utils.embeddings import generate_embedding
+from .utils.embeddings import LANE_INTERACTIVE, generate_embedding
+from .utils.embedding_cache import embedding_cache
+from django.views import View as DjangoView
 from rest_framework.views import APIView, View
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import DocumentSerializer, AgentSerializer
-from .models import Document, DocumentChunk, Agent
-from .utils.chunking import chunk_text
-from .utils.embeddings import generate_embedding
+from rest_framework.pagination import CursorPagination
+from .serializers import DocumentSerializer, AgentSerializer, IngestionJobSerializer
+from .models import Document, DocumentChunk, Agent, IngestionJob
+from .utils.bulk_upload import iter_ndjson_documents, iter_uploaded_documents, ingest_many
+from .utils.ingestion import ingest_document, aingest_document, enqueue_ingestion, reindex_document, ReindexConflict
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET
 import logging
 import os
-from pgvector.django import CosineDistance
-from .utils.rag import qa_chain
-from .utils.llm import generate_response
+from .utils.search import (
+    retrieve, aretrieve, batch_retrieve, serialize_chunk, parse_search_params, parse_batch_queries,
+)
+from .utils.context import build_context
+from .utils.answer_cache import cached_answer, acached_answer, prompt_namespace
+from .utils.embedding_models import active_model
+from .utils.rag import answer_query, aanswer_query
+from .utils.agent_router import agent_router, MAX_ROUTE_K
+from .utils import metrics
+from .utils.llm import generate_response, generate_response_sync, generate_responses_sync, stream_response
 
 logger = logging.getLogger(__name__)
 
@@ -35,36 +48,70 @@ def rag_search(request):
         return Response({"error": "Query is required"}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        # Generate response with RAG chain
-        response = qa_chain.invoke(query)
-        # Handle different response formats from LangChain
-        if hasattr(response, 'generations') and response.generations:
-            synthesized_response = response.generations[0].message.content
-        elif hasattr(response, 'content'):
-            synthesized_response = response.content
-        elif isinstance(response, dict):
-            synthesized_response = str(response)
-        else:
-            synthesized_response = response if isinstance(response, str) else str(response)
-        
-        # Fetch search results from SearchAPIView
-        search_response = requests.post("http://127.0.0.1:8000/api/documents/search/", json={"query": query})
-        search_response.raise_for_status()
-        search_results = search_response.json().get("results", [])
-        
+        agent = _requested_agent(request.data, query)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Agent.DoesNotExist:
+        return Response({"error": "Agent not found"}, status=status.HTTP_404_NOT_FOUND)
+    except RuntimeError as e:
+        logger.error(f"Failed to generate query embedding: {str(e)}")
+        return Response({"error": "Failed to generate query embedding"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    try:
+        synthesized_response, chunks = answer_query(query, agent_prompt=agent.prompt if agent else None)
         return Response({
             "synthesized_response": synthesized_response,
-            "results": search_results
+            "results": [serialize_chunk(chunk) for chunk in chunks],
+            **({"agent": serialize_agent_match(agent)} if agent else {}),
         }, status=status.HTTP_200_OK)
     
     except Exception as e:
         logger.error(f"Error in rag_search: {str(e)}")
         return Response({"error": f"Failed to process request: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+def _requested_agent(data, query):
+    """
+    The agent whose prompt should steer a RAG answer: ``agent_id`` picks one
+    explicitly, ``route_agent: true`` routes the query to the closest agent.
+    Agents are routed with column model embeddings (see ``Agent.embedding``);
+    while that model is active the cached routing embedding also serves
+    retrieval, so the query is not embedded again.
+
+    Raises ``ValueError`` for an invalid ``agent_id``, ``Agent.DoesNotExist``
+    for an unknown one and ``RuntimeError`` when the query cannot be embedded.
+    """
+    agent_id = data.get('agent_id')
+    if agent_id not in (None, ''):
+        if isinstance(agent_id, bool) or not str(agent_id).isdigit():
+            raise ValueError("agent_id must be a positive integer")
+        return Agent.objects.only('id', 'name', 'description', 'prompt').get(pk=int(agent_id))
+    if data.get('route_agent'):
+        routed = agent_router.route(generate_embedding(query, lane=LANE_INTERACTIVE), k=1)
+        return routed[0] if routed else None
+    return None
+
+
+def serialize_agent_match(agent):
+    return {
+        "id": agent.id,
+        "name": agent.name,
+        "description": agent.description,
+        **({"similarity": agent.similarity} if hasattr(agent, 'similarity') else {}),
+    }
+
+
+def _is_async_request(request):
+    value = request.query_params.get('async', request.data.get('async', False))
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class DocumentUploadView(APIView):
     def post(self, request, *args, **kwargs):
-        logger.debug(f"Received request data: {request.data}")
+        logger.debug(f"Received upload of {request.META.get('CONTENT_LENGTH', 'unknown')} bytes")
 
         # Check if markdown is provided
         if 'markdown' not in request.data:
@@ -78,32 +125,21 @@ class DocumentUploadView(APIView):
         serializer = DocumentSerializer(data=request.data)
         if serializer.is_valid():
             document = serializer.save()
+            if _is_async_request(request):
+                job = enqueue_ingestion(document)
+                logger.info(f"Document {document.id} queued for ingestion as job {job.id}")
+                return Response(
+                    {
+                        "document_id": document.id,
+                        "job_id": job.id,
+                        "status": job.status,
+                        "status_url": reverse('ingestion-job', args=[job.id]),
+                    },
+                    status=status.HTTP_202_ACCEPTED
+                )
             try:
-                markdown = request.data['markdown']
-                chunks = chunk_text(markdown, chunk_size=500, overlap=50)
-                logger.info(f"Chunks gerados: {len(chunks)}")
-                token_count = sum(len(chunk.split()) for chunk in chunks)
-
-                # Generate and save embeddings for each chunk
-                for index, chunk in enumerate(chunks):
-                    logger.info(f"Chunk {index} tamanho: {len(chunk)}")
-                    embedding = generate_embedding(chunk)
-                    if not embedding or len(embedding) != 768:
-                        logger.error(f"Embedding inválido para chunk {index}: {embedding}")
-                        raise ValueError(f"Embedding inválido para chunk {index}")
-                    logger.info(f"Embedding {index} primeiros valores: {embedding[:5]}")
-                    DocumentChunk.objects.create(
-                        document=document,
-                        chunk_text=chunk,
-                        embedding=embedding,
-                        chunk_index=index
-                    )
-
-                # Update token_count in the document
-                document.token_count = token_count
-                document.save()
-
-                logger.info(f"Document {document.id} uploaded successfully with {len(chunks)} chunks")
+                chunk_count = ingest_document(document)
+                logger.info(f"Document {document.id} uploaded successfully with {chunk_count} chunks")
                 return Response(
                     {"document_id": document.id},
                     status=status.HTTP_201_CREATED
@@ -123,28 +159,181 @@ class DocumentUploadView(APIView):
             )
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class BulkDocumentUploadView(DjangoView):
+    """
+    Bulk upload of many markdown documents in one request.
+
+    Accepts either an NDJSON body (``{"markdown": ...}`` per line), which is
+    parsed line by line straight from the request stream, or a multipart
+    body with the documents as ``files``. Documents are fed through a
+    pipelined chunk -> embed -> bulk insert path and the response holds one
+    result per document.
+    """
+
+    def post(self, request):
+        content_type = request.content_type or ''
+        if content_type in ('application/x-ndjson', 'application/jsonlines', 'application/json-lines'):
+            items = iter_ndjson_documents(request)
+        elif content_type == 'multipart/form-data':
+            items = iter_uploaded_documents(request.FILES.getlist('files'))
+        else:
+            return JsonResponse(
+                {"errors": "Expected an application/x-ndjson or multipart/form-data body"},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+
+        results = ingest_many(items)
+        failed = sum(1 for result in results if "error" in result)
+        logger.info(f"Bulk upload processed {len(results)} documents, {failed} failed")
+        return JsonResponse({
+            "results": sorted(results, key=lambda result: result["index"]),
+            "succeeded": len(results) - failed,
+            "failed": failed,
+        })
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class DocumentDetailView(APIView):
+    def get(self, request, pk):
+        """``?expand=chunks`` adds the chunks, without their embeddings, as in the listing."""
+        try:
+            document = Document.objects.get(pk=pk)
+        except Document.DoesNotExist:
+            return Response({"error": "Document not found"}, status=status.HTTP_404_NOT_FOUND)
+        data = DocumentSerializer(document).data
+        if 'chunks' in request.query_params.get('expand', '').split(','):
+            data["chunks"] = list(
+                document.chunks.order_by('chunk_index').values('id', 'chunk_text', 'chunk_index')
+            )
+        return Response(data)
+
+    def put(self, request, pk):
+        """Update the markdown and re-embed only the chunks that changed."""
+        try:
+            document = Document.objects.get(pk=pk)
+        except Document.DoesNotExist:
+            return Response({"error": "Document not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = DocumentSerializer(document, data=request.data)
+        if not serializer.is_valid():
+            logger.error(f"Serializer errors: {serializer.errors}")
+            return Response({"errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            summary = reindex_document(document, serializer.validated_data['markdown'])
+        except ReindexConflict as e:
+            return Response({"errors": str(e)}, status=status.HTTP_409_CONFLICT)
+        except Exception as e:
+            logger.error(f"Failed to re-index document {document.id}: {str(e)}")
+            return Response(
+                {"errors": f"Failed to process chunks: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return Response(summary, status=status.HTTP_200_OK)
+
+    patch = put
+
+
+class IngestionJobStatusView(APIView):
+    def get(self, request, pk):
+        try:
+            job = IngestionJob.objects.get(pk=pk)
+        except IngestionJob.DoesNotExist:
+            return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(IngestionJobSerializer(job).data)
+
+
+class EmbeddingCacheStatsView(APIView):
+    def get(self, request):
+        return Response(embedding_cache.stats())
+
+
+class DocumentStatsView(APIView):
+    """Corpus totals for the dashboard, aggregated in SQL."""
+
+    def get(self, request):
+        totals = Document.objects.aggregate(
+            documents=Count('id'), tokens=Coalesce(Sum('token_count'), 0),
+        )
+        totals["chunks"] = DocumentChunk.objects.count()
+        return Response(totals)
+
+
+class DocumentCursorPagination(CursorPagination):
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "documents": data,
+        })
+
+
 class ListDocumentsAPIView(APIView):
+    """
+    Cursor-paginated document listing.
+
+    Counts come from SQL and the full markdown is never loaded (only a
+    200-character preview). ``?expand=chunks`` adds each document's chunks
+    without their embeddings and ``?fields=id,token_count`` limits the keys
+    returned per document.
+    """
+    LIST_FIELDS = ('id', 'markdown', 'created_at', 'updated_at', 'chunk_count', 'token_count', 'chunks')
+
     def get(self, request):
-        documents = Document.objects.prefetch_related('chunks').all()
-        data = [
-            {
+        expand = set(filter(None, request.query_params.get('expand', '').split(',')))
+        fields = [f for f in request.query_params.get('fields', '').split(',') if f]
+        unknown = set(fields) - set(self.LIST_FIELDS)
+        if unknown:
+            return Response(
+                {"error": f"Unknown fields: {', '.join(sorted(unknown))}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        include_chunks = 'chunks' in expand or 'chunks' in fields
+
+        chunk_count = DocumentChunk.objects.filter(
+            document=OuterRef('pk')
+        ).order_by().values('document').annotate(count=Count('id')).values('count')
+        documents = Document.objects.defer('markdown').annotate(
+            preview=Left('markdown', 200),
+            chunk_count=Coalesce(Subquery(chunk_count), 0),
+        )
+        if include_chunks:
+            documents = documents.prefetch_related(Prefetch(
+                'chunks',
+                queryset=DocumentChunk.objects.only('id', 'document_id', 'chunk_text', 'chunk_index')
+            ))
+
+        paginator = DocumentCursorPagination()
+        page = paginator.paginate_queryset(documents, request, view=self)
+        data = []
+        for doc in page:
+            item = {
                 "id": doc.id,
-                "markdown": doc.markdown[:200],  # Truncate for brevity
+                "markdown": doc.preview,  # Truncated in SQL for brevity
                 "created_at": doc.created_at.isoformat(),
                 "updated_at": doc.updated_at.isoformat(),
-                "chunks": [
+                "chunk_count": doc.chunk_count,
+                "token_count": doc.token_count,
+            }
+            if include_chunks:
+                item["chunks"] = [
                     {
                         "id": chunk.id,
                         "chunk_text": chunk.chunk_text,
                         "chunk_index": chunk.chunk_index,
                     }
                     for chunk in doc.chunks.all()
-                ],
-                "token_count": sum(len(chunk.chunk_text.split()) for chunk in doc.chunks.all()),
-            }
-            for doc in documents
-        ]
-        return Response(data)
+                ]
+            if fields:
+                item = {key: item[key] for key in fields}
+            data.append(item)
+        return paginator.get_paginated_response(data)
 
 class SearchAPIView(APIView):
     def post(self, request):
@@ -154,42 +343,32 @@ class SearchAPIView(APIView):
             return Response({"error": "No query provided"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # Generate embedding for the search query
-            query_embedding = generate_embedding(query)
-            if not query_embedding:
-                logger.error("Failed to generate query embedding")
+            search_params = parse_search_params(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            # Embed the query once and search in-process (vector, hybrid or prefilter mode)
+            try:
+                model = active_model()
+                query_embedding, chunks = retrieve(query, model=model, **search_params)
+            except RuntimeError as e:
+                logger.error(f"Failed to generate query embedding: {str(e)}")
                 return Response({"error": "Failed to generate query embedding"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            results = [serialize_chunk(chunk) for chunk in chunks]
 
-            # Perform similarity search using pgvector's cosine distance
-            chunks = DocumentChunk.objects.annotate(
-                similarity=1 - CosineDistance('embedding', query_embedding)
-            ).filter(
-                similarity__gt=0.4
-            ).select_related('document').order_by('-similarity')[:15]
-
-            results = [
-                {
-                    "document_id": chunk.document.id,
-                    "document_name": f"Document {chunk.document.id}",
-                    "chunk_id": chunk.id,
-                    "chunk_text": chunk.chunk_text,
-                    "similarity": float(chunk.similarity),
-                }
-                for chunk in chunks
-            ]
-
-            # Enhance results with LLM if available
+            # Enhance results with LLM if available, reusing the answer to a
+            # near-identical question over the same chunks
             if results:
                 try:
-                    top_chunks = sorted(results[:5], key=lambda x: len(x["chunk_text"]), reverse=True)[:3]
-                    context = "\n\n".join([chunk["chunk_text"] for chunk in top_chunks])
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    synthesized_response = loop.run_until_complete(generate_response(query, context))
-                    loop.close()
+                    synthesized_response, cached = cached_answer(
+                        prompt_namespace('search', model=model), query_embedding, chunks,
+                        lambda: generate_response_sync(query, build_context(chunks)),
+                    )
                     return Response({
                         "results": results,
-                        "synthesized_response": synthesized_response
+                        "synthesized_response": synthesized_response,
+                        "cached": cached,
                     }, status=status.HTTP_200_OK)
                 except Exception as llm_error:
                     logger.error(f"LLM enhancement error: {str(llm_error)}")
@@ -205,6 +384,241 @@ class SearchAPIView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class BatchSearchView(APIView):
+    """
+    Search for many queries in one request.
+
+    All queries are embedded in one batch and, in vector mode, searched with
+    a single SQL statement. Answers are only synthesized for queries that ask
+    for it (``synthesize``), with the LLM calls made concurrently. The search
+    parameters of ``SearchAPIView`` apply to every query in the batch.
+    """
+
+    def post(self, request):
+        try:
+            queries = parse_batch_queries(request.data)
+            search_params = parse_search_params(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            chunk_lists = batch_retrieve([query for query, _ in queries], **search_params)
+        except RuntimeError as e:
+            logger.error(f"Failed to generate query embeddings: {str(e)}")
+            return Response({"error": "Failed to generate query embeddings"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except Exception as e:
+            logger.error(f"Batch search error: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        items = [
+            {"query": query, "results": [serialize_chunk(chunk) for chunk in chunks]}
+            for (query, _), chunks in zip(queries, chunk_lists)
+        ]
+        wanted = [index for index, (_, synthesize) in enumerate(queries) if synthesize and items[index]["results"]]
+        answers = generate_responses_sync([
+            (items[index]["query"], build_context(chunk_lists[index])) for index in wanted
+        ])
+        for index, answer in zip(wanted, answers):
+            if isinstance(answer, Exception):
+                logger.error(f"LLM enhancement error: {str(answer)}")
+                items[index]["warning"] = "Could not generate synthesized response"
+            else:
+                items[index]["synthesized_response"] = answer
+        return Response({"results": items}, status=status.HTTP_200_OK)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class SearchStreamView(APIView):
+    """
+    Server-sent events version of ``SearchAPIView``.
+
+    Emits a ``results`` event as soon as retrieval finishes, a ``token`` event
+    for each piece of the LLM answer as it arrives, and a final ``done`` event
+    with token usage and timings (or an ``error`` event).
+    """
+
+    def post(self, request):
+        query = request.data.get('query')
+        if not query:
+            logger.error("No query provided in request")
+            return Response({"error": "No query provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            search_params = parse_search_params(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(
+            self._events(query, search_params),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def _events(self, query, search_params):
+        started = time.perf_counter()
+        try:
+            _, chunks = retrieve(query, **search_params)
+        except Exception as e:
+            logger.error(f"Search error: {str(e)}")
+            yield _sse("error", {"error": str(e)})
+            return
+        results = [serialize_chunk(chunk) for chunk in chunks]
+        retrieval_ms = (time.perf_counter() - started) * 1000
+        yield _sse("results", {"results": results, "retrieval_ms": retrieval_ms})
+
+        timing = {"retrieval_ms": retrieval_ms}
+        usage = None
+        if results:
+            try:
+                for event in stream_response(query, build_context(chunks)):
+                    if event["type"] == "token":
+                        timing.setdefault("first_token_ms", (time.perf_counter() - started) * 1000)
+                        yield _sse("token", {"content": event["content"]})
+                    elif event["type"] == "usage":
+                        usage = event["usage"]
+            except Exception as llm_error:
+                logger.error(f"LLM streaming error: {str(llm_error)}")
+                yield _sse("error", {"error": "Could not generate synthesized response"})
+                return
+        timing["total_ms"] = (time.perf_counter() - started) * 1000
+        yield _sse("done", {"usage": usage, "timing": timing})
+
+
+def _json_body(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncDocumentUploadView(DjangoView):
+    """
+    Native async ``DocumentUploadView`` for ASGI deployments. The document
+    is ingested inline: embedded over the pooled async client and its chunks
+    written through the asyncpg pool.
+    """
+
+    async def post(self, request):
+        data = _json_body(request)
+        if data is None:
+            return JsonResponse({"errors": "Invalid JSON body"}, status=status.HTTP_400_BAD_REQUEST)
+        if 'markdown' not in data:
+            logger.error("No markdown provided in request")
+            return JsonResponse({"errors": "No markdown provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = DocumentSerializer(data=data)
+        if not serializer.is_valid():
+            logger.error(f"Serializer errors: {serializer.errors}")
+            return JsonResponse({"errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        document = await sync_to_async(serializer.save)()
+        try:
+            chunk_count = await aingest_document(document)
+        except Exception as e:
+            logger.error(f"Failed to process chunks for document {document.id}: {str(e)}")
+            await sync_to_async(document.delete)()
+            return JsonResponse(
+                {"errors": f"Failed to process chunks: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        logger.info(f"Document {document.id} uploaded successfully with {chunk_count} chunks")
+        return JsonResponse({"document_id": document.id}, status=status.HTTP_201_CREATED)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncSearchView(DjangoView):
+    """
+    Native async ``SearchAPIView`` for ASGI deployments.
+
+    Embedding and LLM calls go through pooled async clients, so a single
+    worker can keep many searches in flight while they wait on I/O.
+    """
+
+    async def post(self, request):
+        data = _json_body(request)
+        if data is None:
+            return JsonResponse({"error": "Invalid JSON body"}, status=status.HTTP_400_BAD_REQUEST)
+        query = data.get('query')
+        if not query:
+            logger.error("No query provided in request")
+            return JsonResponse({"error": "No query provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            search_params = parse_search_params(data)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            model = await sync_to_async(active_model)()
+            query_embedding, chunks = await aretrieve(query, model=model, **search_params)
+        except Exception as e:
+            logger.error(f"Search error: {str(e)}")
+            return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        results = [serialize_chunk(chunk) for chunk in chunks]
+        if not results:
+            return JsonResponse({"results": results})
+        try:
+            synthesized_response, cached = await acached_answer(
+                prompt_namespace('search', model=model), query_embedding, chunks,
+                lambda: generate_response(query, build_context(chunks)),
+            )
+        except Exception as llm_error:
+            logger.error(f"LLM enhancement error: {str(llm_error)}")
+            return JsonResponse({
+                "results": results,
+                "warning": "Could not generate synthesized response"
+            })
+        return JsonResponse({
+            "results": results,
+            "synthesized_response": synthesized_response,
+            "cached": cached,
+        })
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncRagSearchView(DjangoView):
+    """Native async ``rag_search`` for ASGI deployments."""
+
+    async def post(self, request):
+        data = _json_body(request)
+        if data is None:
+            return JsonResponse({"error": "Invalid JSON body"}, status=status.HTTP_400_BAD_REQUEST)
+        query = data.get('query')
+        if not query:
+            logger.error("No query provided in request")
+            return JsonResponse({"error": "Query is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            agent = await sync_to_async(_requested_agent)(data, query)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Agent.DoesNotExist:
+            return JsonResponse({"error": "Agent not found"}, status=status.HTTP_404_NOT_FOUND)
+        except RuntimeError as e:
+            logger.error(f"Failed to generate query embedding: {str(e)}")
+            return JsonResponse(
+                {"error": "Failed to generate query embedding"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        try:
+            synthesized_response, chunks = await aanswer_query(query, agent_prompt=agent.prompt if agent else None)
+        except Exception as e:
+            logger.error(f"Error in rag_search: {str(e)}")
+            return JsonResponse({"error": f"Failed to process request: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse({
+            "synthesized_response": synthesized_response,
+            "results": [serialize_chunk(chunk) for chunk in chunks],
+            **({"agent": serialize_agent_match(agent)} if agent else {}),
+        })
+
+
 class AgentListCreateView(APIView):
     def get(self, request):
         agents = Agent.objects.all()
@@ -227,3 +641,43 @@ class AgentListCreateView(APIView):
                 return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             return Response(AgentSerializer(agent).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AgentRouteView(APIView):
+    """Return the ``k`` agents whose prompts are closest to a query."""
+
+    def post(self, request):
+        query = request.data.get('query')
+        if not query:
+            return Response({"error": "No query provided"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            k = int(request.data.get('k', 1))
+        except (TypeError, ValueError):
+            return Response({"error": "k must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= k <= MAX_ROUTE_K:
+            return Response({"error": f"k must be between 1 and {MAX_ROUTE_K}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        started = time.perf_counter()
+        try:
+            query_embedding = generate_embedding(query, lane=LANE_INTERACTIVE)
+        except Exception as e:
+            logger.error(f"Failed to generate query embedding: {str(e)}")
+            return Response({"error": "Failed to generate query embedding"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        embedded = time.perf_counter()
+        agents = agent_router.route(query_embedding, k=k)
+        routed = time.perf_counter()
+        return Response({
+            "agents": [serialize_agent_match(agent) for agent in agents],
+            "timings": {
+                "embedding_ms": round((embedded - started) * 1000, 2),
+                "routing_ms": round((routed - embedded) * 1000, 3),
+            },
+        }, status=status.HTTP_200_OK)
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus text exposition of this worker process's metrics."""
+    if not metrics.METRICS_ENABLED:
+        return HttpResponse("Metrics are disabled\n", status=404, content_type='text/plain')
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -3,6 +3,11 @@ ASGI config for beckend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn beckend.asgi:application``) so the
+async search views (``search/async/``, ``rag_search/async/``) run natively on
+the event loop with pooled Ollama and xAI clients and the asyncpg pool
+(``DJANGO_SERVER_INTERFACE`` is set to ``asgi`` here, see settings).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +17,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'beckend.settings')
+os.environ.setdefault('DJANGO_SERVER_INTERFACE', 'asgi')
 
 application = get_asgi_application()
+
+from django.apps import apps  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+if settings.WARM_UP_ON_START:
+    apps.get_app_config('api').warm_up()
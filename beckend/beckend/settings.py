@@ -21,7 +21,11 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
-SECRET_KEY = load_dotenv('.env')
+# The only place .env is read: it populates os.environ before any app module
+# reads its variables (XAI_API_KEY, OLLAMA_EMBED_URL, ...), whatever the
+# working directory.
+load_dotenv(BASE_DIR / '.env')
+SECRET_KEY = os.environ.get('SECRET_KEY')
 if not SECRET_KEY:
     print("Error: SECRET_KEY not found in .env file.")
     sys.exit(1)
@@ -41,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'api',
     'rest_framework',
     'corsheaders',
@@ -58,6 +63,15 @@ MIDDLEWARE = [
 ]
 
 MIDDLEWARE.insert(0, 'corsheaders.middleware.CorsMiddleware')
+MIDDLEWARE.insert(1, 'api.middleware.ServerTimingMiddleware')
+
+# Stage timings in Server-Timing headers and the /metrics endpoint
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+
+# Build the lazily created LLM clients and chains (WARM_UP, see
+# ApiConfig.warm_up) when a WSGI/ASGI worker starts, so its first request does
+# not pay for them. Management commands never warm up.
+WARM_UP_ON_START = os.getenv('WARM_UP_ON_START', 'false').lower() in ('1', 'true', 'yes')
 
 ROOT_URLCONF = 'beckend.urls'
 
@@ -84,6 +98,11 @@ WSGI_APPLICATION = 'beckend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# How the project is served: beckend/asgi.py sets 'asgi' (uvicorn and other
+# ASGI servers: one long-lived event loop per worker); anything else, e.g.
+# manage.py runserver or a WSGI server, is 'wsgi'.
+SERVER_INTERFACE = os.getenv('DJANGO_SERVER_INTERFACE', 'wsgi')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -92,8 +111,20 @@ DATABASES = {
         'PASSWORD': 'password',  # Replace with your PostgreSQL password
         'HOST': '127.0.0.1',          # Replace with your database host (e.g., '127.0.0.1' or a remote host)
         'PORT': '32768',               # Default PostgreSQL port
+        # Under WSGI, keep connections open between requests instead of
+        # reconnecting for every search; a reused connection is checked before
+        # it is handed out. Django advises against persistent connections
+        # under ASGI, where the asyncpg pool below serves the async views.
+        'CONN_MAX_AGE': 0 if SERVER_INTERFACE == 'asgi' else 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+# asyncpg pool behind the native async views (see api/database.py). Only
+# used under ASGI: under WSGI each async view runs on a new, short-lived
+# event loop, so the async views go through the ORM instead.
+DB_POOL_ENABLED = SERVER_INTERFACE == 'asgi'
+DB_POOL_MIN_SIZE = 2
+DB_POOL_MAX_SIZE = 10
 
 
 # Password validation
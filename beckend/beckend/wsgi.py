@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'beckend.settings')
 
 application = get_wsgi_application()
+
+from django.apps import apps  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+if settings.WARM_UP_ON_START:
+    apps.get_app_config('api').warm_up()
@@ -1,4 +1,3 @@
-import { useEffect, useState } from "react";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card";
 import { Progress } from "@/components/ui/progress";
 import { useQuery } from "@tanstack/react-query";
@@ -6,24 +5,16 @@ import { FileText, Search } from "lucide-react";
 
 // Types
 interface DashboardStats {
-  totalDocuments: number;
-  totalChunks: number;
-  totalTokens: number;
-  recentDocuments: Document[];
-}
-
-interface Chunk {
-  id: number;
-  chunk_text: string;
-  chunk_index: number;
+  documents: number;
+  chunks: number;
+  tokens: number;
 }
 
 interface Document {
   id: number;
   markdown: string;
   created_at: string;
-  updated_at: string;
-  chunks: Chunk[];
+  chunk_count: number;
   token_count: number;
 }
 
@@ -36,45 +27,32 @@ const deriveDocumentName = (markdown: string): string => {
     : cleanText || "Untitled Document";
 };
 
+const fetchJson = async (path: string) => {
+  const baseUrl = import.meta.env.VITE_DJANGO_API_URL || "http://127.0.0.1:8000";
+  const response = await fetch(`${baseUrl}${path}`);
+  if (!response.ok) {
+    throw new Error("Failed to fetch dashboard data");
+  }
+  return response.json();
+};
+
 const Dashboard = () => {
-  const [stats, setStats] = useState<DashboardStats>({
-    totalDocuments: 0,
-    totalChunks: 0,
-    totalTokens: 0,
-    recentDocuments: [],
+  // Totals are aggregated by the server, so they cover every document
+  const { data: stats, isLoading: isLoadingStats } = useQuery<DashboardStats>({
+    queryKey: ["documentStats"],
+    queryFn: () => fetchJson("/document-stats/"),
   });
 
-  const { data: documents, isLoading } = useQuery({
-    queryKey: ["documents"],
+  // The listing is ordered newest first, so its first page holds the recent documents
+  const { data: recentDocuments, isLoading: isLoadingRecent } = useQuery<Document[]>({
+    queryKey: ["recentDocuments"],
     queryFn: async () => {
-      const baseUrl = import.meta.env.VITE_DJANGO_API_URL || "http://127.0.0.1:8000";
-      const response = await fetch(`${baseUrl}/list-documents/`);
-      if (!response.ok) {
-        throw new Error("Failed to fetch documents");
-      }
-      return response.json() as Promise<Document[]>;
+      const data = await fetchJson("/list-documents/?page_size=5&fields=id,markdown,created_at,chunk_count,token_count");
+      return data.documents;
     },
   });
 
-  useEffect(() => {
-    if (documents) {
-      const totalChunks = documents.reduce((acc, doc) => acc + doc.chunks.length, 0);
-      const totalTokens = documents.reduce((acc, doc) => acc + doc.token_count, 0);
-
-      setStats({
-        totalDocuments: documents.length,
-        totalChunks,
-        totalTokens,
-        recentDocuments: [...documents]
-          .sort((a, b) => new Date(b.created_at).getTime() - new Date(a.created_at).getTime())
-          .slice(0, 5)
-          .map(doc => ({
-            ...doc,
-            name: deriveDocumentName(doc.markdown), // Adiciona o nome derivado
-          })),
-      });
-    }
-  }, [documents]);
+  const isLoading = isLoadingStats || isLoadingRecent;
 
   if (isLoading) {
     return (
@@ -95,7 +73,7 @@ const Dashboard = () => {
           <FileText className="h-4 w-4 text-muted-foreground" />
         </CardHeader>
         <CardContent>
-          <div className="text-2xl font-bold">{stats.totalDocuments}</div>
+          <div className="text-2xl font-bold">{stats?.documents ?? 0}</div>
           <p className="text-xs text-muted-foreground">
             Processed documents in the system
           </p>
@@ -108,7 +86,7 @@ const Dashboard = () => {
           <Search className="h-4 w-4 text-muted-foreground" />
         </CardHeader>
         <CardContent>
-          <div className="text-2xl font-bold">{stats.totalChunks}</div>
+          <div className="text-2xl font-bold">{stats?.chunks ?? 0}</div>
           <p className="text-xs text-muted-foreground">
             Searchable text chunks created
           </p>
@@ -121,7 +99,7 @@ const Dashboard = () => {
           <FileText className="h-4 w-4 text-muted-foreground" />
         </CardHeader>
         <CardContent>
-          <div className="text-2xl font-bold">{stats.totalTokens}</div>
+          <div className="text-2xl font-bold">{stats?.tokens ?? 0}</div>
           <p className="text-xs text-muted-foreground">
             Tokens processed across all documents
           </p>
@@ -136,9 +114,9 @@ const Dashboard = () => {
           </CardDescription>
         </CardHeader>
         <CardContent>
-          {stats.recentDocuments.length > 0 ? (
+          {recentDocuments && recentDocuments.length > 0 ? (
             <div className="space-y-2">
-              {stats.recentDocuments.map((doc) => (
+              {recentDocuments.map((doc) => (
                 <div
                   key={doc.id}
                   className="flex items-center justify-between border-b pb-2"
@@ -146,9 +124,9 @@ const Dashboard = () => {
                   <div className="flex items-center">
                     <FileText className="h-4 w-4 mr-2 text-blue-500" />
                     <div>
-                      <span className="font-medium">{doc.name}</span>
+                      <span className="font-medium">{deriveDocumentName(doc.markdown)}</span>
                       <p className="text-xs text-muted-foreground">
-                        {doc.chunks.length} chunks, {doc.token_count} tokens
+                        {doc.chunk_count} chunks, {doc.token_count} tokens
                       </p>
                     </div>
                   </div>
@@ -21,10 +21,18 @@ interface Document {
   markdown: string;
   created_at: string;
   updated_at: string;
-  chunks: Chunk[];
+  chunk_count: number;
   token_count: number;
 }
 
+interface DocumentsPage {
+  next: string | null;
+  documents: Document[];
+}
+
+// Chunks are only fetched for the document being viewed
+const LIST_FIELDS = "id,markdown,created_at,updated_at,chunk_count,token_count";
+
 type SortField = "name" | "created_at" | "chunk_count" | "token_count";
 type SortDirection = "asc" | "desc";
 
@@ -37,6 +45,32 @@ const deriveDocumentName = (markdown: string): string => {
     : cleanText || "Untitled Document";
 };
 
+const fetchDocumentsPage = async (url: string, retries = 1): Promise<DocumentsPage> => {
+  const controller = new AbortController();
+  const timeoutId = setTimeout(() => controller.abort(), 30000);
+  try {
+    const response = await fetch(url, {
+      signal: controller.signal,
+      headers: { "Content-Type": "application/json" },
+    });
+    if (!response.ok) {
+      const errorText = await response.text();
+      console.error("API Error Response:", errorText);
+      throw new Error(`Failed to fetch documents: ${response.status} ${errorText}`);
+    }
+    return await response.json();
+  } catch (error) {
+    if (error.name === "AbortError" && retries > 0) {
+      console.log("Request timed out, retrying once...");
+      return fetchDocumentsPage(url, retries - 1);
+    }
+    console.error("Error fetching documents:", error);
+    throw error;
+  } finally {
+    clearTimeout(timeoutId);
+  }
+};
+
 const DocumentsList = () => {
   const [searchTerm, setSearchTerm] = useState("");
   const [selectedDocument, setSelectedDocument] = useState<Document | null>(null);
@@ -48,66 +82,30 @@ const DocumentsList = () => {
   const { data: documents, isLoading, isError, error } = useQuery<Document[]>({
     queryKey: ["documents"],
     queryFn: async () => {
-      try {
-        const baseUrl = import.meta.env.VITE_DJANGO_API_URL || "http://127.0.0.1:8000";
-        const url = `${baseUrl}/list-documents/`;
-        console.log("Fetching documents from:", url);
-
-        const controller = new AbortController();
-        const timeoutId = setTimeout(() => controller.abort(), 30000);
-
-        const response = await fetch(url, {
-          signal: controller.signal,
-          headers: { "Content-Type": "application/json" },
-        });
-        clearTimeout(timeoutId);
-
-        console.log("API Response Status:", response.status);
-        if (!response.ok) {
-          const errorText = await response.text();
-          console.error("API Error Response:", errorText);
-          throw new Error(`Failed to fetch documents: ${response.status} ${errorText}`);
-        }
-
-        const data = await response.json();
-        console.log("API Response Data:", data);
+      // The listing is cursor-paginated: follow `next` until every document is loaded
+      const baseUrl = import.meta.env.VITE_DJANGO_API_URL || "http://127.0.0.1:8000";
+      let url: string | null = `${baseUrl}/list-documents/?page_size=500&fields=${LIST_FIELDS}`;
+      const allDocuments: Document[] = [];
+      while (url) {
+        const data = await fetchDocumentsPage(url);
+        allDocuments.push(...data.documents);
+        url = data.next;
+      }
+      return allDocuments;
+    },
+  });
 
-        if (Array.isArray(data)) {
-          return data;
-        } else if (data && Array.isArray(data.documents)) {
-          return data.documents;
-        } else {
-          console.warn("Unexpected API response format:", data);
-          return [];
-        }
-      } catch (error) {
-        console.error("Error fetching documents:", error);
-        if (error.name === "AbortError") {
-          console.log("Request timed out, retrying once...");
-          try {
-            const baseUrl = import.meta.env.VITE_DJANGO_API_URL || "http://127.0.0.1:8000";
-            const response = await fetch(`${baseUrl}/list-documents/`);
-            console.log("Retry API Response Status:", response.status);
-            if (!response.ok) {
-              throw new Error("Failed to fetch documents on retry");
-            }
-            const data = await response.json();
-            console.log("Retry API Response Data:", data);
-            if (Array.isArray(data)) {
-              return data;
-            } else if (data && Array.isArray(data.documents)) {
-              return data.documents;
-            } else {
-              console.warn("Unexpected API response format on retry:", data);
-              return [];
-            }
-          } catch (retryError) {
-            console.error("Retry failed:", retryError);
-            throw retryError;
-          }
-        }
-        throw error;
+  const { data: selectedChunks, isLoading: isLoadingChunks } = useQuery<Chunk[]>({
+    queryKey: ["documentChunks", selectedDocument?.id],
+    enabled: !!selectedDocument,
+    queryFn: async () => {
+      const baseUrl = import.meta.env.VITE_DJANGO_API_URL || "http://127.0.0.1:8000";
+      const response = await fetch(`${baseUrl}/${selectedDocument!.id}/?expand=chunks`);
+      if (!response.ok) {
+        throw new Error(`Failed to fetch chunks: ${response.status}`);
       }
+      const data = await response.json();
+      return data.chunks as Chunk[];
     },
   });
 
@@ -131,7 +129,7 @@ const DocumentsList = () => {
             comparison = new Date(a.created_at).getTime() - new Date(b.created_at).getTime();
             break;
           case "chunk_count":
-            comparison = a.chunks.length - b.chunks.length;
+            comparison = a.chunk_count - b.chunk_count;
             break;
           case "token_count":
             comparison = a.token_count - b.token_count;
@@ -282,7 +280,7 @@ const DocumentsList = () => {
                         <TableCell>
                           {new Date(document.created_at).toLocaleDateString()}
                         </TableCell>
-                        <TableCell className="text-center">{document.chunks.length}</TableCell>
+                        <TableCell className="text-center">{document.chunk_count}</TableCell>
                         <TableCell className="text-center">{document.token_count}</TableCell>
                         <TableCell className="text-right space-x-1">
                           <Button
@@ -357,7 +355,7 @@ const DocumentsList = () => {
                 </div>
                 <div>
                   <h3 className="font-semibold mb-1">Number of Chunks</h3>
-                  <p>{selectedDocument.chunks.length}</p>
+                  <p>{selectedDocument.chunk_count}</p>
                 </div>
                 <div>
                   <h3 className="font-semibold mb-1">Total Tokens</h3>
@@ -373,8 +371,10 @@ const DocumentsList = () => {
               <div>
                 <h3 className="font-semibold mb-2">Chunk Previews</h3>
                 <div className="bg-secondary p-4 rounded-md text-sm max-h-64 overflow-y-auto">
-                  {selectedDocument.chunks.length > 0 ? (
-                    selectedDocument.chunks.map((chunk) => (
+                  {isLoadingChunks ? (
+                    <span className="text-muted-foreground italic">Loading chunks...</span>
+                  ) : selectedChunks && selectedChunks.length > 0 ? (
+                    selectedChunks.map((chunk) => (
                       <div key={chunk.id} className="mb-2">
                         <span className="font-medium">Chunk {chunk.chunk_index} (ID: {chunk.id}):</span>
                         <p className="mt-1 text-muted-foreground">